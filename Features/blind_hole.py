@@ -1,15 +1,14 @@
 import math
 import numpy as np
 import Utils.occ_utils as occ_utils
-import random
 from OCC.Core.BRepBuilderAPI import BRepBuilderAPI_MakeEdge, BRepBuilderAPI_MakeWire, BRepBuilderAPI_MakeFace
 from OCC.Core.gp import gp_Circ, gp_Ax2, gp_Pnt, gp_Dir
 from Features.machining_features import MachiningFeature
 
 
 class BlindHole(MachiningFeature):
-    def __init__(self, shape, label_map, min_len, clearance, feat_names):
-        super().__init__(shape, label_map, min_len, clearance, feat_names)
+    def __init__(self, shape, label_map, min_len, clearance, feat_names, rng=None):
+        super().__init__(shape, label_map, min_len, clearance, feat_names, rng)
         self.shifter_type = 4
         self.bound_type = 4
         self.depth_type = "blind"
@@ -26,7 +25,7 @@ class BlindHole(MachiningFeature):
         normal = np.cross(dir_w, dir_h)
 
         # radius = min(width / 2, height / 2)
-        radius = random.randint(5, 10)
+        radius = self.rng.randint(5, 10)
 
         center = (bound[0] + bound[1] + bound[2] + bound[3]) / 4
         # print(center)
@@ -1,15 +1,17 @@
-import random
-
 from OCC.Core.BRepFilletAPI import BRepFilletAPI_MakeChamfer
 
 import Utils.shape_factory as shape_factory
 import Utils.parameters as param
+import Utils.failures as failures
+import Utils.logs as logs
 from Features.machining_features import MachiningFeature
 
+logger = logs.get_logger(__name__)
+
 
 class Chamfer(MachiningFeature):
-    def __init__(self, shape, label_map, min_len, clearance, feat_names, edges):
-        super().__init__(shape, label_map, min_len, clearance, feat_names)
+    def __init__(self, shape, label_map, min_len, clearance, feat_names, edges, rng=None):
+        super().__init__(shape, label_map, min_len, clearance, feat_names, rng)
         self.shifter_type = None
         self.bound_type = None
         self.depth_type = None
@@ -17,18 +19,19 @@ class Chamfer(MachiningFeature):
         self.edges = edges
 
     def add_feature(self):
+        shape = None
         while True:
             chamfer_maker = BRepFilletAPI_MakeChamfer(self.shape)
 
             # random choose a edge to make chamfer
             try:
-                edge = random.choice(self.edges)
+                edge = self.rng.choice(self.edges)
             except IndexError:
-                print("No more edges")
+                logger.debug('No more edges')
                 break
 
             try:
-                depth = random.uniform(param.chamfer_depth_min, param.chamfer_depth_max)
+                depth = self.rng.uniform(param.chamfer_depth_min, param.chamfer_depth_max)
                 
                 chamfer_maker.Add(depth, edge)
                 shape = chamfer_maker.Shape()
@@ -47,6 +50,10 @@ class Chamfer(MachiningFeature):
                     self.edges.remove(edge)
                     continue
 
+        if shape is None:
+            failures.note(failures.NO_EDGES, self.feat_type)
+            return self.shape, self.labels, self.edges
+
         try:
             fmap = shape_factory.map_face_before_and_after_feat(self.shape, chamfer_maker)
             labels = shape_factory.map_from_shape_and_name(fmap, self.labels,
@@ -54,5 +61,6 @@ class Chamfer(MachiningFeature):
                                                            None)
 
             return shape, labels, self.edges
-        except:
+        except Exception as e:
+            failures.note(failures.FEATURE_ERROR, self.feat_type, e)
             return self.shape, self.labels, self.edges
\ No newline at end of file
@@ -1,5 +1,6 @@
 import numpy as np
 import Utils.occ_utils as occ_utils
+import Utils.logs as logs
 
 from OCC.Core.BRepBuilderAPI import BRepBuilderAPI_MakeEdge, BRepBuilderAPI_MakeWire, BRepBuilderAPI_MakeFace
 from OCC.Core.gp import gp_Circ, gp_Ax2, gp_Pnt, gp_Dir
@@ -7,10 +8,12 @@ from OCC.Core.GC import GC_MakeSegment, GC_MakeArcOfCircle
 
 from Features.machining_features import MachiningFeature
 
+logger = logs.get_logger(__name__)
+
 
 class CircularThroughSlot(MachiningFeature):
-    def __init__(self, shape, label_map, min_len, clearance, feat_names):
-        super().__init__(shape, label_map, min_len, clearance, feat_names)
+    def __init__(self, shape, label_map, min_len, clearance, feat_names, rng=None):
+        super().__init__(shape, label_map, min_len, clearance, feat_names, rng)
         self.shifter_type = 1
         self.bound_type = 1
         self.depth_type = "through"
@@ -43,6 +46,6 @@ class CircularThroughSlot(MachiningFeature):
         try:
             face_maker = BRepBuilderAPI_MakeFace(wire_maker.Wire())
         except RuntimeError as error:
-            print(error)
+            logger.debug('%s: %s', self.feat_type, error)
             return None
         return face_maker.Face()
\ No newline at end of file
@@ -9,8 +9,8 @@ from Features.machining_features import MachiningFeature
 
 
 class HCircularEndBlindSlot(MachiningFeature):
-    def __init__(self, shape, label_map, min_len, clearance, feat_names):
-        super().__init__(shape, label_map, min_len, clearance, feat_names)
+    def __init__(self, shape, label_map, min_len, clearance, feat_names, rng=None):
+        super().__init__(shape, label_map, min_len, clearance, feat_names, rng)
         self.shifter_type = 1
         self.bound_type = 1
         self.depth_type = "blind"
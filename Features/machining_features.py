@@ -13,6 +13,10 @@ import Utils.geom_utils_numba as geom_utils_nb
 import Utils.shape_factory as shape_factory
 import Utils.parameters as param
 import Utils.numba_vec as nbv
+import Utils.timing as timing
+import Utils.mesh_manager as mesh_manager
+import Utils.failures as failures
+import Utils.logs as logs
 from OCC.Extend.DataExchange import read_step_file, STEPControl_Reader
 import OCCUtils.edge
 import OCCUtils.face
@@ -30,9 +34,14 @@ from OCC.Core.TopoDS import topods_Face
 from OCC.Core.GeomAbs import GeomAbs_Plane
 from OCC.Core.BRepAdaptor import BRepAdaptor_Surface
 
+logger = logs.get_logger(__name__)
+
+
 class MachiningFeature:
-    def __init__(self, shape, label_map, min_len, clearance, feat_names):
+    def __init__(self, shape, label_map, min_len, clearance, feat_names, rng=None):
         self.shape = shape
+        # random.Random of the sample, the global random module when not given
+        self.rng = random if rng is None else rng
         self.min_len = min_len
         self.clearance = clearance
         self.bounds = []
@@ -54,29 +63,29 @@ class MachiningFeature:
         elif self.bound_type == 4:
             self._bound_inner()
         else:
-            print(f"Bound type of {self.bound_type} does not exist.")
+            logger.error('Bound type of %s does not exist.', self.bound_type)
 
-    def _get_depth(self, bound, triangles):
+    def _get_depth(self, bound, scene):
         """Selects appropiate method for finding depth of feature.
 
         :param bound:
-        :param triangles:
+        :param scene: BVH of the shape triangles
         :return:
         """
         if self.depth_type == "through":
             return self._depth_through()
         elif self.depth_type == "blind":
-            return self._depth_blind(bound, triangles)
+            return self._depth_blind(bound, scene)
         else:
-            print(f"Depth type of {self.depth_type} does not exist.")
+            logger.error('Depth type of %s does not exist.', self.depth_type)
 
-    def _depth_blind(self, bound, triangles):
+    def _depth_blind(self, bound, scene):
         """Selects depth of blind feature.
 
         Find bounds of blind depth and randomly selects the depth.
 
         :param bound:
-        :param triangles:
+        :param scene: BVH of the shape triangles
         :return: depth of blind machining feature
         """
         thres = self.min_len + self.clearance
@@ -84,8 +93,7 @@ class MachiningFeature:
         self.points = geom_utils.points_inside_rect(bound[0], bound[1], bound[2], bound[3], 0.2)
 
         for pnt in self.points:
-            triangles = np.array(triangles, dtype=np.float64)
-            dpt = geom_utils_nb.ray_triangle_set_intersect(pnt, bound[4], triangles)
+            dpt = scene.closest_hit(pnt, bound[4])
             if dpt < 0.0:
                 continue
             if dpt + 1e-6 < thres:
@@ -100,7 +108,7 @@ class MachiningFeature:
         if d_min < 0:
             return np.NINF
 
-        return random.uniform(self.min_len, d_min - self.clearance)
+        return self.rng.uniform(self.min_len, d_min - self.clearance)
 
     def _depth_through(self):
         depth = max([param.stock_dim_x, param.stock_dim_y, param.stock_dim_z])
@@ -114,18 +122,18 @@ class MachiningFeature:
         dir_w = dir_w / old_w
         dir_h = dir_h / old_h
 
-        scale_w = random.uniform(0.1, 1.0)
-        scale_h = random.uniform(0.1, 1.0)
+        scale_w = self.rng.uniform(0.1, 1.0)
+        scale_h = self.rng.uniform(0.1, 1.0)
         new_w = max(param.min_len, old_w * scale_w)
         new_h = max(param.min_len, old_h * scale_h)
 
         if self.shifter_type == 1:
-            offset_w = random.uniform(0.0, old_w - new_w)
+            offset_w = self.rng.uniform(0.0, old_w - new_w)
             max_bound[1] = max_bound[1] + offset_w * dir_w
 
         if self.shifter_type == 4:
-            offset_w = random.uniform(0.0, old_w - new_w)
-            offset_h = random.uniform(0.0, old_h - new_h)
+            offset_w = self.rng.uniform(0.0, old_w - new_w)
+            offset_h = self.rng.uniform(0.0, old_h - new_h)
             max_bound[1] = max_bound[1] + offset_w * dir_w + offset_h * dir_h
 
         max_bound[0] = max_bound[1] + new_h * dir_h
@@ -146,19 +154,19 @@ class MachiningFeature:
         dir_w = nbv.div(old_w, dir_w)
         dir_h = nbv.div(old_h, dir_h)
 
-        scale_w = random.uniform(0.1, 1.0)
-        scale_h = random.uniform(0.1, 1.0)
+        scale_w = self.rng.uniform(0.1, 1.0)
+        scale_h = self.rng.uniform(0.1, 1.0)
         new_w = max(param.min_len, old_w * scale_w)
         new_h = max(param.min_len, old_h * scale_h)
 
         if self.shifter_type == 1:
-            offset_w = random.uniform(0.0, old_w - new_w)
+            offset_w = self.rng.uniform(0.0, old_w - new_w)
             new_dir_w = nbv.mul(offset_w, dir_w)
             bounds_max[1] = nbv.add(bounds_max[1], new_dir_w)
 
         if self.shifter_type == 4:
-            offset_w = random.uniform(0.0, old_w - new_w)
-            offset_h = random.uniform(0.0, old_h - new_h)
+            offset_w = self.rng.uniform(0.0, old_w - new_w)
+            offset_h = self.rng.uniform(0.0, old_h - new_h)
             new_dir_w = nbv.mul(offset_w, dir_w)
             new_dir_h = nbv.mul(offset_h, dir_h)
             bounds_max[1] = nbv.add(nbv.add(bounds_max[1], new_dir_w), new_dir_h)
@@ -177,51 +185,12 @@ class MachiningFeature:
         return bounds_max
 
     def _triangulation_from_face(self, face):
-        aLoc = TopLoc_Location()
-        aTriangulation = BRep_Tool().Triangulation(face, aLoc)
-        aTrsf = aLoc.Transformation()
-
-        aNodes = aTriangulation.Nodes()
-        aTriangles = aTriangulation.Triangles()
-
-        pts = []
-        for i in range(1, aTriangulation.NbNodes() + 1):
-            pt = aNodes.Value(i)
-            pt.Transform(aTrsf)
-            pts.append([pt.X(), pt.Y(), pt.Z()])
-
-        triangles = []
-        vt_map = {}
-        et_map = {}
-        for i in range(1, aTriangulation.NbTriangles() + 1):
-            n1, n2, n3 = aTriangles.Value(i).Get()
-            pids = [n1 - 1, n2 - 1, n3 - 1]
-            pids.sort()
-            triangles.append((pids[0], pids[1], pids[2]))
-
-            for pid in pids:
-                if pid in vt_map:
-                    vt_map[pid].append(i - 1)
-                else:
-                    vt_map[pid] = [i - 1]
-
-            edges = [(pids[0], pids[1]), (pids[0], pids[2]), (pids[1], pids[2])]
-            for edge in edges:
-                if edge in et_map:
-                    et_map[edge].append(i - 1)
-                else:
-                    et_map[edge] = [i - 1]
-
-        return pts, triangles, vt_map, et_map
-
-    def _triangles_from_faces(self, faces):
-        tri_list = []
-        for face in faces:
-            pts, triangles, vt_map, et_map = self._triangulation_from_face(face)
-            for tri in triangles:
-                tri_list.append((pts[tri[0]], pts[tri[1]], pts[tri[2]]))
+        # cached per face for the sample, the result is shared and must not be modified
+        return mesh_manager.get_manager().triangulation(face)
 
-        return tri_list
+    def _triangle_cache(self):
+        # ray query triangles of the current shape, shared by the bound searches and depth queries
+        return mesh_manager.get_manager().triangle_cache(self.shape)
 
     def _rect_size(self, rect):
         dir_w = nbv.sub(rect[1], rect[2])
@@ -304,25 +273,18 @@ class MachiningFeature:
 
     def _sample_points_inside_face(self, face):
         tri_pnts, triangles, _, et_map = self._triangulation_from_face(face)
-        sample_points = []
 
         # sketch on 3 edges
-        for edge in et_map:
-            if len(et_map[edge]) > 1:
-                pt1 = np.asarray(tri_pnts[edge[0]])
-                pt2 = np.asarray(tri_pnts[edge[1]])
-                e_dir = nbv.sub(pt2, pt1)
-                e_len = nbv.calc_l2_norm(e_dir)
-
-                if e_len < self.min_len + 2 * self.clearance:
-                    continue
-
-                sample_points.append((0.5 * pt1 + 0.5 * pt2).tolist())
+        inner_edges = et_map.keys[et_map.counts() > 1]
+        pt1 = tri_pnts[inner_edges[:, 0]]
+        pt2 = tri_pnts[inner_edges[:, 1]]
+        e_len = np.linalg.norm(pt2 - pt1, axis=1)
+        sample_points = (0.5 * pt1 + 0.5 * pt2)[e_len >= self.min_len + 2 * self.clearance].tolist()
 
         for tri in triangles:
-            pt1 = np.asarray(tri_pnts[tri[0]])
-            pt2 = np.asarray(tri_pnts[tri[1]])
-            pt3 = np.asarray(tri_pnts[tri[2]])
+            pt1 = tri_pnts[tri[0]]
+            pt2 = tri_pnts[tri[1]]
+            pt3 = tri_pnts[tri[2]]
             if geom_utils_nb.outer_radius_triangle(pt1, pt2, pt3) < self.min_len + 2 * self.clearance:
                 continue
 
@@ -383,12 +345,8 @@ class MachiningFeature:
                 continue
 
             pts, triangles, vt_map, et_map = self._triangulation_from_face(face)
-            segs = []
-            for et in et_map:
-                # Ensure the facet edge is on the context edge of the BRep face
-                if len(et_map[et]) == 1:
-                    segs.append([pts[et[0]], pts[et[1]]])
-            pts = np.asarray(pts)
+            # Ensure the facet edge is on the context edge of the BRep face
+            segs = pts[et_map.keys[et_map.counts() == 1]]
             normal = np.array(occ_utils.as_list(occ_utils.normal_to_face_center(face)))
 
             pnt1 = np.array(occ_utils.as_list(topexp.FirstVertex(edge, True)))
@@ -414,7 +372,6 @@ class MachiningFeature:
             sample_pnts = [pnt1 + t * param.min_len * edge_unit_dir for t in range(num_sample)]
             sample_pnts.append(pnt2)
             sample_pnts = np.array(sample_pnts, dtype=np.float64)
-            segs = np.array(segs, dtype=np.float64)
 
             inter_pnts = []
 
@@ -526,7 +483,6 @@ class MachiningFeature:
                 continue
 
             pts, triangles, vt_map, et_map = self._triangulation_from_face(face)
-            pts = np.asarray(pts)
 
             vec0 = nbv.sub(pnt1, pnt0)
             vec2 = nbv.sub(pnt1, pnt2)
@@ -560,7 +516,6 @@ class MachiningFeature:
                 continue
 
             pts, triangles, vt_map, et_map = self._triangulation_from_face(face)
-            pts = np.asarray(pts)
 
             v0 = np.array(occ_utils.as_list(topexp.FirstVertex(edge1, True)))
             v1 = np.array(occ_utils.as_list(topexp.FirstVertex(edge2, True)))
@@ -591,23 +546,11 @@ class MachiningFeature:
 
         points = np.array((bound[0], bound[1], bound[2], bound[3], centroid))
 
-        for face in faces:
-            tri_list = []
-            pts, triangles, vt_map, et_map = self._triangulation_from_face(face)
-
-            for tri in triangles:
-                tri_list.append((pts[tri[0]], pts[tri[1]], pts[tri[2]]))
-
-            for pnt in points:
-                tri_array = np.array(tri_list, dtype=np.float64)
-                dpt = geom_utils_nb.ray_triangle_set_intersect(pnt, normal, tri_array)
-
-                if dpt != np.NINF:
-                    intersect = True
-                    continue
-
-            if intersect:
-                continue
+        scene = self._triangle_cache().bvh(faces)
+        for pnt in points:
+            if scene.any_hit(pnt, normal):
+                intersect = True
+                break
 
         return intersect
 
@@ -645,12 +588,17 @@ class MachiningFeature:
         return None
 
     def _apply_feature(self, old_shape, old_labels, feat_type, feat_face,depth_dir, bound_max):
-        feature_maker = BRepFeat_MakePrism()
-        feature_maker.Init(old_shape, feat_face, TopoDS_Face(), occ_utils.as_occ(depth_dir, gp_Dir), False, False)
-        feature_maker.Build()
+        with timing.stage('prism'):
+            feature_maker = BRepFeat_MakePrism()
+            try:
+                feature_maker.Init(old_shape, feat_face, TopoDS_Face(), occ_utils.as_occ(depth_dir, gp_Dir),
+                                   False, False)
+                feature_maker.Build()
 
-        feature_maker.Perform(np.linalg.norm(depth_dir))
-        shape = feature_maker.Shape()
+                feature_maker.Perform(np.linalg.norm(depth_dir))
+                shape = feature_maker.Shape()
+            except Exception as e:
+                raise failures.GenerationFailure(failures.PRISM_FAILED, feat_type, e)
 
 
         # find map map between modified faces on old shape and new generated faces
@@ -674,12 +622,17 @@ class MachiningFeature:
     # shape, labels = self._apply_feature(self.shape, self.labels, self.feat_type, feat_face,feat_dir * depth, bound_max)
 
     def _apply_hole_feature(self, old_shape, old_labels, feat_type, feat_face, depth_dir, bound_max):
-        feature_maker = BRepFeat_MakePrism()
-        feature_maker.Init(old_shape, feat_face, TopoDS_Face(), occ_utils.as_occ(depth_dir, gp_Dir), False, False)
-        feature_maker.Build()
+        with timing.stage('prism'):
+            feature_maker = BRepFeat_MakePrism()
+            try:
+                feature_maker.Init(old_shape, feat_face, TopoDS_Face(), occ_utils.as_occ(depth_dir, gp_Dir),
+                                   False, False)
+                feature_maker.Build()
 
-        feature_maker.Perform(np.linalg.norm(depth_dir))
-        shape = feature_maker.Shape()
+                feature_maker.Perform(np.linalg.norm(depth_dir))
+                shape = feature_maker.Shape()
+            except Exception as e:
+                raise failures.GenerationFailure(failures.PRISM_FAILED, feat_type, e)
 
 
 
@@ -740,19 +693,22 @@ class MachiningFeature:
         
         try:
             if find_bounds is True:
-                self._get_bounds()
+                with timing.stage('bounds'):
+                    self._get_bounds()
             else:
                 self.bounds = bounds
 
             if len(self.bounds) < 1:
+                failures.note(failures.NO_BOUNDS, self.feat_type)
                 return self.shape, self.labels, self.bounds
 
             feat_face = None
-            faces = occ_utils.list_face(self.shape)
-            triangles = self._triangles_from_faces(faces)
+            with timing.stage('triangles'):
+                scene = self._triangle_cache().bvh()
 
-            random.shuffle(self.bounds)
+            self.rng.shuffle(self.bounds)
             depth = np.NINF
+            depth_found = False
 
             try_cnt = 0
             while try_cnt < len(self.bounds):
@@ -764,34 +720,41 @@ class MachiningFeature:
                             N_BOUND.append(self.bounds[s])
                         else:
                             continue                
-                    bound_max2 = random.choice(N_BOUND)
-                    depth2 = self._get_depth(bound_max2, triangles)
+                    bound_max2 = self.rng.choice(N_BOUND)
+                    with timing.stage('depth'):
+                        depth2 = self._get_depth(bound_max2, scene)
 
                     if depth2 <= 0 :
                         try_cnt += 1
                         continue
 
-                bound_max1 = random.choice(self.bounds)
-                depth1 = self._get_depth(bound_max1, triangles)
+                bound_max1 = self.rng.choice(self.bounds)
+                with timing.stage('depth'):
+                    depth1 = self._get_depth(bound_max1, scene)
 
 
                 if depth1 <= 0 :
                     try_cnt += 1
                     continue
+                depth_found = True
             
-                if self.feat_type == 'through_hole' :
-                    
-                    feat_face,shape1, info= self._add_sketch(bound_max2)
+                with timing.stage('sketch'):
+                    if self.feat_type == 'through_hole' :
 
-                else:
-                    feat_face = self._add_sketch(bound_max1)
+                        feat_face,shape1, info= self._add_sketch(bound_max2)
+
+                    else:
+                        feat_face = self._add_sketch(bound_max1)
                 try_cnt = len(self.bounds)
 
         except Exception as e:
-            print(e)
+            logger.warning('%s: %s', self.feat_type, e)
+            failures.note(failures.FEATURE_ERROR, self.feat_type, e)
             return self.shape, self.labels, bounds
 
         if feat_face is None:
+            # the loop only reaches a sketch with a feasible depth
+            failures.note(failures.SKETCH_FAILED if depth_found else failures.DEPTH_INFEASIBLE, self.feat_type)
             return self.shape, self.labels, bounds
         
 
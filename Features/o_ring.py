@@ -1,4 +1,3 @@
-import random
 import math
 import numpy as np
 
@@ -10,8 +9,8 @@ from Features.machining_features import MachiningFeature
 
 
 class ORing(MachiningFeature):
-    def __init__(self, shape, label_map, min_len, clearance, feat_names):
-        super().__init__(shape, label_map, min_len, clearance, feat_names)
+    def __init__(self, shape, label_map, min_len, clearance, feat_names, rng=None):
+        super().__init__(shape, label_map, min_len, clearance, feat_names, rng)
         self.shifter_type = 4
         self.bound_type = 4
         self.depth_type = "blind"
@@ -30,7 +29,7 @@ class ORing(MachiningFeature):
         outer_r = min(width / 2, height / 2)
         center = (bound[0] + bound[1] + bound[2] + bound[3]) / 4
 
-        inner_r = random.uniform(outer_r / 3, outer_r - 0.2)
+        inner_r = self.rng.uniform(outer_r / 3, outer_r - 0.2)
 
         circ = gp_Circ(gp_Ax2(gp_Pnt(center[0], center[1], center[2]), normal), outer_r)
         edge = BRepBuilderAPI_MakeEdge(circ, 0., 2 * math.pi).Edge()
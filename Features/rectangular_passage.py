@@ -3,8 +3,8 @@ from Features.machining_features import MachiningFeature
 
 
 class RectangularPassage(MachiningFeature):
-    def __init__(self, shape, label_map, min_len, clearance, feat_names):
-        super().__init__(shape, label_map, min_len, clearance, feat_names)
+    def __init__(self, shape, label_map, min_len, clearance, feat_names, rng=None):
+        super().__init__(shape, label_map, min_len, clearance, feat_names, rng)
         self.shifter_type = 4
         self.bound_type = 4
         self.depth_type = "through"
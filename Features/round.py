@@ -1,11 +1,10 @@
-import random
-
 from OCC.Core.BRepFilletAPI import BRepFilletAPI_MakeFillet
 from OCC.Core.GProp import GProp_GProps
 from OCC.Core._BRepGProp import brepgprop_SurfaceProperties
 
 import Utils.shape_factory as shape_factory
 import Utils.parameters as param
+import Utils.failures as failures
 from Features.machining_features import MachiningFeature
 
 import OCCUtils.edge
@@ -20,8 +19,8 @@ def ask_surface_area(f):
 
 
 class Round(MachiningFeature):
-    def __init__(self, shape, label_map, min_len, clearance, feat_names, edges):
-        super().__init__(shape, label_map, min_len, clearance, feat_names)
+    def __init__(self, shape, label_map, min_len, clearance, feat_names, edges, rng=None):
+        super().__init__(shape, label_map, min_len, clearance, feat_names, rng)
         self.shifter_type = None
         self.bound_type = None
         self.depth_type = None
@@ -39,15 +38,16 @@ class Round(MachiningFeature):
 
         self.edges = new_edges
 
+        shape = None
         while len(self.edges) > 0:
-            edge = random.choice(self.edges)
+            edge = self.rng.choice(self.edges)
             e_util = OCCUtils.edge.Edge(edge)
             max_radius = e_util.length() / 10
 
             if max_radius > param.round_radius_max:
                 max_radius = param.round_radius_max
 
-            radius = random.uniform(param.round_radius_min, max_radius)
+            radius = self.rng.uniform(param.round_radius_min, max_radius)
 
             try:
                 fillet_maker.Add(radius, edge)
@@ -59,6 +59,10 @@ class Round(MachiningFeature):
                 self.edges.remove(edge)
                 continue
 
+        if shape is None:
+            failures.note(failures.NO_EDGES, self.feat_type)
+            return self.shape, self.labels, self.edges
+
         try:
             fmap = shape_factory.map_face_before_and_after_feat(self.shape, fillet_maker)
             labels = shape_factory.map_from_shape_and_name(fmap, self.labels,
@@ -67,5 +71,6 @@ class Round(MachiningFeature):
 
             return shape, labels, self.edges
 
-        except:
+        except Exception as e:
+            failures.note(failures.FEATURE_ERROR, self.feat_type, e)
             return self.shape, self.labels, self.edges
\ No newline at end of file
@@ -1,4 +1,3 @@
-import random
 import math
 import numpy as np
 import Utils.occ_utils as occ_utils
@@ -9,8 +8,8 @@ from Features.machining_features import MachiningFeature
 
 
 class SixSidesPassage(MachiningFeature):
-    def __init__(self, shape, label_map, min_len, clearance, feat_names):
-        super().__init__(shape, label_map, min_len, clearance, feat_names)
+    def __init__(self, shape, label_map, min_len, clearance, feat_names, rng=None):
+        super().__init__(shape, label_map, min_len, clearance, feat_names, rng)
         self.shifter_type = 4
         self.bound_type = 4
         self.depth_type = "through"
@@ -32,7 +31,7 @@ class SixSidesPassage(MachiningFeature):
 
         circ = Geom_Circle(gp_Ax2(gp_Pnt(center[0], center[1], center[2]), normal), radius)
 
-        ang1 = random.uniform(0.0, math.pi / 3)
+        ang1 = self.rng.uniform(0.0, math.pi / 3)
         pt1 = occ_utils.as_list(circ.Value(ang1))
 
         ang2 = ang1 + math.pi / 3
@@ -1,12 +1,11 @@
-import random
 import Utils.occ_utils as occ_utils
 
 from Features.machining_features import MachiningFeature
 
 
 class SlantedThroughStep(MachiningFeature):
-    def __init__(self, shape, label_map, min_len, clearance, feat_names):
-        super().__init__(shape, label_map, min_len, clearance, feat_names)
+    def __init__(self, shape, label_map, min_len, clearance, feat_names, rng=None):
+        super().__init__(shape, label_map, min_len, clearance, feat_names, rng)
         self.shifter_type = 3
         self.bound_type = 3
         self.depth_type = "blind"
@@ -17,8 +16,8 @@ class SlantedThroughStep(MachiningFeature):
     #     dir_r = bound[3] - bound[2]
 
     #     mark = [0, 1]
-    #     random.shuffle(mark)
-    #     ratio = random.uniform(0.3, 0.6)
+    #     self.rng.shuffle(mark)
+    #     ratio = self.rng.uniform(0.3, 0.6)
     #     pt0 = bound[0] - dir_l * mark[0] * ratio
     #     pt1 = bound[1]
     #     pt2 = bound[2]
@@ -1,4 +1,3 @@
-import random
 import math
 import numpy as np
 from OCC.Core.BRepPrimAPI import BRepPrimAPI_MakePrism
@@ -6,6 +5,8 @@ from OCC.Core.BRepBuilderAPI import BRepBuilderAPI_MakeEdge, BRepBuilderAPI_Make
 from OCC.Core.gp import gp_Circ, gp_Ax2, gp_Pnt, gp_Dir
 from OCC.Core.BRepBuilderAPI import BRepBuilderAPI_MakeVertex
 import Utils.occ_utils as occ_utils
+import Utils.fastener_catalog as fastener_catalog
+import Utils.failures as failures
 from Features.machining_features import MachiningFeature
 from OCC.Core.GProp import GProp_GProps
 from OCC.Core.BRepGProp import brepgprop_SurfaceProperties
@@ -18,14 +19,35 @@ def write_step_wth_prediction(filename, shape):
     writer.Write(filename)
 
 class ThroughHole(MachiningFeature):
-    def __init__(self, shape, label_map, min_len, clearance, feat_names):
-        super().__init__(shape, label_map, min_len, clearance, feat_names)
+    def __init__(self, shape, label_map, min_len, clearance, feat_names, rng=None):
+        super().__init__(shape, label_map, min_len, clearance, feat_names, rng)
         self.shifter_type = 4
         self.bound_type = 4
         self.depth_type = "through"
         self.feat_type = "through_hole"
 
+    def add_feature(self, bounds, dim, N_Choice, find_bounds=True):
+        """Adds a through hole, returns (shape, labels, bounds, info, sn) with sn None when no hole was cut."""
+        result = super().add_feature(bounds, dim, N_Choice, find_bounds=find_bounds)
+        if len(result) == 3:
+            # not applied, no fastener to place
+            return result + (None, None)
 
+        return result
+
+    def _get_bounds(self):
+        super()._get_bounds()
+
+        if len(self.bounds) == 0:
+            return
+
+        # drop bounds too small for any fastener before sketching on them
+        bounds = np.array([bound[:4] for bound in self.bounds], dtype=np.float64)
+        width = np.linalg.norm(bounds[:, 2] - bounds[:, 1], axis=1)
+        height = np.linalg.norm(bounds[:, 0] - bounds[:, 1], axis=1)
+        radius = np.minimum(width, height) / 2
+        keep = radius >= fastener_catalog.load_catalog().min_shank_radius()
+        self.bounds = [bound for bound, k in zip(self.bounds, keep) if k]
 
     def _add_sketch(self, bound):
         dir_w = bound[2] - bound[1]
@@ -42,94 +64,18 @@ class ThroughHole(MachiningFeature):
         info = center.tolist()
     
 
-        # my_list = [1,2,3,5,7,14,16]
-        my_list = [26,27,28,29,30,31,32,33,34,35,36,37,38,39,40,41]
-        rv = random.choice(my_list) 
-
-        if rv == 26:
-            luo_rad = (-131.62278992, 499.21603534, 213.33373081 )
-            r = 6
-            d_r = 13
-        elif rv == 27:
-            luo_rad = (-163.21153959, 490.62807964, 136.70991570 )
-            r = 5
-            d_r = 12.5
-            len = 34
-        elif rv == 28:
-            luo_rad = (-428.00000000, 512.00000000, -59.70000000 )
-            r = 8
-            d_r = 18
-            len = 156
-        elif rv == 29:
-            luo_rad = ( -15.09890165, -640.26377459, 142.65431662  )
-            r = 6
-            d_r = 12
-            len = 60
-        elif rv == 30:
-            luo_rad = ( 455.99775616, -705.00777231, 321.38351909 )
-            r = 4
-            d_r = 12
-            len = 625
-
-        elif rv == 31:
-            luo_rad = (-499.93484604, 517.14755762, -104.46571084)
-            r = 5
-            d_r = 11
-        elif rv == 32:
-            luo_rad = (-763.86725194, 378.50264480, 96.99999998)
-            r = 4
-            d_r = 10
-        elif rv == 33:
-            luo_rad = ( -23.84879311, -494.30586595, 480.14758457 )
-            r = 6
-            d_r = 9.5
-            len = 38
-        elif rv == 34:
-            luo_rad = ( 39.34800000, -800.00000000, -119.90000000 )
-            r = 8
-            d_r = 15
-            len = 85
-        elif rv == 35:
-            luo_rad = ( -76.61909011, -678.15875122, -86.78030803 )
-            r = 7
-            d_r = 15
-            len = 150
-        elif rv == 36:
-            luo_rad = (2787.58864995, -719.89579363, 52.26333220 ) 
-            r = 6.5
-            d_r = 14
-            len = 115
-
-        elif rv == 37:
-            luo_rad = (2692.49611450, -709.97719250, 61.39517525 )
-            r = 7
-            d_r = 11
-            len = 99
-
-        elif rv == 38:
-            luo_rad = ( 2777.11290819, -731.81018061, -163.99336632 )
-            r = 7
-            d_r = 24.5
-            len = 91
-
-        elif rv == 39:
-            luo_rad = (2723.24266961, -570.57599206, 127.71953981 )
-            r = 3
-            d_r = 6.8
-            len = 20
-        
-        elif rv == 40:
-            luo_rad = ( 2720.70000000, 547.00000000, 629.00000000 )
-            r = 4
-            d_r = 13
-            len = 28
-        elif rv == 41:
-            luo_rad = (2773.32440459, 718.59601920, -158.52511216 )
-            r = 8
-            d_r = 18
-            len = 116
-
-
+        # fastener metadata lives in fastener_catalog.json, see Utils/fastener_catalog.py
+        catalog = fastener_catalog.load_catalog()
+        # bounds passed in with find_bounds=False were not filtered by _get_bounds
+        candidates = catalog.compatible(radius)
+        if len(candidates) == 0:
+            failures.note(failures.NO_BOUNDS, self.feat_type, 'no fastener fits radius {:.2f}'.format(radius))
+            return None, None, info
+        rv = int(self.rng.choice(candidates))
+        entry = catalog[rv]
+        luo_rad = tuple(entry['origin'])
+        r = entry['shank_radius']
+        d_r = entry['head_radius']
 
         info.append(r)
         info.append(d_r)
@@ -1,12 +1,11 @@
-import random
 import Utils.occ_utils as occ_utils
 
 from Features.machining_features import MachiningFeature
 
 
 class TwoSidesThroughStep(MachiningFeature):
-    def __init__(self, shape, label_map, min_len, clearance, feat_names):
-        super().__init__(shape, label_map, min_len, clearance, feat_names)
+    def __init__(self, shape, label_map, min_len, clearance, feat_names, rng=None):
+        super().__init__(shape, label_map, min_len, clearance, feat_names, rng)
         self.shifter_type = 3
         self.bound_type = 3
         self.depth_type = "blind"
@@ -16,7 +15,7 @@ class TwoSidesThroughStep(MachiningFeature):
         dir_l = bound[0] - bound[1]
         dir_r = bound[3] - bound[2]
 
-        ratio = random.uniform(0.4, 0.8)
+        ratio = self.rng.uniform(0.4, 0.8)
         pt4 = (bound[0] + bound[3]) / 2
         pt0 = bound[1] + dir_l * ratio
         pt1 = bound[1]
@@ -1,4 +1,3 @@
-import random
 import numpy as np
 
 from OCC.Core.BRepBuilderAPI import BRepBuilderAPI_MakeEdge, BRepBuilderAPI_MakeWire, BRepBuilderAPI_MakeFace
@@ -10,8 +9,8 @@ from Features.machining_features import MachiningFeature
 
 
 class VCircularEndBlindSlot(MachiningFeature):
-    def __init__(self, shape, label_map, min_len, clearance, feat_names):
-        super().__init__(shape, label_map, min_len, clearance, feat_names)
+    def __init__(self, shape, label_map, min_len, clearance, feat_names, rng=None):
+        super().__init__(shape, label_map, min_len, clearance, feat_names, rng)
         self.shifter_type = 1
         self.bound_type = 1
         self.depth_type = "blind"
@@ -25,7 +24,7 @@ class VCircularEndBlindSlot(MachiningFeature):
         if height - width / 2 > 1.0:
             radius = width / 2
         else:
-            radius = random.uniform(0.5, height / 2)
+            radius = self.rng.uniform(0.5, height / 2)
 
         offset = width / 2 - radius
         dir_w = dir_w / width
@@ -0,0 +1,179 @@
+"""
+Bounding volume hierarchy over triangles for the ray queries of feature placement.
+
+The tree is kept in flat arrays: node i has the box box_min[i], box_max[i],
+children left[i] and right[i], -1 for leaves, and the triangles
+triangles[start[i]:start[i] + count[i]] when it is a leaf. Nodes are split at
+the median centroid along the longest axis, so rays against a part with
+thousands of triangles visit a logarithmic number of nodes.
+
+Traversal follows the semantics of geom_utils_numba.ray_triangle_set_intersect:
+only hits at a positive ray parameter count, and no hit is np.NINF. It is
+compiled without fastmath, the slab test relies on infinities.
+"""
+import numba as nb
+import numpy as np
+
+from Utils.geom_utils_numba import ray_triangle_intersect
+
+LEAF_SIZE = 4
+# boxes are padded so that flat and axis aligned triangles are not missed by rounding
+BOX_PADDING = 1e-5
+STACK_SIZE = 64
+
+
+@nb.njit
+def _build(tris, leaf_size, padding):
+    num_tris = tris.shape[0]
+    max_nodes = 2 * num_tris + 1
+    box_min = np.empty((max_nodes, 3))
+    box_max = np.empty((max_nodes, 3))
+    left = np.full(max_nodes, -1, dtype=np.int32)
+    right = np.full(max_nodes, -1, dtype=np.int32)
+    start = np.zeros(max_nodes, dtype=np.int32)
+    count = np.zeros(max_nodes, dtype=np.int32)
+    order = np.arange(num_tris)
+
+    tri_min = np.empty((num_tris, 3))
+    tri_max = np.empty((num_tris, 3))
+    centroids = np.empty((num_tris, 3))
+    for i in range(num_tris):
+        for k in range(3):
+            tri_min[i, k] = min(tris[i, 0, k], tris[i, 1, k], tris[i, 2, k])
+            tri_max[i, k] = max(tris[i, 0, k], tris[i, 1, k], tris[i, 2, k])
+            centroids[i, k] = (tris[i, 0, k] + tris[i, 1, k] + tris[i, 2, k]) / 3
+
+    stack_node = np.empty(max_nodes, dtype=np.int32)
+    stack_begin = np.empty(max_nodes, dtype=np.int32)
+    stack_end = np.empty(max_nodes, dtype=np.int32)
+    stack_node[0] = 0
+    stack_begin[0] = 0
+    stack_end[0] = num_tris
+    sp = 1
+    num_nodes = 1
+    while sp > 0:
+        sp -= 1
+        node = stack_node[sp]
+        begin = stack_begin[sp]
+        end = stack_end[sp]
+
+        c_min = np.full(3, np.inf)
+        c_max = np.full(3, -np.inf)
+        for k in range(3):
+            box_min[node, k] = np.inf
+            box_max[node, k] = -np.inf
+        for i in range(begin, end):
+            tri = order[i]
+            for k in range(3):
+                box_min[node, k] = min(box_min[node, k], tri_min[tri, k] - padding)
+                box_max[node, k] = max(box_max[node, k], tri_max[tri, k] + padding)
+                c_min[k] = min(c_min[k], centroids[tri, k])
+                c_max[k] = max(c_max[k], centroids[tri, k])
+
+        axis = 0
+        for k in range(1, 3):
+            if c_max[k] - c_min[k] > c_max[axis] - c_min[axis]:
+                axis = k
+        if end - begin <= leaf_size or c_max[axis] - c_min[axis] <= 0.0:
+            start[node] = begin
+            count[node] = end - begin
+            continue
+
+        part = order[begin:end]
+        keys = np.empty(end - begin)
+        for i in range(end - begin):
+            keys[i] = centroids[part[i], axis]
+        order[begin:end] = part[np.argsort(keys)]
+
+        mid = begin + (end - begin) // 2
+        left[node] = num_nodes
+        right[node] = num_nodes + 1
+        num_nodes += 2
+        stack_node[sp] = right[node]
+        stack_begin[sp] = mid
+        stack_end[sp] = end
+        stack_node[sp + 1] = left[node]
+        stack_begin[sp + 1] = begin
+        stack_end[sp + 1] = mid
+        sp += 2
+
+    return (box_min[:num_nodes], box_max[:num_nodes], left[:num_nodes], right[:num_nodes],
+            start[:num_nodes], count[:num_nodes], order)
+
+
+@nb.njit
+def _ray_box(ray_origin, ray_direction, b_min, b_max, t_max):
+    """Whether the ray hits the box at a parameter in [0, t_max]."""
+    t_near = 0.0
+    t_far = t_max
+    for k in range(3):
+        if ray_direction[k] == 0.0:
+            if ray_origin[k] < b_min[k] or ray_origin[k] > b_max[k]:
+                return False
+            continue
+        t0 = (b_min[k] - ray_origin[k]) / ray_direction[k]
+        t1 = (b_max[k] - ray_origin[k]) / ray_direction[k]
+        if t0 > t1:
+            t0, t1 = t1, t0
+        t_near = max(t_near, t0)
+        t_far = min(t_far, t1)
+        if t_near > t_far:
+            return False
+
+    return True
+
+
+@nb.njit
+def _traverse(box_min, box_max, left, right, start, count, tris, ray_origin, ray_direction, any_hit):
+    best = np.inf
+    stack = np.empty(STACK_SIZE, dtype=np.int32)
+    stack[0] = 0
+    sp = 1
+    while sp > 0:
+        sp -= 1
+        node = stack[sp]
+        if not _ray_box(ray_origin, ray_direction, box_min[node], box_max[node], best):
+            continue
+
+        if left[node] < 0:
+            for i in range(start[node], start[node] + count[node]):
+                t = ray_triangle_intersect(ray_origin, ray_direction, tris[i, 0], tris[i, 1], tris[i, 2])
+                if 0 < t < best:
+                    best = t
+                    if any_hit:
+                        return best
+            continue
+
+        stack[sp] = right[node]
+        stack[sp + 1] = left[node]
+        sp += 2
+
+    if best == np.inf:
+        return -np.inf
+
+    return best
+
+
+class BVH:
+    def __init__(self, triangles):
+        """
+        :param triangles: Kx3x3 point triples
+        """
+        triangles = np.ascontiguousarray(triangles, dtype=np.float64).reshape(-1, 3, 3)
+        (self.box_min, self.box_max, self.left, self.right,
+         self.start, self.count, order) = _build(triangles, LEAF_SIZE, BOX_PADDING)
+        # triangles of a leaf are contiguous
+        self.triangles = triangles[order]
+
+    def _query(self, ray_origin, ray_direction, any_hit):
+        return _traverse(self.box_min, self.box_max, self.left, self.right, self.start, self.count, self.triangles,
+                         np.asarray(ray_origin, dtype=np.float64), np.asarray(ray_direction, dtype=np.float64),
+                         any_hit)
+
+    def closest_hit(self, ray_origin, ray_direction):
+        """Smallest positive ray parameter of a hit triangle, np.NINF when none is hit."""
+        return self._query(ray_origin, ray_direction, False)
+
+    def any_hit(self, ray_origin, ray_direction):
+        """Whether the ray hits a triangle at a positive ray parameter."""
+        return self._query(ray_origin, ray_direction, True) != np.NINF
@@ -0,0 +1,134 @@
+"""Feature combination sampler adapting to the failure rate and cost of the features.
+
+Every generated or failed sample updates, for each feature of its combo and for
+its combo size, the number of tries and the number of successes, and for its
+combo size the time spent. Success rates are Beta(1, 1) posterior means, so
+unseen features and sizes start at 1/2 instead of being ruled out.
+
+New combos are drawn with
+
+    feature weight  target_f / p_f   a feature that fails twice as often is drawn
+                                     twice as often, the generated samples keep
+                                     the requested class mix
+    size weight     k * p_k / c_k    combo sizes yielding more generated
+                                     features per second are preferred, every
+                                     size keeps a non-zero weight
+
+with p the success rate and c the mean time of a try. The feature weights are
+fixed by the class mix: with feature f drawn at weight w_f, generated samples
+hold f in proportion to w_f * p_f, so only target_f / p_f keeps the mix. The
+cost of the run is therefore steered through the combo size alone.
+"""
+import numpy as np
+
+import Utils.manifest as manifest
+
+# success rates are floored so a feature failing every time is not drawn without bound
+MIN_SUCCESS_RATE = 0.05
+
+
+class _Stats:
+    def __init__(self, keys):
+        self.keys = list(keys)
+        self.tries = np.zeros(len(self.keys), dtype=np.float64)
+        self.successes = np.zeros(len(self.keys), dtype=np.float64)
+        self.seconds = np.zeros(len(self.keys), dtype=np.float64)
+        self.index = {key: i for i, key in enumerate(self.keys)}
+
+    def add(self, key, success, seconds=0.0):
+        i = self.index.get(key)
+        if i is None:
+            return
+        self.tries[i] += 1
+        self.successes[i] += success
+        self.seconds[i] += seconds
+
+    def success_rate(self):
+        return np.maximum((self.successes + 1) / (self.tries + 2), MIN_SUCCESS_RATE)
+
+    def mean_seconds(self, default):
+        return np.where(self.tries > 0, self.seconds / np.maximum(self.tries, 1), default)
+
+
+class AdaptiveComboSampler:
+    def __init__(self, cand_feats, target_weights, combo_range, extra_feats=()):
+        """
+        :param cand_feats: feature ids combos are drawn from
+        :param target_weights: requested share of every feature among the generated samples
+        :param combo_range: [min, max] number of drawn features of a combo
+        :param extra_feats: feature ids appended to every combo
+        """
+        self.cand_feats = list(cand_feats)
+        self.target = np.asarray(target_weights, dtype=np.float64)
+        self.target = self.target / self.target.sum()
+        self.sizes = list(range(combo_range[0], combo_range[1] + 1))
+        self.extra_feats = list(extra_feats)
+        self.features = _Stats(self.cand_feats)
+        self.size_stats = _Stats(self.sizes)
+
+    def observe(self, combo, success, seconds):
+        """Account a finished sample.
+
+        :param combo: its combo, with the extra features
+        :param success: whether it was generated
+        :param seconds: time spent on it, None when unknown (e.g. timed out worker)
+        """
+        if seconds is None:
+            seconds = self.max_seconds()
+        drawn = list(combo)
+        for feat in self.extra_feats:
+            if feat in drawn:
+                drawn.remove(feat)
+
+        for feat in set(drawn):
+            self.features.add(feat, success)
+        self.size_stats.add(len(drawn), success, seconds)
+
+    def observe_manifest(self, sample_manifest):
+        """Account the finished samples of a manifest, e.g. when resuming a run.
+
+        Samples without a time, e.g. timed out, are accounted last so that they
+        are charged max_seconds of the timed ones, as observe does while running.
+        """
+        untimed = []
+        for sample in sample_manifest.with_status(manifest.STATUS_DONE, manifest.STATUS_FAILED):
+            if 'seconds' not in sample:
+                untimed.append(sample)
+                continue
+            self.observe(sample['combo'], sample['status'] == manifest.STATUS_DONE, sample['seconds'])
+        for sample in untimed:
+            self.observe(sample['combo'], sample['status'] == manifest.STATUS_DONE, None)
+
+    def max_seconds(self):
+        tried = self.size_stats.tries > 0
+        if not tried.any():
+            return 1.0
+
+        return float(self.size_stats.mean_seconds(0.0)[tried].max())
+
+    def feature_weights(self):
+        weights = self.target / self.features.success_rate()
+
+        return weights / weights.sum()
+
+    def size_weights(self):
+        # unseen sizes cost as much as the mean of the seen ones
+        tried = self.size_stats.tries > 0
+        default = self.size_stats.mean_seconds(0.0)[tried].mean() if tried.any() else 1.0
+        cost = np.maximum(self.size_stats.mean_seconds(default), 1e-3)
+        weights = np.asarray(self.sizes, dtype=np.float64) * self.size_stats.success_rate() / cost
+
+        return weights / weights.sum()
+
+    def draw(self, rng):
+        """Draw a combo with the random.Random rng."""
+        size = rng.choices(self.sizes, weights=self.size_weights().tolist())[0]
+        combo = rng.choices(self.cand_feats, weights=self.feature_weights().tolist(), k=size)
+
+        return combo + self.extra_feats
+
+    def summary(self):
+        return {'feature_success': dict(zip(self.cand_feats, self.features.success_rate().round(3).tolist())),
+                'feature_weight': dict(zip(self.cand_feats, self.feature_weights().round(3).tolist())),
+                'size_success': dict(zip(self.sizes, self.size_stats.success_rate().round(3).tolist())),
+                'size_weight': dict(zip(self.sizes, self.size_weights().round(3).tolist()))}
@@ -0,0 +1,126 @@
+"""Per-feature cost model of samples, for dispatching the expensive ones first.
+
+The time of a sample is modelled as a base time (stock, labels, output) plus the
+time of each of its features:
+
+    seconds = base + sum(cost[f] for f in combo)
+
+The prior costs come from the timing records of earlier runs, see
+Utils/timing.py, joined with the combos of the manifest: the cost of a feature
+type is the exclusive time of its stages per feature, the base time the rest of
+the sample. The model is then refined with every finished sample by ridge
+regression towards the prior, so combos of feature types never timed start at
+the mean cost of the others.
+"""
+import numpy as np
+
+import Utils.logs as logs
+import Utils.manifest as manifest
+import Utils.timing as timing
+
+logger = logs.get_logger(__name__)
+
+# prior cost of a feature type, and base time, when no timing record is available
+DEFAULT_SECONDS = 1.0
+# weight of the prior in samples, the observed samples outweigh it once there are a few
+PRIOR_WEIGHT = 2.0
+
+
+class CostModel:
+    def __init__(self, feat_names):
+        """
+        :param feat_names: feature type names, combos hold their indices
+        """
+        self.feat_names = list(feat_names)
+        num_terms = len(self.feat_names) + 1
+        # last term is the base time
+        self.prior = np.full(num_terms, DEFAULT_SECONDS, dtype=np.float64)
+        self.xtx = np.zeros((num_terms, num_terms), dtype=np.float64)
+        self.xty = np.zeros(num_terms, dtype=np.float64)
+        self.num_observed = 0
+        self._weights = None
+
+    def _terms(self, combo):
+        x = np.zeros(len(self.prior), dtype=np.float64)
+        for feat in combo:
+            x[feat] += 1
+        x[-1] = 1
+
+        return x
+
+    def fit_timing(self, records, combos):
+        """Set the prior from timing records.
+
+        :param records: timing records, see timing.read_records
+        :param combos: {sample id: combo} of the recorded samples
+        """
+        index = {name: i for i, name in enumerate(self.feat_names)}
+        feature_seconds = {}
+        base_seconds = []
+        for record in records:
+            if record['status'] == 'written' or record['sample'] not in combos:
+                continue
+            counts = np.bincount(np.asarray(combos[record['sample']], dtype=np.int64),
+                                 minlength=len(self.feat_names))
+            # stage times are exclusive, they add up to the time in the features
+            in_feature = {}
+            for feature, name, seconds, calls in record['stages']:
+                i = index.get(feature)
+                if i is None or counts[i] == 0:
+                    continue
+                in_feature[i] = in_feature.get(i, 0.0) + seconds
+            for i, seconds in in_feature.items():
+                feature_seconds.setdefault(i, []).append(seconds / counts[i])
+            base_seconds.append(record['seconds'] - sum(in_feature.values()))
+
+        if not base_seconds:
+            return
+        known = {i: float(np.mean(seconds)) for i, seconds in feature_seconds.items()}
+        default = float(np.mean(list(known.values()))) if known else DEFAULT_SECONDS
+        self.prior[:-1] = default
+        for i, seconds in known.items():
+            self.prior[i] = seconds
+        self.prior[-1] = float(np.mean(base_seconds))
+        if self.prior[-1] < 0:
+            # the feature stages took longer than their samples, e.g. records of inclusive stage times
+            logger.warning('negative base time %.3f s fitted from %d timing records',
+                           self.prior[-1], len(base_seconds))
+        self._weights = None
+
+    def observe(self, combo, seconds):
+        """Refine the model with the wall-clock time of a finished sample."""
+        if seconds is None:
+            return
+        x = self._terms(combo)
+        self.xtx += np.outer(x, x)
+        self.xty += x * seconds
+        self.num_observed += 1
+        self._weights = None
+
+    def weights(self):
+        if self._weights is None:
+            ridge = PRIOR_WEIGHT * np.eye(len(self.prior))
+            self._weights = np.linalg.solve(self.xtx + ridge, self.xty + PRIOR_WEIGHT * self.prior)
+
+        return self._weights
+
+    def estimate(self, combo):
+        """Expected seconds of a sample of combo."""
+        return max(float(self._terms(combo) @ self.weights()), 0.0)
+
+
+def from_dataset(dataset_dir, feat_names, sample_manifest=None):
+    """Cost model with the prior of the timing records of a dataset."""
+    model = CostModel(feat_names)
+    if sample_manifest is None:
+        return model
+    try:
+        records = timing.read_records(dataset_dir)
+    except FileNotFoundError:
+        return model
+    combos = {sample['id']: sample['combo']
+              for sample in sample_manifest.with_status(manifest.STATUS_DONE, manifest.STATUS_FAILED,
+                                                        manifest.STATUS_PENDING)}
+    model.fit_timing(records, combos)
+
+    return model
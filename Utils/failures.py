@@ -0,0 +1,104 @@
+"""Failure codes of sample generation attempts.
+
+A feature that cannot be applied is skipped by shape_from_directive, the attempt
+fails later on a generic check (e.g. the label count). Features therefore note
+the cause with
+
+    failures.note(failures.NO_BOUNDS, self.feat_type)
+
+and generate_shape ends every failed attempt with end_attempt. When the check that
+failed is a consequence of a skipped feature, it reports the first cause noted
+since begin_attempt, the code of the check otherwise. Steps that have to stop the attempt at once raise
+GenerationFailure.
+
+Attempt records, stored in the sample manifest under 'attempts':
+
+    {"code": code, "feature": feature type or null, "cpu_seconds": cpu time of
+     the attempt, "message": detail}
+"""
+import time
+
+# feature causes
+NO_BOUNDS = 'no_bounds'                 # no face region large enough for the feature
+NO_EDGES = 'no_edges'                   # no edge left for a round or chamfer
+DEPTH_INFEASIBLE = 'depth_infeasible'   # no bound leaves room for the minimum depth
+SKETCH_FAILED = 'sketch_failed'         # no sketch fits into the chosen bound
+PRISM_FAILED = 'prism_failed'           # OCC failed to cut the feature
+FEATURE_ERROR = 'feature_error'         # unexpected exception inside a feature
+
+# sample checks
+INVALID_SHAPE = 'invalid_shape'         # no shape, unsupported shape type or no faces
+LABEL_MISMATCH = 'label_mismatch'       # label count differs from feature or face count
+SAVE_FAILED = 'save_failed'
+ERROR = 'error'                         # unexpected exception outside of the features
+
+# set by the driver for samples whose worker did not return
+TIMEOUT = 'timeout'
+WORKER_DIED = 'worker_died'
+
+# checks failing as a consequence of a skipped feature, its noted cause is reported instead
+_CONSEQUENCES = (INVALID_SHAPE, LABEL_MISMATCH, ERROR)
+
+
+class GenerationFailure(Exception):
+    def __init__(self, code, feature=None, message=''):
+        super().__init__('{}: {}'.format(code, message) if message else code)
+        self.code = code
+        self.feature = feature
+        self.message = message
+
+
+# state of the current process
+_cause = None
+_cpu_start = None
+
+
+def begin_attempt():
+    global _cause, _cpu_start
+    _cause = None
+    _cpu_start = time.process_time()
+
+
+def note(code, feature=None, message=''):
+    """Note why a feature was not applied, the first note of an attempt is kept."""
+    global _cause
+    if _cause is None:
+        _cause = (code, feature, str(message))
+
+
+def end_attempt(code, message=''):
+    """Record of the current failed attempt.
+
+    :param code: code of the failed check, a cause noted by a feature takes precedence
+                 over the checks failing as its consequence
+    :param message: detail, or the GenerationFailure that stopped the attempt
+    """
+    feature = None
+    if isinstance(message, GenerationFailure):
+        code, feature, message = message.code, message.feature, message.message
+    elif _cause is not None and code in _CONSEQUENCES:
+        message = '{} ({})'.format(_cause[2], message) if _cause[2] else str(message)
+        code, feature = _cause[0], _cause[1]
+    cpu = time.process_time() - _cpu_start if _cpu_start is not None else None
+
+    return {'code': code,
+            'feature': feature,
+            'cpu_seconds': None if cpu is None else round(cpu, 3),
+            'message': str(message)}
+
+
+def driver_failure(error, code=None):
+    """Attempt record of a sample that failed in the driver, e.g. its worker did not return.
+
+    :param error: scheduler error or exception
+    :param code: failure code, derived from error when None
+    """
+    if code is None:
+        if error == TIMEOUT:
+            code, error = TIMEOUT, ''
+        elif str(error).startswith('worker died'):
+            code = WORKER_DIED
+        else:
+            code = ERROR
+
+    return {'code': code, 'feature': None, 'cpu_seconds': None, 'message': str(error)}
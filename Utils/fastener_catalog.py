@@ -0,0 +1,160 @@
+"""Catalog of the fasteners (bolts) that can be seated in through holes.
+
+The catalog file (param.fastener_catalog, JSON) holds one entry per fastener:
+
+    id           fastener id, also the segmentation label of its faces
+    step         STEP file name inside param.fastener_dir
+    origin       point of the fastener seated on the hole center
+    shank_radius radius of the hole cut for the fastener
+    head_radius  radius of the head, used as clearance between fasteners
+    length       nominal length, None when unknown
+    axis         direction of the fastener axis in its own frame
+    bbox         [xmin, ymin, zmin, xmax, ymax, zmax]
+
+origin and radii are set by hand, the geometric fields are precomputed from
+the STEP files with:
+
+    python -m Utils.fastener_catalog
+"""
+import json
+import logging
+import os
+
+import numpy as np
+from OCC.Core.BRepAdaptor import BRepAdaptor_Surface
+from OCC.Core.GeomAbs import GeomAbs_Cylinder
+
+import Utils.occ_utils as occ_utils
+import Utils.parameters as param
+import Utils.fastener_library as fastener_library
+import Utils.logs as logs
+
+logger = logs.get_logger(__name__)
+
+
+class FastenerCatalog:
+    def __init__(self, entries):
+        self.entries = {entry['id']: entry for entry in entries}
+        self.ids = np.array([entry['id'] for entry in entries], dtype=np.int64)
+        self.shank_radius = np.array([entry['shank_radius'] for entry in entries], dtype=np.float64)
+        self.head_radius = np.array([entry['head_radius'] for entry in entries], dtype=np.float64)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, sn):
+        return self.entries[sn]
+
+    def min_shank_radius(self):
+        return self.shank_radius.min()
+
+    def compatible(self, radius):
+        """Ids of the fasteners whose head fits in a hole bound of the given radius.
+
+        Falls back to the fasteners whose shank fits when no head does.
+        """
+        fits = self.head_radius <= radius
+        if not fits.any():
+            fits = self.shank_radius <= radius
+
+        return self.ids[fits]
+
+    def face_label_map(self, sn, faces):
+        """Map faces of a placed fastener to their segmentation labels, the fastener id.
+
+        :param sn: fastener id
+        :param faces: faces of the placed fastener, at any level of detail
+        :return: {TopoDS_Face: int}
+        """
+        return {face: sn for face in faces}
+
+
+# catalog loaded once per process
+_catalog = None
+
+
+def catalog_path():
+    return os.path.join(param.fastener_dir, param.fastener_catalog)
+
+
+def read_catalog_entries(filename=None):
+    if filename is None:
+        filename = catalog_path()
+    with open(filename, 'r', encoding='utf8') as fp:
+        data = json.load(fp)
+
+    return data['fasteners']
+
+
+def load_catalog():
+    """Catalog of the fasteners whose STEP file is available, loaded on first use."""
+    global _catalog
+    if _catalog is None:
+        entries = [entry for entry in read_catalog_entries()
+                   if os.path.isfile(fastener_library.fastener_step_path(entry['id']))]
+        _catalog = FastenerCatalog(entries)
+
+    return _catalog
+
+
+def fastener_geometry(shape):
+    """Geometric catalog fields of a fastener shape.
+
+    The fastener axis is taken from the cylindrical face with the largest area,
+    which is the shank for the bolts in this dataset.
+    """
+    bbox = list(occ_utils.get_boundingbox(shape, use_mesh=False)[:6])
+    faces = occ_utils.list_face(shape)
+
+    axis = None
+    max_area = 0.0
+    for face in faces:
+        surf = BRepAdaptor_Surface(face, True)
+        if surf.GetType() != GeomAbs_Cylinder:
+            continue
+        area = fastener_library.ask_surface_area(face)
+        if area > max_area:
+            max_area = area
+            axis = occ_utils.as_list(surf.Cylinder().Axis().Direction())
+
+    geometry = {'axis': axis,
+                'bbox': bbox}
+
+    if axis is not None:
+        extent = np.array(bbox[3:]) - np.array(bbox[:3])
+        geometry['geometric_length'] = float(np.abs(np.dot(extent, axis)))
+
+    return geometry
+
+
+def build_catalog(filename=None):
+    """Recompute the geometric fields of every catalog entry from its STEP file.
+
+    Hand-set fields (origin, radii, length) are kept.
+    """
+    global _catalog
+    if filename is None:
+        filename = catalog_path()
+
+    with open(filename, 'r', encoding='utf8') as fp:
+        data = json.load(fp)
+
+    for entry in data['fasteners']:
+        if not os.path.isfile(fastener_library.fastener_step_path(entry['id'])):
+            logger.warning('fastener %s: %s not found, skipped', entry['id'], entry['step'])
+            continue
+        shape = fastener_library.load_fastener(entry['id'], lod=0)
+        entry.update(fastener_geometry(shape))
+
+    with open(filename, 'w', encoding='utf8') as fp:
+        json.dump(data, fp, indent=4, ensure_ascii=False, sort_keys=False)
+
+    _catalog = None
+
+    return data['fasteners']
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format=logs.FORMAT)
+    entries = build_catalog()
+    logger.info('fastener catalog %s: %d entries', catalog_path(), len(entries))
@@ -0,0 +1,463 @@
+"""Per-worker library of the fastener (bolt) shapes placed in through holes.
+
+Every bolt STEP file is translated at most once per process, the resulting
+TopoDS_Shape is kept in memory and placed instances are handed out from it.
+Translated shapes are also kept on disk as OCC binary BRep files next to a
+small manifest entry, so a fresh worker only pays the STEP translation when
+the source file changed.
+
+Reduced level of detail (LOD) variants of each fastener are derived and
+cached the same way, param.fastener_lod selects the one used in generation:
+
+    0  full geometry as read from STEP
+    1  faces lying on the same surface merged
+    2  level 1 with threads and small blends/chamfers removed
+
+All faces of a fastener are labelled with its id, so the reduced variants need
+no label bookkeeping. LOD variants are only cached on disk when
+param.use_fastener_cache is set. Run this module to (re)build the on-disk
+cache:
+
+    python -m Utils.fastener_library
+"""
+import glob
+import hashlib
+import json
+import logging
+import math
+import os
+
+from OCC.Core.STEPControl import STEPControl_Reader
+from OCC.Core.IFSelect import IFSelect_RetDone
+from OCC.Core.BinTools import bintools_Read, bintools_Write
+from OCC.Core.TopoDS import TopoDS_Shape
+from OCC.Core.TopLoc import TopLoc_Location
+from OCC.Core.ShapeUpgrade import ShapeUpgrade_UnifySameDomain
+from OCC.Core.BRepAlgoAPI import BRepAlgoAPI_Defeaturing
+from OCC.Core.BRepAdaptor import BRepAdaptor_Surface
+from OCC.Core.GeomAbs import GeomAbs_BSplineSurface, GeomAbs_BezierSurface, GeomAbs_OffsetSurface, GeomAbs_OtherSurface
+from OCC.Core.GProp import GProp_GProps
+from OCC.Core.BRepGProp import brepgprop_SurfaceProperties
+from OCC.Core.gp import gp_Pnt, gp_Dir, gp_Ax1, gp_Trsf, gp_Vec
+
+import Utils.occ_utils as occ_utils
+import Utils.parameters as param
+import Utils.logs as logs
+
+logger = logs.get_logger(__name__)
+
+FASTENER_LODS = [0, 1, 2]
+# surfaces of helical threads and other free-form details dropped at LOD 2
+DETAIL_SURFACES = [GeomAbs_BSplineSurface, GeomAbs_BezierSurface, GeomAbs_OffsetSurface, GeomAbs_OtherSurface]
+
+# (fastener id, lod) -> TopoDS_Shape, filled lazily in each worker process
+_shapes = {}
+
+
+def fastener_step_path(sn):
+    return os.path.join(param.fastener_dir, f'{sn}.stp')
+
+
+def read_fastener_step(sn):
+    """Translate the STEP file of fastener sn.
+
+    :param sn: fastener id, the STEP file is named after it.
+    :return: TopoDS_Shape
+    """
+    filename = fastener_step_path(sn)
+    if not os.path.isfile(filename):
+        raise FileNotFoundError("%s not found." % filename)
+
+    reader = STEPControl_Reader()
+    status = reader.ReadFile(filename)
+    if status != IFSelect_RetDone:
+        raise AssertionError("Failed to read %s." % filename)
+    reader.TransferRoots()
+
+    return reader.OneShape()
+
+
+def fastener_cache_paths(sn):
+    """Binary BRep file and manifest entry of fastener sn in the disk cache."""
+    brep_path = os.path.join(param.fastener_cache_dir, f'{sn}.brep')
+    manifest_path = os.path.join(param.fastener_cache_dir, f'{sn}.json')
+
+    return brep_path, manifest_path
+
+
+def file_sha1(filename):
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(1 << 20), b''):
+            sha1.update(chunk)
+
+    return sha1.hexdigest()
+
+
+def _write_json_atomic(pathname, data):
+    # several workers may refresh the same entry, never leave a torn file behind
+    tmp_path = f'{pathname}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf8') as fp:
+        json.dump(data, fp, indent=4)
+    os.replace(tmp_path, pathname)
+
+
+def _cache_entry_valid(sn):
+    """Check the cached BRep of fastener sn against its source STEP file.
+
+    mtime and size are compared first, the content hash only when they differ,
+    so touching a STEP file does not force a rebuild.
+    """
+    brep_path, manifest_path = fastener_cache_paths(sn)
+    if not os.path.isfile(brep_path) or not os.path.isfile(manifest_path):
+        return False
+
+    try:
+        with open(manifest_path, 'r', encoding='utf8') as fp:
+            entry = json.load(fp)
+    except (OSError, ValueError):
+        return False
+
+    stat = os.stat(fastener_step_path(sn))
+    if entry.get('mtime_ns') == stat.st_mtime_ns and entry.get('size') == stat.st_size:
+        return True
+
+    if entry.get('sha1') != file_sha1(fastener_step_path(sn)):
+        return False
+
+    entry['mtime_ns'] = stat.st_mtime_ns
+    entry['size'] = stat.st_size
+    _write_json_atomic(manifest_path, entry)
+
+    return True
+
+
+def write_fastener_cache(sn, shape):
+    """Store shape as the binary BRep of fastener sn and record its source."""
+    os.makedirs(param.fastener_cache_dir, exist_ok=True)
+    brep_path, manifest_path = fastener_cache_paths(sn)
+    step_path = fastener_step_path(sn)
+    stat = os.stat(step_path)
+
+    tmp_path = f'{brep_path}.{os.getpid()}.tmp'
+    if not bintools_Write(shape, tmp_path):
+        raise AssertionError("Failed to write %s." % brep_path)
+    os.replace(tmp_path, brep_path)
+
+    entry = {'source': os.path.basename(step_path),
+             'mtime_ns': stat.st_mtime_ns,
+             'size': stat.st_size,
+             'sha1': file_sha1(step_path)}
+    _write_json_atomic(manifest_path, entry)
+
+
+def read_fastener_cache(sn):
+    brep_path, _ = fastener_cache_paths(sn)
+    shape = TopoDS_Shape()
+    if not bintools_Read(shape, brep_path) or shape.IsNull():
+        raise AssertionError("Failed to read %s." % brep_path)
+
+    return shape
+
+
+def _load_full_fastener(sn):
+    """Full shape of fastener sn.
+
+    Read from the binary BRep cache; the STEP file is only translated when the
+    cache is missing or older than the source.
+    """
+    shape = None
+    if param.use_fastener_cache and _cache_entry_valid(sn):
+        try:
+            shape = read_fastener_cache(sn)
+        except AssertionError:
+            shape = None
+
+    if shape is None:
+        shape = read_fastener_step(sn)
+        if param.use_fastener_cache:
+            write_fastener_cache(sn, shape)
+
+    return shape
+
+
+def load_fastener(sn, lod=None):
+    """Shape of fastener sn at the given level of detail.
+
+    Looked up in memory first, then built from the on-disk cache.
+
+    :param sn: fastener id
+    :param lod: level of detail, param.fastener_lod by default
+    :return: TopoDS_Shape
+    """
+    if lod is None:
+        lod = param.fastener_lod
+
+    shape = _shapes.get((sn, lod))
+    if shape is not None:
+        return shape
+
+    if lod == 0:
+        shape = _load_full_fastener(sn)
+    else:
+        shape = _load_lod_fastener(sn, lod)
+
+    _shapes[(sn, lod)] = shape
+
+    return shape
+
+
+#==============================================================================
+# level of detail
+#==============================================================================
+
+
+def merge_fastener_faces(shape):
+    """LOD 1: merge faces lying on the same surface."""
+    unifier = ShapeUpgrade_UnifySameDomain(shape, True, True, True)
+    unifier.Build()
+
+    return unifier.Shape()
+
+
+def ask_surface_area(face):
+    props = GProp_GProps()
+    brepgprop_SurfaceProperties(face, props)
+
+    return props.Mass()
+
+
+def remove_fastener_details(shape):
+    """LOD 2: remove thread surfaces and faces small compared to the whole fastener.
+
+    Returns the input unchanged when OCC cannot defeature it.
+    """
+    faces = occ_utils.list_face(shape)
+    areas = [ask_surface_area(face) for face in faces]
+    min_area = param.fastener_lod_area_ratio * sum(areas)
+
+    detail_faces = []
+    for face, area in zip(faces, areas):
+        surf_type = BRepAdaptor_Surface(face, True).GetType()
+        if area < min_area or surf_type in DETAIL_SURFACES:
+            detail_faces.append(face)
+
+    if len(detail_faces) == 0:
+        return shape
+
+    defeaturer = BRepAlgoAPI_Defeaturing()
+    defeaturer.SetShape(shape)
+    for face in detail_faces:
+        defeaturer.AddFaceToRemove(face)
+    defeaturer.SetRunParallel(False)
+    defeaturer.SetToFillHistory(False)
+    defeaturer.Build()
+    if not defeaturer.IsDone():
+        logger.warning('defeaturing failed, keep %d faces', len(faces))
+        return shape
+
+    return defeaturer.Shape()
+
+
+def reduce_fastener(shape, lod):
+    """Derive the given level of detail from the full fastener shape.
+
+    :param shape: full fastener shape
+    :param lod: level of detail, one of FASTENER_LODS
+    :return: reduced shape
+    """
+    if lod >= 1:
+        shape = merge_fastener_faces(shape)
+    if lod >= 2:
+        shape = remove_fastener_details(shape)
+
+    return shape
+
+
+def fastener_lod_paths(sn, lod):
+    brep_path = os.path.join(param.fastener_cache_dir, f'{sn}_lod{lod}.brep')
+    manifest_path = os.path.join(param.fastener_cache_dir, f'{sn}_lod{lod}.json')
+
+    return brep_path, manifest_path
+
+
+def _lod_entry(sn, lod):
+    """Manifest entry of a cached LOD, None when missing or built from another source."""
+    if not param.use_fastener_cache:
+        return None
+    brep_path, manifest_path = fastener_lod_paths(sn, lod)
+    if not os.path.isfile(brep_path) or not os.path.isfile(manifest_path):
+        return None
+    if not _cache_entry_valid(sn):
+        return None
+
+    try:
+        with open(manifest_path, 'r', encoding='utf8') as fp:
+            entry = json.load(fp)
+        with open(fastener_cache_paths(sn)[1], 'r', encoding='utf8') as fp:
+            base_entry = json.load(fp)
+    except (OSError, ValueError):
+        return None
+
+    if entry.get('source_sha1') != base_entry.get('sha1') or \
+            entry.get('area_ratio') != param.fastener_lod_area_ratio:
+        return None
+
+    return entry
+
+
+def build_fastener_lod(sn, lod):
+    """Derive a LOD of fastener sn, stored in the disk cache when caching is enabled."""
+    shape = reduce_fastener(load_fastener(sn, lod=0), lod)
+    if not param.use_fastener_cache:
+        return shape
+
+    os.makedirs(param.fastener_cache_dir, exist_ok=True)
+    brep_path, manifest_path = fastener_lod_paths(sn, lod)
+    tmp_path = f'{brep_path}.{os.getpid()}.tmp'
+    if not bintools_Write(shape, tmp_path):
+        raise AssertionError("Failed to write %s." % brep_path)
+    os.replace(tmp_path, brep_path)
+
+    with open(fastener_cache_paths(sn)[1], 'r', encoding='utf8') as fp:
+        base_entry = json.load(fp)
+    entry = {'source_sha1': base_entry['sha1'],
+             'area_ratio': param.fastener_lod_area_ratio}
+    _write_json_atomic(manifest_path, entry)
+
+    return shape
+
+
+def _load_lod_fastener(sn, lod):
+    entry = _lod_entry(sn, lod)
+    if entry is not None:
+        shape = TopoDS_Shape()
+        brep_path, _ = fastener_lod_paths(sn, lod)
+        if bintools_Read(shape, brep_path) and not shape.IsNull():
+            return shape
+
+    return build_fastener_lod(sn, lod)
+
+
+def list_fastener_ids():
+    """Ids of all fastener STEP files found in param.fastener_dir."""
+    ids = []
+    for filename in glob.glob(os.path.join(param.fastener_dir, '*.stp')):
+        name = os.path.splitext(os.path.basename(filename))[0]
+        if name.isdigit():
+            ids.append(int(name))
+
+    return sorted(ids)
+
+
+def build_cache(ids=None, force=False, lods=FASTENER_LODS):
+    """Convert fastener STEP files into the binary BRep cache and derive their LODs.
+
+    :param ids: fastener ids to convert, all STEP files in param.fastener_dir by default
+    :param force: rebuild entries even if they are up to date
+    :param lods: levels of detail to derive
+    :return: list of rebuilt (fastener id, lod)
+    """
+    if not param.use_fastener_cache:
+        logger.warning('fastener cache disabled by param.use_fastener_cache, nothing built')
+        return []
+    if ids is None:
+        ids = list_fastener_ids()
+
+    rebuilt = []
+    for sn in ids:
+        if force or not _cache_entry_valid(sn):
+            write_fastener_cache(sn, read_fastener_step(sn))
+            rebuilt.append((sn, 0))
+
+        for lod in lods:
+            if lod == 0:
+                continue
+            if force or _lod_entry(sn, lod) is None:
+                build_fastener_lod(sn, lod)
+                rebuilt.append((sn, lod))
+
+    return rebuilt
+
+
+def clear_cache():
+    _shapes.clear()
+
+
+def fastener_rotation(info):
+    """Rotation turning the fastener axis onto the hole axis.
+
+    :param info: hole info from ThroughHole._add_sketch,
+                 [x, y, z, r, d_r, fastener origin, hole axis, fastener id]
+    :return: gp_Trsf
+    """
+    ax = info[6]
+    if ax[0] != 0:
+        rad = 90
+        ax_xyz = [0, -ax[0], 0]
+    elif ax[1] != 0:
+        rad = 90
+        ax_xyz = [ax[1], 0, 0]
+    elif ax[2] == 1:
+        rad = 180
+        ax_xyz = [0, 1, 0]
+    elif ax[2] == -1:
+        rad = 0
+        ax_xyz = [0, 0, 1]
+
+    # 螺栓原点坐标
+    ro_id = info[5]
+    axis = gp_Ax1(gp_Pnt(ro_id[0], ro_id[1], ro_id[2]), gp_Dir(ax_xyz[0], ax_xyz[1], ax_xyz[2]))
+    trsf_rotation = gp_Trsf()
+    #### 偏置生成调整
+    trsf_rotation.SetRotation(axis, math.radians(rad))  # random.randint(-15, 15)
+
+    return trsf_rotation
+
+
+def fastener_translation(info):
+    """Translation moving the fastener origin onto the hole center."""
+    ro_id = info[5]
+    tx = info[0] - ro_id[0]
+    ty = info[1] - ro_id[1]
+    tz = info[2] - ro_id[2]
+
+    # 创建一个平移变换
+    trsf = gp_Trsf()
+    trsf.SetTranslation(gp_Vec(tx, ty, tz))
+
+    return trsf
+
+
+def fastener_trsf(info):
+    """Placement of a fastener in the hole described by info.
+
+    Rotation and translation are composed into a single transformation,
+    the rotation being applied first.
+    """
+    trsf = fastener_translation(info)
+    trsf.Multiply(fastener_rotation(info))
+
+    return trsf
+
+
+def place_fastener(sn, info):
+    """Instance of fastener sn seated in the hole described by info.
+
+    The placement is attached as a location to the cached shape at
+    param.fastener_lod, so every instance shares the underlying geometry
+    instead of copying it.
+
+    :param sn: fastener id
+    :param info: hole info from ThroughHole._add_sketch
+    :return: TopoDS_Shape
+    """
+    shape = load_fastener(sn)
+
+    return shape.Moved(TopLoc_Location(fastener_trsf(info)))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format=logs.FORMAT)
+    rebuilt = build_cache()
+    logger.info('fastener cache %s: rebuilt %s', param.fastener_cache_dir, rebuilt)
@@ -0,0 +1,108 @@
+"""Buffered per-process log files.
+
+Workers log through the standard logging module, under the 'aag' logger:
+
+    logger = logs.get_logger(__name__)
+    logger.debug('no same face')
+
+setup, called once by the driver before the workers fork, installs a handler
+keeping the records of every process in memory and appending them to
+<log_dir>/<host>-<pid>.log when its buffer fills up, when a record of level
+ERROR or above arrives, every FLUSH_SECONDS, and when the process exits. No
+worker writes to the shared stdout pipe. Records below the level are dropped
+before they are formatted.
+"""
+import logging
+import logging.handlers
+import os
+import socket
+from multiprocessing.util import Finalize
+
+LOGGER_NAME = 'aag'
+BUFFER_RECORDS = 1000
+FLUSH_SECONDS = 10.0
+FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+
+def get_logger(name):
+    """Logger of a module, e.g. get_logger(__name__)."""
+    return logging.getLogger('{}.{}'.format(LOGGER_NAME, name))
+
+
+class _TimedMemoryHandler(logging.handlers.MemoryHandler):
+    """MemoryHandler also flushing when its oldest buffered record is flush_seconds old."""
+    def __init__(self, capacity, flush_seconds, target):
+        super().__init__(capacity, flushLevel=logging.ERROR, target=target)
+        self.flush_seconds = flush_seconds
+
+    def shouldFlush(self, record):
+        return super().shouldFlush(record) or record.created - self.buffer[0].created >= self.flush_seconds
+
+
+class PerProcessHandler(logging.Handler):
+    """Handler opening a buffered log file of its own in every process it emits in."""
+    def __init__(self, log_dir):
+        super().__init__()
+        self.log_dir = log_dir
+        self.buffer = None
+        self.pid = None
+
+    def _process_buffer(self):
+        if self.pid != os.getpid():
+            os.makedirs(self.log_dir, exist_ok=True)
+            filename = '{}-{}.log'.format(socket.gethostname(), os.getpid())
+            target = logging.FileHandler(os.path.join(self.log_dir, filename), encoding='utf8', delay=True)
+            target.setFormatter(self.formatter)
+            self.buffer = _TimedMemoryHandler(BUFFER_RECORDS, FLUSH_SECONDS, target)
+            self.pid = os.getpid()
+            # workers exit through the multiprocessing finalizers
+            Finalize(None, self.flush, exitpriority=20)
+
+        return self.buffer
+
+    def emit(self, record):
+        self._process_buffer().handle(record)
+
+    def flush(self):
+        if self.buffer is not None and self.pid == os.getpid():
+            self.buffer.flush()
+
+
+class _DriverConsoleHandler(logging.StreamHandler):
+    """Console handler of the driver, silent in the workers it is inherited by."""
+    def __init__(self, pid):
+        super().__init__()
+        self.pid = pid
+
+    def emit(self, record):
+        if os.getpid() == self.pid:
+            super().emit(record)
+
+
+def setup(log_dir, level='INFO', console_level='WARNING'):
+    """Log the records of level and above to the per-process files of log_dir.
+
+    Records of console_level and above are also printed by the driver, None to
+    print none. Called again, the earlier handlers are replaced.
+    """
+    logger = logging.getLogger(LOGGER_NAME)
+    for handler in list(logger.handlers):
+        handler.flush()
+        logger.removeHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+
+    handler = PerProcessHandler(log_dir)
+    handler.setFormatter(logging.Formatter(FORMAT))
+    logger.addHandler(handler)
+    if console_level is not None:
+        console = _DriverConsoleHandler(os.getpid())
+        console.setLevel(console_level)
+        console.setFormatter(logging.Formatter('%(levelname)s %(name)s: %(message)s'))
+        logger.addHandler(console)
+
+
+def flush():
+    """Write the buffered records of the current process."""
+    for handler in logging.getLogger(LOGGER_NAME).handlers:
+        handler.flush()
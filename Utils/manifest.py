@@ -0,0 +1,101 @@
+"""Sample manifest of a dataset generation run.
+
+Append-only JSONL file, one record per line. The first record of a sample
+plans it (id, combo, seed), later records update its status; the latest
+value of every field wins when the file is read back. Only the driver
+process writes to it, so a restarted run can skip completed samples and
+reschedule pending and failed ones.
+
+The samples are also indexed by status as records arrive, counting and listing
+the samples of a status does not scan the whole manifest.
+"""
+import json
+import os
+
+STATUS_PENDING = 'pending'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+
+class SampleManifest:
+    def __init__(self, pathname):
+        self.pathname = pathname
+        self.samples = {}
+        # status -> ids of its samples, sample id -> planning position
+        self.by_status = {}
+        self.position = {}
+        if os.path.exists(pathname):
+            self._load()
+        self.fp = open(pathname, 'a', encoding='utf8')
+
+    def _load(self):
+        with open(self.pathname, 'r', encoding='utf8') as fp:
+            for line in fp:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # last line of an interrupted run may be torn
+                    continue
+                self.record(record)
+
+    def record(self, record):
+        """Merge a record into its sample and move the sample to its new status."""
+        sample_id = record['id']
+        sample = self.samples.get(sample_id)
+        if sample is None:
+            sample = self.samples[sample_id] = {}
+            self.position[sample_id] = len(self.position)
+        old_status = sample.get('status')
+        sample.update(record)
+        status = sample.get('status')
+        if status != old_status:
+            if old_status is not None:
+                del self.by_status[old_status][sample_id]
+            if status is not None:
+                # dicts keep the ids in insertion order and remove them in O(1)
+                self.by_status.setdefault(status, {})[sample_id] = None
+
+    def _append(self, record):
+        self.fp.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.fp.flush()
+        self.record(record)
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __contains__(self, sample_id):
+        return sample_id in self.samples
+
+    def __getitem__(self, sample_id):
+        return self.samples[sample_id]
+
+    def plan(self, sample_id, combo, seed, **fields):
+        record = {'id': sample_id, 'combo': list(combo), 'seed': seed, 'status': STATUS_PENDING}
+        record.update(fields)
+        self._append(record)
+
+    def update(self, sample_id, status, **fields):
+        record = {'id': sample_id, 'status': status}
+        record.update(fields)
+        self._append(record)
+
+    def with_status(self, *status):
+        """Samples of the given status, in planning order."""
+        ids = [sample_id for value in status for sample_id in self.by_status.get(value, ())]
+        ids.sort(key=self.position.__getitem__)
+
+        return [self.samples[sample_id] for sample_id in ids]
+
+    def count(self, *status):
+        """Number of samples of the given status."""
+        return sum(len(self.by_status.get(value, ())) for value in status)
+
+    def unfinished(self):
+        """Planned samples that still have to be generated, in planning order."""
+        return self.with_status(STATUS_PENDING, STATUS_FAILED)
+
+    def num_done(self):
+        return self.count(STATUS_DONE)
+
+    def close(self):
+        self.fp.close()
@@ -0,0 +1,317 @@
+"""Incremental meshing of the shape a sample is built on.
+
+A feature rebuilds only the faces it cuts, the faces it leaves alone keep their
+TShape, and with it the triangulation meshed before the feature (see
+shape_factory.map_face_before_and_after_feat). Instead of running
+BRepMesh_IncrementalMesh over the whole shape before every feature, the mesh
+manager meshes only the faces without a triangulation, all at once so the new
+faces share the discretization of their common edges.
+
+The triangulation kept on the shape is the fine one of Utils/mesh_policy.py,
+used by bound searches and point sampling. Coarse triangulations of the planar
+faces the policy picks for ray queries are meshed on a copy of the face, so the
+mesh of the shape and of its neighbour faces is left as it is.
+
+Triangulations read back into python are cached per face, the unchanged faces
+of a shape are read once per sample. The ray query scenes of a shape revision
+are kept in a TriangleCache, shared by the bound searches and depth queries of
+a feature. A scene queries the planar faces through one BVH (Utils/bvh.py) of
+their query triangles, a curved face gets a BVH of its own only once a ray
+passes through its box. Cached values are shared, callers must not modify them.
+"""
+import collections
+
+import numpy as np
+from OCC.Core.BRep import BRep_Tool, BRep_Builder
+from OCC.Core.BRepBuilderAPI import BRepBuilderAPI_Copy
+from OCC.Core.BRepMesh import BRepMesh_IncrementalMesh
+from OCC.Core.TopLoc import TopLoc_Location
+from OCC.Core.TopoDS import TopoDS_Compound, topods
+
+import Utils.occ_utils as occ_utils
+from Utils.bvh import BVH
+import Utils.mesh_policy as mesh_policy
+import Utils.timing as timing
+
+
+def has_triangulation(face):
+    triangulation = BRep_Tool().Triangulation(face, TopLoc_Location())
+
+    return triangulation is not None and triangulation.NbTriangles() > 0
+
+
+class Adjacency(collections.namedtuple('Adjacency', ['keys', 'offsets', 'triangles'])):
+    """Triangles around the vertices or edges of a triangulation.
+
+    keys holds the vertices (K) or edges (Kx2, smaller vertex first) in
+    ascending order, the triangles around keys[i] are
+    triangles[offsets[i]:offsets[i + 1]].
+    """
+    __slots__ = ()
+
+    def counts(self):
+        return np.diff(self.offsets)
+
+
+def _adjacency(keys, triangles):
+    """Adjacency of keys (K or Kx2 node indices) to the triangles they come from."""
+    num_nodes = int(keys.max()) + 1 if len(keys) else 1
+    if keys.ndim == 2:
+        codes = keys[:, 0].astype(np.int64) * num_nodes + keys[:, 1]
+    else:
+        codes = keys.astype(np.int64)
+
+    order = np.argsort(codes, kind='stable')
+    unique, counts = np.unique(codes[order], return_counts=True)
+    offsets = np.zeros(len(unique) + 1, dtype=np.int32)
+    np.cumsum(counts, out=offsets[1:])
+    if keys.ndim == 2:
+        unique = np.stack((unique // num_nodes, unique % num_nodes), axis=1)
+
+    return Adjacency(unique.astype(np.int32), offsets, triangles[order].astype(np.int32))
+
+
+def read_triangulation(face):
+    """Triangulation of a meshed face.
+
+    :return: (points, Nx3 float64, triangles, Mx3 int32 with sorted point
+              indices, vertex Adjacency, edge Adjacency)
+    """
+    pts, triangles = occ_utils.triangulation_arrays(face)
+    triangles = np.sort(triangles, axis=1)
+    tri_ids = np.repeat(np.arange(len(triangles), dtype=np.int32), 3)
+    vt_map = _adjacency(triangles.reshape(-1), tri_ids)
+    # edges (0, 1), (0, 2), (1, 2) of every triangle
+    et_map = _adjacency(triangles[:, [0, 1, 0, 2, 1, 2]].reshape(-1, 2), tri_ids)
+
+    return pts, triangles, vt_map, et_map
+
+
+class QueryScene:
+    """Ray queries against faces of a TriangleCache, with the semantics of Utils/bvh.py.
+
+    A curved face is only tested, and gets its BVH, once a ray enters its box
+    closer than the hits found so far.
+    """
+    def __init__(self, cache, face_ids):
+        self.cache = cache
+        planar = [i for i in face_ids if not cache.needs_fine[i]]
+        self.planar = BVH(np.concatenate([np.zeros((0, 3, 3), dtype=np.float64)] +
+                                         [cache.face_triangles(i) for i in planar])) if planar else None
+        self.curved = np.array([i for i in face_ids if cache.needs_fine[i]], dtype=np.int64)
+        self.box_min = cache.box_min[self.curved]
+        self.box_max = cache.box_max[self.curved]
+
+    def _curved_candidates(self, ray_origin, ray_direction, t_max):
+        """Curved faces whose box the ray enters at a parameter in [0, t_max], nearest first."""
+        parallel = ray_direction == 0.0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t0 = (self.box_min - ray_origin) / ray_direction
+            t1 = (self.box_max - ray_origin) / ray_direction
+        inside = (ray_origin >= self.box_min) & (ray_origin <= self.box_max)
+        t_low = np.where(parallel, np.where(inside, -np.inf, np.inf), np.minimum(t0, t1))
+        t_high = np.where(parallel, np.where(inside, np.inf, -np.inf), np.maximum(t0, t1))
+        t_near = np.maximum(t_low.max(axis=1, initial=-np.inf), 0.0)
+        t_far = np.minimum(t_high.min(axis=1, initial=np.inf), t_max)
+        hit = np.nonzero(t_near <= t_far)[0]
+        order = hit[np.argsort(t_near[hit], kind='stable')]
+
+        return self.curved[order], t_near[order]
+
+    def closest_hit(self, ray_origin, ray_direction):
+        """Smallest positive ray parameter of a hit triangle, np.NINF when none is hit."""
+        ray_origin = np.asarray(ray_origin, dtype=np.float64)
+        ray_direction = np.asarray(ray_direction, dtype=np.float64)
+        best = np.inf
+        if self.planar is not None:
+            t = self.planar.closest_hit(ray_origin, ray_direction)
+            if t != np.NINF:
+                best = t
+        faces, entries = self._curved_candidates(ray_origin, ray_direction, best)
+        for i, entry in zip(faces, entries):
+            if entry > best:
+                break
+            t = self.cache.face_bvh(i).closest_hit(ray_origin, ray_direction)
+            if t != np.NINF and t < best:
+                best = t
+
+        return np.NINF if best == np.inf else best
+
+    def any_hit(self, ray_origin, ray_direction):
+        """Whether the ray hits a triangle at a positive ray parameter."""
+        ray_origin = np.asarray(ray_origin, dtype=np.float64)
+        ray_direction = np.asarray(ray_direction, dtype=np.float64)
+        if self.planar is not None and self.planar.any_hit(ray_origin, ray_direction):
+            return True
+        faces, entries = self._curved_candidates(ray_origin, ray_direction, np.inf)
+
+        return any(self.cache.face_bvh(i).any_hit(ray_origin, ray_direction) for i in faces)
+
+
+class TriangleCache:
+    """Ray query scenes of one shape revision."""
+    def __init__(self, shape, manager):
+        self.shape = shape
+        self.manager = manager
+        manager.mesh(shape)
+        self.faces = occ_utils.list_face(shape)
+        self.index = {face: i for i, face in enumerate(self.faces)}
+        self.needs_fine = [mesh_policy.query_needs_fine(face) for face in self.faces]
+        # boxes of the curved faces, their query triangles are the ones of the shape mesh
+        self.box_min = np.zeros((len(self.faces), 3), dtype=np.float64)
+        self.box_max = np.zeros((len(self.faces), 3), dtype=np.float64)
+        for i, face in enumerate(self.faces):
+            if self.needs_fine[i]:
+                pts = manager.triangulation(face)[0]
+                if len(pts) == 0:
+                    # no triangle a ray could hit, left with the planar faces
+                    self.needs_fine[i] = False
+                    continue
+                self.box_min[i] = pts.min(axis=0)
+                self.box_max[i] = pts.max(axis=0)
+        # Kx3x3 point triples and BVH of a face, see MeshManager.query_triangulation
+        self._face_triangles = {}
+        self._face_bvhs = {}
+        # sorted face indices, None for all faces -> QueryScene of the faces
+        self.scenes = {}
+
+    def _key(self, faces):
+        if faces is None:
+            return None
+        key = tuple(sorted(self.index[face] for face in faces))
+
+        return None if len(key) == len(self.faces) else key
+
+    def face_triangles(self, i):
+        """Ray query triangles of the i-th face, see MeshManager.query_triangulation."""
+        cached = self._face_triangles.get(i)
+        if cached is None:
+            pts, triangles, vt_map, et_map = self.manager.query_triangulation(self.faces[i])
+            cached = pts[triangles]
+            self._face_triangles[i] = cached
+
+        return cached
+
+    @timing.timed('bvh')
+    def face_bvh(self, i):
+        cached = self._face_bvhs.get(i)
+        if cached is None:
+            cached = BVH(self.face_triangles(i))
+            self._face_bvhs[i] = cached
+
+        return cached
+
+    @timing.timed('bvh')
+    def bvh(self, faces=None):
+        """QueryScene of faces, of all faces by default."""
+        key = self._key(faces)
+        cached = self.scenes.get(key)
+        if cached is None:
+            cached = QueryScene(self, range(len(self.faces)) if key is None else key)
+            self.scenes[key] = cached
+
+        return cached
+
+
+class MeshManager:
+    def __init__(self):
+        # TopoDS_Face -> read_triangulation(face), of the shape mesh and coarse
+        self.faces = {}
+        self.coarse_faces = {}
+        self._triangle_cache = None
+        self.num_meshed = 0
+        self.num_reused = 0
+        self.num_coarse = 0
+
+    def clear(self):
+        """Forget the cached triangulations, e.g. before a new sample."""
+        self.faces = {}
+        self.coarse_faces = {}
+        self._triangle_cache = None
+
+    @timing.timed('triangulate')
+    def mesh(self, shape):
+        """Mesh the faces of shape that have no triangulation yet."""
+        compound = TopoDS_Compound()
+        builder = BRep_Builder()
+        builder.MakeCompound(compound)
+        num_missing = 0
+        for face in occ_utils.list_face(shape):
+            if has_triangulation(face):
+                self.num_reused += 1
+                continue
+            builder.Add(compound, face)
+            num_missing += 1
+
+        if num_missing == 0:
+            return
+        linear_deflection, angular_deflection = mesh_policy.fine_deflection()
+        mesh = BRepMesh_IncrementalMesh(compound, linear_deflection, False, angular_deflection, True)
+        mesh.Perform()
+        assert mesh.IsDone()
+        self.num_meshed += num_missing
+
+    def triangulation(self, face):
+        """read_triangulation of face, meshing it first when it has no triangulation."""
+        cached = self.faces.get(face)
+        if cached is None:
+            if not has_triangulation(face):
+                self.mesh(face)
+            cached = read_triangulation(face)
+            self.faces[face] = cached
+
+        return cached
+
+    @timing.timed('triangulate_coarse')
+    def coarse_triangulation(self, face):
+        """Coarse read_triangulation of face, meshed on a copy of the face."""
+        cached = self.coarse_faces.get(face)
+        if cached is None:
+            face_copy = topods.Face(BRepBuilderAPI_Copy(face).Shape())
+            linear_deflection, angular_deflection = mesh_policy.coarse_deflection()
+            mesh = BRepMesh_IncrementalMesh(face_copy, linear_deflection, False, angular_deflection, True)
+            mesh.Perform()
+            assert mesh.IsDone()
+            cached = read_triangulation(face_copy)
+            self.coarse_faces[face] = cached
+            self.num_coarse += 1
+
+        return cached
+
+    def query_triangulation(self, face):
+        """Triangulation of face for ray queries, coarse where the policy asks for it."""
+        if mesh_policy.query_uses_coarse(face):
+            return self.coarse_triangulation(face)
+
+        return self.triangulation(face)
+
+    def triangles(self, faces, query=False):
+        """Triangles of faces as a Kx3x3 array of point triples.
+
+        :param query: the triangles are for ray queries, see query_triangulation
+        """
+        tri_arrays = [np.zeros((0, 3, 3), dtype=np.float64)]
+        for face in faces:
+            pts, triangles, vt_map, et_map = self.query_triangulation(face) if query else self.triangulation(face)
+            tri_arrays.append(pts[triangles])
+
+        return np.concatenate(tri_arrays)
+
+    def triangle_cache(self, shape):
+        """TriangleCache of shape, built again once shape is a new revision."""
+        if self._triangle_cache is None or not self._triangle_cache.shape.IsSame(shape):
+            self._triangle_cache = TriangleCache(shape, self)
+
+        return self._triangle_cache
+
+
+_manager = None
+
+
+def get_manager():
+    """Mesh manager of the current process."""
+    global _manager
+    if _manager is None:
+        _manager = MeshManager()
+
+    return _manager
@@ -0,0 +1,55 @@
+"""Mesh resolution policy of the feature placement queries.
+
+The shape is meshed with the fine deflection it always was, bound searches and
+point sampling use that mesh. Ray tests (feature depth, machinability) against
+a planar face with curved edges use a coarse mesh of a copy of the face, with a
+deflection scaled to the stock size: a plane is represented exactly by any mesh
+up to its curved boundaries, which the fine mesh splits into many small
+triangles. Curved faces keep their fine mesh for ray tests, and only enter the
+ray kernels once a ray passes through their box.
+"""
+from OCC.Core.BRepAdaptor import BRepAdaptor_Curve, BRepAdaptor_Surface
+from OCC.Core.GeomAbs import GeomAbs_Line, GeomAbs_Plane
+
+import Utils.occ_utils as occ_utils
+import Utils.parameters as param
+
+# fine mesh, the deflections the shape is meshed with
+FINE_LINEAR_DEFLECTION = 0.1
+FINE_ANGULAR_DEFLECTION = 0.5
+# coarse linear deflection relative to the largest stock dimension
+COARSE_LINEAR_RATIO = 0.005
+COARSE_ANGULAR_DEFLECTION = 1.0
+
+
+def coarse_deflection():
+    """(linear, angular) deflection of the coarse mesh of the current stock."""
+    dims = [dim for dim in (param.stock_dim_x, param.stock_dim_y, param.stock_dim_z) if dim is not None]
+    if not dims:
+        return FINE_LINEAR_DEFLECTION, FINE_ANGULAR_DEFLECTION
+
+    return max(FINE_LINEAR_DEFLECTION, COARSE_LINEAR_RATIO * max(dims)), COARSE_ANGULAR_DEFLECTION
+
+
+def fine_deflection():
+    return FINE_LINEAR_DEFLECTION, FINE_ANGULAR_DEFLECTION
+
+
+def is_planar(face):
+    return BRepAdaptor_Surface(face).GetType() == GeomAbs_Plane
+
+
+def query_needs_fine(face):
+    """Whether ray queries against face need its fine mesh."""
+    return not is_planar(face)
+
+
+def query_uses_coarse(face):
+    """Whether ray queries against face use its coarse mesh, planar faces with curved edges.
+
+    The coarse mesh of a planar face with straight edges only would be the same as its fine one.
+    """
+    if coarse_deflection() == fine_deflection() or not is_planar(face):
+        return False
+
+    return any(BRepAdaptor_Curve(edge).GetType() != GeomAbs_Line for edge in occ_utils.list_edge(face))
@@ -8,6 +8,8 @@ import random
 import os
 import sys
 
+import numpy as np
+
 from OCC.Core.TopExp import TopExp_Explorer, topexp, topexp_MapShapesAndAncestors
 from OCC.Core.TopAbs import TopAbs_FACE, TopAbs_REVERSED, TopAbs_EDGE, TopAbs_VERTEX
 from OCC.Core.TopoDS import topods, TopoDS_Shape, TopoDS_Vertex, TopoDS_Edge, TopoDS_Face
@@ -29,6 +31,9 @@ from OCC.Core.TopOpeBRepBuild import TopOpeBRepBuild_Tools
 from OCC.Display import SimpleGui
 from OCC.Extend.TopologyUtils import TopologyExplorer, WireExplorer
 import Utils.geom_utils as geom_utils
+import Utils.logs as logs
+
+logger = logs.get_logger(__name__)
 
 SURFACE_TYPE = ['plane', 'cylinder', 'cone', 'sphere', 'torus', 'bezier', 'bspline', 'revolution', 'extrusion', 'offset', 'other']
 CURVE_TYPE = ['line', 'circle', 'ellipse', 'hyperbola', 'parabola', 'bezier', 'bspline', 'offset', 'other']
@@ -110,7 +115,7 @@ def as_occ(pnt, occ_type):
     
 def type_face(face):
     if type(face) is not TopoDS_Face:
-        print(face, 'not face')
+        logger.debug('%s not face', face)
         return None
         
     surf_adaptor = BRepAdaptor_Surface(face)        
@@ -154,21 +159,21 @@ def get_boundingbox(shape, tol=1e-6, use_mesh=True):
 '''
 input
     face: TopoDS_Face
+    rng: random.Random
 output
     P: gp_Pnt
     D: gp_Dir
 '''
-def sample_point(face):
+def sample_point(face, rng=random):
     #    randomly choose a point from F
     u_min, u_max, v_min, v_max = breptools_UVBounds(face)
-    u = random.uniform(u_min, u_max)
-    v = random.uniform(v_min, v_max)
+    u = rng.uniform(u_min, u_max)
+    v = rng.uniform(v_min, v_max)
 
     itool = IntTools_FClass2d(face, 1e-6)
     while itool.Perform(gp_Pnt2d(u,v)) != 0:
-        print('outside')
-        u = random.uniform(u_min, u_max)
-        v = random.uniform(v_min, v_max)
+        u = rng.uniform(u_min, u_max)
+        v = rng.uniform(v_min, v_max)
 
     P = BRepAdaptor_Surface(face).Value(u, v)
 
@@ -235,11 +240,11 @@ def dist_point_to_edge(pnt, edge):
     vert_maker = BRepBuilderAPI_MakeVertex(gp_Pnt(pnt[0], pnt[1], pnt[2]))
     dss = BRepExtrema_DistShapeShape(vert_maker.Vertex(), edge)
     if not dss.IsDone():
-        print('BRepExtrema_ExtPC not done')
+        logger.debug('BRepExtrema_ExtPC not done')
         return None, None
 
     if dss.NbSolution() < 1:
-        print('no nearest points found')
+        logger.debug('no nearest points found')
         return None, None
     return dss.Value(), as_list(dss.PointOnShape2(1))
 
@@ -255,7 +260,36 @@ def dist_point_to_edges(the_pnt, edges):
             min_d = dist
             nearest_pnt = pnt     
     return min_d, nearest_pnt
-    
+
+
+def triangulation_arrays(face):
+    """Triangulation of a meshed face as arrays.
+
+    :return: (nodes, Nx3 float64 in the global frame, triangles, Mx3 int32 of
+              0-based node indices in the order of the face triangulation)
+    """
+    aLoc = TopLoc_Location()
+    aTriangulation = BRep_Tool().Triangulation(face, aLoc)
+    num_nodes = aTriangulation.NbNodes()
+    num_triangles = aTriangulation.NbTriangles()
+
+    # the node and triangle arrays have no buffer interface, every element is one
+    # wrapper call, filled straight into the arrays without intermediate lists
+    node = aTriangulation.Nodes().Value
+    nodes = np.fromiter((coord for i in range(1, num_nodes + 1) for coord in node(i).Coord()),
+                        dtype=np.float64, count=3 * num_nodes).reshape(-1, 3)
+    triangle = aTriangulation.Triangles().Value
+    triangles = np.fromiter((index for i in range(1, num_triangles + 1) for index in triangle(i).Get()),
+                            dtype=np.int32, count=3 * num_triangles).reshape(-1, 3) - 1
+
+    if not aLoc.IsIdentity():
+        aTrsf = aLoc.Transformation()
+        trsf = np.array([[aTrsf.Value(row, col) for col in range(1, 5)] for row in range(1, 4)], dtype=np.float64)
+        nodes = nodes @ trsf[:, :3].T + trsf[:, 3]
+
+    return nodes, triangles
+
+
 '''
 input
     shape:          TopoDS_Shape
@@ -280,39 +314,23 @@ def triangulation_from_shape(shape):
     faces = list_face(shape)
     offset = 0
     for f in faces:
-        aLoc = TopLoc_Location()
-        aTriangulation = BRep_Tool().Triangulation(f, aLoc)
-        aTrsf = aLoc.Transformation()
-        aOrient = f.Orientation()
-
-        aNodes = aTriangulation.Nodes()
-        aUVNodes = aTriangulation.UVNodes()
-        aTriangles = aTriangulation.Triangles()
-        
-        for i in range(1, aTriangulation.NbNodes() + 1):
-            pt = aNodes.Value(i)
-            pt.Transform(aTrsf)
-            pts.append([pt.X(),pt.Y(),pt.Z()])
-            uv = aUVNodes.Value(i)
-            uvs.append([uv.X(),uv.Y()])
-        
-        for i in range(1, aTriangulation.NbTriangles() + 1):
-            n1, n2, n3 = aTriangles.Value(i).Get()
-            n1 -= 1
-            n2 -= 1
-            n3 -= 1
-            if aOrient == TopAbs_REVERSED:
-                tmp = n1
-                n1 = n2
-                n2 = tmp
-            n1 += offset
-            n2 += offset
-            n3 += offset
-            triangles.append([n1, n2, n3])
-            triangle_faces.append(f)
-        offset += aTriangulation.NbNodes()
-
-    return pts, uvs, triangles, triangle_faces
+        nodes, face_triangles = triangulation_arrays(f)
+        aUVNodes = BRep_Tool().Triangulation(f, TopLoc_Location()).UVNodes()
+        uvs.extend((aUVNodes.Value(i).X(), aUVNodes.Value(i).Y()) for i in range(1, len(nodes) + 1))
+
+        if f.Orientation() == TopAbs_REVERSED:
+            face_triangles = face_triangles[:, [1, 0, 2]]
+        pts.append(nodes)
+        triangles.append(face_triangles + offset)
+        triangle_faces.extend([f] * len(face_triangles))
+        offset += len(nodes)
+
+    pts = np.concatenate(pts) if pts else np.zeros((0, 3), dtype=np.float64)
+    uvs = np.array(uvs, dtype=np.float64).reshape(-1, 2)
+    triangles = np.concatenate(triangles) if triangles else np.zeros((0, 3), dtype=np.int32)
+
+    # built as arrays, returned as the lists callers expect
+    return pts.tolist(), uvs.tolist(), triangles.tolist(), triangle_faces
 
 
 def face_polygon(pnts):
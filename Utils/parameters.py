@@ -24,6 +24,20 @@ round_radius_max = 5.0
 chamfer_depth_min = 0.1 # 1
 chamfer_depth_max = 4.0 #4
 
+# Fastener Parameters
+fastener_dir = '.' # folder holding the bolt STEP files 26.stp ... 41.stp
+fastener_cache_dir = 'fastener_cache' # binary BRep copies of the bolt STEP files
+use_fastener_cache = True
+fastener_catalog = 'fastener_catalog.json' # per-fastener metadata, inside fastener_dir
+instanced_fasteners = False # write fasteners to STEP as assembly instances sharing one product
+fastener_lod = 0 # level of detail of the fasteners, see Utils/fastener_library.py
+fastener_lod_area_ratio = 0.002 # faces below this fraction of the fastener area are removed at LOD 2
+
+# Output Parameters
+output_backend = 'directory' # 'directory' one file per member, 'shards' tar shards, see Utils/sample_writer.py
+shard_size_mb = 1024 # a worker starts a new shard once its current one reaches this size
+async_writer = False # geometry workers spool BReps, STEP files are written by a writer pool
+
 # Possible Machining Features
 feat_names = ['chamfer', #0
               'through_hole', #1
@@ -0,0 +1,175 @@
+"""Live metrics of a generation run.
+
+The driver accounts every recorded sample and rewrites, at most every interval
+seconds, two files in the dataset directory:
+
+    metrics.json   all metrics, for scripts and `watch cat`
+    metrics.prom   the same in Prometheus text format, e.g. for the node
+                   exporter textfile collector
+
+Both are written to a temporary file and renamed, a reader never sees a
+partial file.
+"""
+import collections
+import json
+import os
+import socket
+import time
+
+from Utils.scheduler import rss_mb
+
+# samples/sec is also reported over this recent window
+RATE_WINDOW_SECONDS = 300
+
+
+def _write_atomic(pathname, text):
+    tmp_path = '{}.{}.tmp'.format(pathname, os.getpid())
+    with open(tmp_path, 'w', encoding='utf8') as fp:
+        fp.write(text)
+    os.replace(tmp_path, pathname)
+
+
+def failure_reason(reason):
+    """Failure reason without its message, e.g. 'save_failed' for 'save_failed: cannot write'."""
+    if reason is None:
+        return 'unknown'
+
+    return str(reason).split(':')[0].strip() or 'unknown'
+
+
+def _prom_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+
+class RunMetrics:
+    def __init__(self, dataset_dir, total=None, remaining=None, interval=10.0):
+        """
+        :param dataset_dir: directory the metrics files are written to
+        :param total: number of samples the run records, None when unknown
+        :param remaining: callable giving the number of samples still to be generated,
+                          when the run goes on until a number of samples is done
+        :param interval: minimum time between two rewrites of the metrics files
+        """
+        self.json_path = os.path.join(dataset_dir, 'metrics.json')
+        self.prom_path = os.path.join(dataset_dir, 'metrics.prom')
+        self.total = total
+        self.remaining = remaining
+        self.interval = interval
+        self.started = time.time()
+        self.last_write = 0.0
+        self.done = 0
+        self.failed = 0
+        self.failures = collections.Counter()
+        # (time, done) of the samples recorded within the rate window
+        self.recent = collections.deque()
+
+    def record(self, result):
+        now = time.time()
+        done = result['status'] == 'done'
+        if done:
+            self.done += 1
+        else:
+            self.failed += 1
+            self.failures[failure_reason(result.get('reason'))] += 1
+        self.recent.append((now, done))
+        while now - self.recent[0][0] > RATE_WINDOW_SECONDS:
+            self.recent.popleft()
+
+    def _eta(self, now):
+        """(remaining samples, seconds to go) from the rate over the recent window."""
+        if self.remaining is not None:
+            # samples to be done, counted at the rate of done samples
+            remaining = self.remaining()
+            counted = sum(1 for _, done in self.recent if done)
+        elif self.total is not None:
+            remaining = max(0, self.total - self.done - self.failed)
+            counted = len(self.recent)
+        else:
+            return None, None
+        window = min(now - self.started, RATE_WINDOW_SECONDS)
+        if remaining == 0:
+            return 0, 0.0
+        if counted == 0 or window <= 0:
+            return remaining, None
+
+        return remaining, remaining * window / counted
+
+    def snapshot(self, pool=None, pending_writes=0):
+        now = time.time()
+        elapsed = now - self.started
+        window = min(elapsed, RATE_WINDOW_SECONDS)
+        recent_done = sum(1 for _, done in self.recent if done)
+        remaining, eta = self._eta(now)
+
+        metrics = {'host': socket.gethostname(),
+                   'pid': os.getpid(),
+                   'time': now,
+                   'elapsed_seconds': elapsed,
+                   'samples_done': self.done,
+                   'samples_failed': self.failed,
+                   'failures_by_reason': dict(self.failures),
+                   'samples_per_second': self.done / max(elapsed, 1e-9),
+                   'recent_samples_per_second': recent_done / max(window, 1e-9),
+                   'pending_writes': pending_writes,
+                   'driver_rss_mb': rss_mb(),
+                   'total': self.total,
+                   'remaining': remaining,
+                   'eta_seconds': eta}
+
+        if pool is not None:
+            metrics['worker_utilization'] = pool.utilization()
+            metrics['workers'] = pool.worker_stats()
+            metrics['timeouts'] = pool.num_timeouts
+            metrics['workers_recycled'] = pool.num_recycled
+
+        return metrics
+
+    def prometheus(self, metrics):
+        lines = []
+
+        def gauge(name, help_text, samples):
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} gauge'.format(name))
+            for labels, value in samples:
+                if value is None:
+                    continue
+                label_text = ','.join('{}="{}"'.format(key, _prom_label(val)) for key, val in labels.items())
+                lines.append('{}{} {}'.format(name, '{' + label_text + '}' if label_text else '', value))
+
+        gauge('aag_samples', 'Samples recorded by the run.',
+              [({'status': 'done'}, metrics['samples_done']), ({'status': 'failed'}, metrics['samples_failed'])])
+        gauge('aag_failures', 'Failed samples by reason.',
+              [({'reason': reason}, count) for reason, count in sorted(metrics['failures_by_reason'].items())])
+        gauge('aag_samples_per_second', 'Done samples per second since the start of the run.',
+              [({}, metrics['samples_per_second'])])
+        gauge('aag_recent_samples_per_second', 'Done samples per second over the recent window.',
+              [({}, metrics['recent_samples_per_second'])])
+        gauge('aag_remaining_samples', 'Samples left to record.', [({}, metrics['remaining'])])
+        gauge('aag_eta_seconds', 'Estimated time to the end of the run.', [({}, metrics['eta_seconds'])])
+        gauge('aag_pending_writes', 'Samples waiting for the writer stage.', [({}, metrics['pending_writes'])])
+        gauge('aag_driver_rss_bytes', 'Resident memory of the driver.',
+              [({}, None if metrics['driver_rss_mb'] is None else metrics['driver_rss_mb'] * 1024 * 1024)])
+        if 'workers' in metrics:
+            gauge('aag_pool_utilization', 'Share of the pool worker time spent on samples.',
+                  [({}, metrics['worker_utilization'])])
+            gauge('aag_worker_utilization', 'Share of the time of each worker spent on samples.',
+                  [({'pid': worker['pid']}, worker['utilization']) for worker in metrics['workers']])
+            gauge('aag_worker_rss_bytes', 'Resident memory of the workers.',
+                  [({'pid': worker['pid']}, None if worker['rss_mb'] is None else worker['rss_mb'] * 1024 * 1024)
+                   for worker in metrics['workers']])
+            gauge('aag_timeouts', 'Samples killed for overrunning their time budget.', [({}, metrics['timeouts'])])
+            gauge('aag_workers_recycled', 'Workers replaced after their task or memory limit.',
+                  [({}, metrics['workers_recycled'])])
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self, pool=None, pending_writes=0):
+        metrics = self.snapshot(pool, pending_writes)
+        _write_atomic(self.json_path, json.dumps(metrics, indent=4, ensure_ascii=False))
+        _write_atomic(self.prom_path, self.prometheus(metrics))
+        self.last_write = time.time()
+
+    def maybe_write(self, pool=None, pending_writes=0):
+        """Rewrite the metrics files when the last write is older than the interval."""
+        if time.time() - self.last_write >= self.interval:
+            self.write(pool, pending_writes)
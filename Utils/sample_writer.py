@@ -0,0 +1,261 @@
+"""Output backends of dataset generation.
+
+A sample is a set of members, archive names relative to the dataset directory
+(steps/<name>.step, labels/<name>.json, label1s/<name>.json), each given as
+bytes or as the pathname of a scratch file written by OCC.
+
+    DirectoryWriter  one file per member, the original dataset layout
+    ShardWriter      appends samples to size-bounded tar shards in shards/, one
+                     shard at a time per process, with an offset index
+
+Shards are plain tar files, so they can be listed and unpacked with tar. Every
+shard <shard>.tar has an index <shard>.idx.jsonl, one line per member written
+once the member is flushed to the shard:
+
+    {"sample": name, "member": archive name, "offset": data offset, "size": bytes}
+
+The index is authoritative: a shard of a worker killed while writing ends with
+a torn member which is not indexed. Reading a member is one seek and one read.
+"""
+import collections
+import io
+import json
+import multiprocessing
+import os
+import socket
+import tarfile
+import time
+from multiprocessing.util import Finalize
+
+import Utils.parameters as param
+
+SHARD_DIR = 'shards'
+SCRATCH_DIR = '.scratch'
+
+
+class DirectoryWriter:
+    def __init__(self, dataset_dir, subdirs=('steps', 'labels', 'label1s')):
+        self.dataset_dir = dataset_dir
+        self.scratch_dir = os.path.join(dataset_dir, SCRATCH_DIR)
+        for subdir in subdirs + (SCRATCH_DIR,):
+            os.makedirs(os.path.join(dataset_dir, subdir), exist_ok=True)
+
+    def scratch_path(self, filename):
+        """Pathname for a member written by a library that only writes to files."""
+        return os.path.join(self.scratch_dir, '{}-{}'.format(os.getpid(), filename))
+
+    def add_sample(self, name, members):
+        """Write the members of a sample.
+
+        :param name: sample name
+        :param members: {archive name: bytes or scratch pathname}
+        """
+        for arcname, data in members.items():
+            pathname = os.path.join(self.dataset_dir, arcname)
+            if isinstance(data, str):
+                os.replace(data, pathname)
+            else:
+                with open(pathname, 'wb') as fp:
+                    fp.write(data)
+
+    def close(self):
+        pass
+
+
+class ShardWriter:
+    def __init__(self, dataset_dir, max_shard_bytes, prefix=None):
+        """
+        :param dataset_dir: dataset directory, shards are written to its shards folder
+        :param max_shard_bytes: a new shard is started once the current one reaches this size
+        :param prefix: shard name prefix, unique per writing process by default
+        """
+        self.dataset_dir = dataset_dir
+        self.shard_dir = os.path.join(dataset_dir, SHARD_DIR)
+        self.scratch_dir = os.path.join(dataset_dir, SCRATCH_DIR)
+        os.makedirs(self.shard_dir, exist_ok=True)
+        os.makedirs(self.scratch_dir, exist_ok=True)
+
+        self.max_shard_bytes = max_shard_bytes
+        if prefix is None:
+            prefix = '{}-{}-{}'.format(socket.gethostname(), os.getpid(), time.strftime("%Y%m%d_%H%M%S"))
+        self.prefix = prefix
+        self.num_shards = 0
+        self.tar = None
+        self.index = None
+
+    def scratch_path(self, filename):
+        return os.path.join(self.scratch_dir, '{}-{}'.format(os.getpid(), filename))
+
+    def _open_shard(self):
+        shard_name = '{}-{:05d}'.format(self.prefix, self.num_shards)
+        self.num_shards += 1
+        self.tar = tarfile.open(os.path.join(self.shard_dir, shard_name + '.tar'), 'w', format=tarfile.GNU_FORMAT)
+        self.index = open(os.path.join(self.shard_dir, shard_name + '.idx.jsonl'), 'w', encoding='utf8')
+
+    def _close_shard(self):
+        if self.tar is not None:
+            self.tar.close()
+            self.index.close()
+        self.tar = None
+        self.index = None
+
+    def _add_member(self, name, arcname, data):
+        info = tarfile.TarInfo(arcname)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        # header (with GNU long name blocks) precedes the data
+        offset = self.tar.offset + len(info.tobuf(self.tar.format, self.tar.encoding, self.tar.errors))
+        self.tar.addfile(info, io.BytesIO(data))
+        self.tar.fileobj.flush()
+
+        return {'sample': name, 'member': arcname, 'offset': offset, 'size': len(data)}
+
+    def add_sample(self, name, members):
+        """Append the members of a sample to the current shard.
+
+        :param name: sample name
+        :param members: {archive name: bytes or scratch pathname}
+        """
+        if self.tar is None or self.tar.offset >= self.max_shard_bytes:
+            self._close_shard()
+            self._open_shard()
+
+        records = []
+        for arcname, data in members.items():
+            if isinstance(data, str):
+                with open(data, 'rb') as fp:
+                    content = fp.read()
+                os.remove(data)
+            else:
+                content = data
+            records.append(self._add_member(name, arcname, content))
+
+        # a sample is indexed once all its members are in the shard
+        self.index.write(''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records))
+        self.index.flush()
+
+    def close(self):
+        self._close_shard()
+
+
+def make_writer(dataset_dir):
+    """Output backend selected by param.output_backend."""
+    if param.output_backend == 'directory':
+        return DirectoryWriter(dataset_dir)
+    elif param.output_backend == 'shards':
+        return ShardWriter(dataset_dir, int(param.shard_size_mb * 1024 * 1024))
+    else:
+        raise ValueError('unknown output backend {}'.format(param.output_backend))
+
+
+# writer of the current process, shards are never shared between processes
+_writer = None
+_writer_pid = None
+
+
+def get_writer(dataset_dir):
+    global _writer, _writer_pid
+    if _writer is None or _writer_pid != os.getpid():
+        _writer = make_writer(dataset_dir)
+        _writer_pid = os.getpid()
+
+    return _writer
+
+
+def close_writer():
+    """Close the writer of the current process, finishing its shard."""
+    global _writer
+    if _writer is not None and _writer_pid == os.getpid():
+        _writer.close()
+    _writer = None
+
+
+def _init_writer_process(initializer):
+    if initializer is not None:
+        initializer()
+    # pool processes exit through the multiprocessing finalizers, which finish the shard
+    Finalize(None, close_writer, exitpriority=10)
+
+
+class WriterPool:
+    """Output stage running func in dedicated writer processes.
+
+    Geometry workers hand over spooled samples, the driver submits them here and
+    collects the finished writes, so output overlaps with generation.
+
+    :param func: function of one submitted argument, raises when the write fails
+    :param num_writers: number of writer processes
+    :param max_pending: submitted writes above which collect waits for the oldest one
+    :param initializer: called without arguments at the start of every writer
+    """
+    def __init__(self, func, num_writers, max_pending=None, initializer=None):
+        self.func = func
+        self.max_pending = 2 * num_writers if max_pending is None else max_pending
+        self.pool = multiprocessing.Pool(num_writers, initializer=_init_writer_process, initargs=(initializer,))
+        self.pending = collections.deque()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def submit(self, key, args):
+        self.pending.append((key, self.pool.apply_async(self.func, (args,))))
+
+    def collect(self, wait_all=False, wait_one=False):
+        """Finished writes as [(key, error)], error is None on success.
+
+        Waits for the oldest writes while more than max_pending are in flight, for
+        all of them with wait_all, or for at least one with wait_one.
+        """
+        done = []
+        while self.pending:
+            key, async_result = self.pending[0]
+            must_wait = wait_all or len(self.pending) > self.max_pending or (wait_one and not done)
+            if not must_wait and not async_result.ready():
+                break
+            self.pending.popleft()
+            try:
+                async_result.get()
+                done.append((key, None))
+            except Exception as e:
+                done.append((key, '{}: {}'.format(type(e).__name__, e)))
+
+        return done
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def terminate(self):
+        self.pool.terminate()
+        self.pool.join()
+
+
+def read_shard_index(dataset_dir):
+    """Index of all shards of a dataset.
+
+    :return: {sample name: {archive name: (shard pathname, offset, size)}}
+    """
+    shard_dir = os.path.join(dataset_dir, SHARD_DIR)
+    samples = {}
+    for filename in sorted(os.listdir(shard_dir)):
+        if not filename.endswith('.idx.jsonl'):
+            continue
+        shard_path = os.path.join(shard_dir, filename[:-len('.idx.jsonl')] + '.tar')
+        with open(os.path.join(shard_dir, filename), 'r', encoding='utf8') as fp:
+            for line in fp:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                samples.setdefault(record['sample'], {})[record['member']] = \
+                    (shard_path, record['offset'], record['size'])
+
+    return samples
+
+
+def read_member(location):
+    """Content of a member located by read_shard_index."""
+    shard_path, offset, size = location
+    with open(shard_path, 'rb') as fp:
+        fp.seek(offset)
+        return fp.read(size)
@@ -0,0 +1,292 @@
+"""Process pool for dataset generation with per-sample time and memory limits.
+
+multiprocessing.pool.Pool cannot interrupt a task, a single OCC operation that
+never returns blocks its worker for the rest of the run, and the memory OCC
+keeps across tasks is only given back when the worker exits. SampleScheduler
+runs every worker as its own process fed through a pipe, so the parent can:
+
+    kill the worker of a sample that overruns its wall-clock budget and
+    start a new one in its place, the sample is reported with error 'timeout'
+    retire a worker after max_tasks_per_worker samples, or as soon as its
+    resident memory passes max_rss_mb, and start a fresh one
+    cancel the samples in flight once enough samples are done
+"""
+import multiprocessing
+import os
+import time
+from multiprocessing.connection import wait
+
+TIMEOUT = 'timeout'
+CANCELLED = 'cancelled'
+
+
+def rss_mb(pid='self'):
+    """Resident memory of a process, the calling one by default, in MB, None when unknown."""
+    try:
+        with open('/proc/{}/statm'.format(pid), 'r') as fp:
+            resident_pages = int(fp.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+
+def _worker_loop(conn, func, initializer, initargs, finalizer, max_tasks, max_rss):
+    if initializer is not None:
+        initializer(*initargs)
+
+    num_tasks = 0
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+
+        try:
+            result, error = func(task), None
+        except Exception as e:
+            result, error = None, '{}: {}'.format(type(e).__name__, e)
+        num_tasks += 1
+
+        rss = rss_mb()
+        retire = (max_tasks is not None and num_tasks >= max_tasks) or \
+                 (max_rss is not None and rss is not None and rss > max_rss)
+        conn.send((result, error, retire))
+        if retire:
+            break
+
+    if finalizer is not None:
+        finalizer()
+    conn.close()
+
+
+class _Worker:
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.task = None
+        self.started = None
+        self.created = time.monotonic()
+        self.busy_seconds = 0.0
+        self.num_tasks = 0
+
+    def busy(self, now):
+        """Time spent on tasks, including the current one."""
+        if self.task is None:
+            return self.busy_seconds
+
+        return self.busy_seconds + now - self.started
+
+    def release(self, now):
+        self.busy_seconds += now - self.started
+        self.num_tasks += 1
+        self.task = None
+
+
+class SampleScheduler:
+    """Run func over tasks in worker processes, yielding results as they complete.
+
+    :param func: function of one task, must be picklable for spawn start methods
+    :param num_workers: number of worker processes
+    :param timeout: wall-clock budget of one task in seconds, None for no limit
+    :param max_tasks_per_worker: tasks run by a worker before it is replaced, None for no limit
+    :param max_rss_mb: resident memory in MB above which a worker is replaced, None for no limit
+    :param initializer: called with initargs at the start of every worker
+    :param finalizer: called when a worker stops or retires, not when it is killed
+    :param on_tick: called from run at least every tick_interval seconds, e.g. to report progress
+    :param on_idle: called from run when tasks yields None while no task is running, run
+                    asks tasks again when it returns True and ends otherwise
+    """
+    def __init__(self, func, num_workers, timeout=None, max_tasks_per_worker=None, max_rss_mb=None,
+                 initializer=None, initargs=(), finalizer=None, on_tick=None, tick_interval=5.0,
+                 on_idle=None):
+        self.func = func
+        self.num_workers = num_workers
+        self.timeout = timeout
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.max_rss_mb = max_rss_mb
+        self.initializer = initializer
+        self.initargs = initargs
+        self.finalizer = finalizer
+        self.on_tick = on_tick
+        self.tick_interval = tick_interval
+        self.on_idle = on_idle
+        self.workers = []
+        self.started = None
+        # busy time of the workers that were replaced
+        self.retired_busy_seconds = 0.0
+        self.num_timeouts = 0
+        self.num_recycled = 0
+        self.cancelled = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+
+    def _start_worker(self):
+        parent_conn, child_conn = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=_worker_loop,
+                                          args=(child_conn, self.func, self.initializer, self.initargs,
+                                                self.finalizer, self.max_tasks_per_worker, self.max_rss_mb),
+                                          daemon=True)
+        process.start()
+        child_conn.close()
+        worker = _Worker(process, parent_conn)
+        self.workers.append(worker)
+
+        return worker
+
+    def _stop_worker(self, worker, kill=False):
+        if kill:
+            worker.process.kill()
+        worker.process.join()
+        worker.conn.close()
+        self.workers.remove(worker)
+        self.retired_busy_seconds += worker.busy(time.monotonic())
+
+    def _submit(self, worker, task):
+        worker.task = task
+        worker.started = time.monotonic()
+        worker.conn.send(task)
+
+    def _receive(self, worker):
+        """(result, error) sent by a worker, the worker is stopped when it retires or died."""
+        try:
+            result, error, retire = worker.conn.recv()
+        except EOFError:
+            # worker crashed inside OCC, no exception reached python
+            worker.process.join()
+            result, error, retire = None, 'worker died with exit code {}'.format(
+                worker.process.exitcode), True
+        if retire:
+            self.num_recycled += 1
+            self._stop_worker(worker)
+
+        return result, error
+
+    def _wait_timeout(self, busy):
+        wait_timeout = self.tick_interval if self.on_tick is not None else None
+        if self.timeout is None:
+            return wait_timeout
+        now = time.monotonic()
+        deadline = max(0.0, min(worker.started + self.timeout - now for worker in busy))
+
+        return deadline if wait_timeout is None else min(deadline, wait_timeout)
+
+    def utilization(self):
+        """Share of the worker time of the current run spent on tasks."""
+        if self.started is None:
+            return 0.0
+        now = time.monotonic()
+        busy = self.retired_busy_seconds + sum(worker.busy(now) for worker in self.workers)
+
+        return busy / max(self.num_workers * (now - self.started), 1e-9)
+
+    def worker_stats(self):
+        """Busy share, task count and resident memory of the live workers."""
+        now = time.monotonic()
+        return [{'pid': worker.process.pid,
+                 'utilization': worker.busy(now) / max(now - worker.created, 1e-9),
+                 'tasks': worker.num_tasks,
+                 'busy': worker.task is not None,
+                 'rss_mb': rss_mb(worker.process.pid)} for worker in self.workers]
+
+    def run(self, tasks):
+        """Yield (task, result, error) for every task, in completion order.
+
+        error is None on success, TIMEOUT when the task overran its budget,
+        CANCELLED when it was in flight when cancel was called, and a description
+        of the exception or of the worker crash otherwise.
+
+        tasks may yield None when no task is to be started for now, it is asked
+        again once a running task completes, or once on_idle returns True when
+        no task is running.
+        """
+        tasks = iter(tasks)
+        exhausted = False
+        self.cancelled = False
+        self.started = time.monotonic()
+        self.retired_busy_seconds = 0.0
+        while len(self.workers) < self.num_workers:
+            self._start_worker()
+
+        while True:
+            for worker in self.workers:
+                if worker.task is not None or exhausted or self.cancelled:
+                    continue
+                try:
+                    task = next(tasks)
+                except StopIteration:
+                    exhausted = True
+                    continue
+                if task is None:
+                    break
+                self._submit(worker, task)
+
+            busy = [worker for worker in self.workers if worker.task is not None]
+            if self.cancelled:
+                # workers are started again by the next run, not to be closed right away
+                for worker in busy:
+                    task = worker.task
+                    worker.release(time.monotonic())
+                    if worker.conn.poll():
+                        # finished already, its result is not thrown away
+                        yield (task,) + self._receive(worker)
+                    else:
+                        self._stop_worker(worker, kill=True)
+                        yield task, None, CANCELLED
+                break
+            if not busy:
+                if exhausted or self.on_idle is None or not self.on_idle():
+                    break
+                continue
+
+            ready = wait([worker.conn for worker in busy], self._wait_timeout(busy))
+            if self.on_tick is not None:
+                self.on_tick()
+            now = time.monotonic()
+            for worker in busy:
+                task = worker.task
+                if worker.conn in ready:
+                    worker.release(now)
+                    result, error = self._receive(worker)
+                    if worker not in self.workers:
+                        self._start_worker()
+                    yield task, result, error
+                elif self.timeout is not None and now - worker.started >= self.timeout:
+                    self.num_timeouts += 1
+                    worker.release(now)
+                    self._stop_worker(worker, kill=True)
+                    self._start_worker()
+                    yield task, None, TIMEOUT
+                if self.cancelled:
+                    break
+
+    def cancel(self):
+        """Stop handing out tasks, run kills the tasks in flight and ends.
+
+        Results that are already waiting are still yielded, the killed workers
+        are only replaced by the next run.
+        """
+        self.cancelled = True
+
+    def close(self):
+        """Stop the workers once they are done with their current task."""
+        for worker in list(self.workers):
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+            self._stop_worker(worker)
+
+    def terminate(self):
+        """Kill the workers immediately."""
+        for worker in list(self.workers):
+            self._stop_worker(worker, kill=True)
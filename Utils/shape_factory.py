@@ -26,6 +26,10 @@ from OCC.Core.GeomLProp import GeomLProp_SLProps
 from OCC.Core.TopAbs import TopAbs_FORWARD, TopAbs_REVERSED
 
 import Utils.occ_utils as occ_utils
+import Utils.timing as timing
+import Utils.logs as logs
+
+logger = logs.get_logger(__name__)
 
 DRAIN_R = 10.0
 DRAIN_S = 0.5
@@ -68,13 +72,15 @@ def wire_triangle3():
     return wire
 
 
-def wire_triangle2():
+def wire_triangle2(rng=random):
     '''
         isosceles triangle
+    input
+        rng:    random.Random
     output
         w:  TopoDS_Wire
     '''
-    ang = random.gauss(2*pi/3, pi/6)
+    ang = rng.gauss(2*pi/3, pi/6)
     amin = pi / 3
     amax = 5 * pi / 6
     if ang > amax:
@@ -189,13 +195,14 @@ def len_seq_natural(pos, pos_list):
     return j - i
 
 
-def list_wire_combo(num_cell, ang, offset, radius):
+def list_wire_combo(num_cell, ang, offset, radius, rng=random):
     '''
     input
        nc:              int, number of cells to be combined
        ang:             float, angle between adjaent cells
        offset:          float, offset angle of start position
        ri:              float, radius of this ring
+       rng:             random.Random
     output
         wlist:          {TopoDS_Wire: string}
         combo_name:     ''
@@ -206,14 +213,14 @@ def list_wire_combo(num_cell, ang, offset, radius):
     pos_len_name = {}
     while len(pos_list) > 0:
 #       1 choose a random location
-        pos = random.choice(pos_list)
+        pos = rng.choice(pos_list)
 
 #       2 choose a random length
         len_seq = len_seq_natural(pos, pos_list)
-        len_seq = random.randrange(1, len_seq + 1)
+        len_seq = rng.randrange(1, len_seq + 1)
 
 #       3 choose a random shape
-        func = random.choice(FLIST)
+        func = rng.choice(FLIST)
 #        print(pos_list, pos, l, fname[FLIST.index(func)])
         trsf_scale = gp_Trsf()
         trsf_scale.SetScale(DRAIN_RCS.Location(), DRAIN_S)
@@ -233,7 +240,7 @@ def list_wire_combo(num_cell, ang, offset, radius):
                         offset + (pos + len_seq -1) * ang)
             wire = wire_sweep_circle(cir1, cir2)
         elif func != wire_sweep_circle and len_seq == 1:
-            wire = func()
+            wire = wire_triangle2(rng) if func == wire_triangle2 else func()
             bresp_trsf = BRepBuilderAPI_Transform(wire, trsf_scale)
             wire = topods.Wire(bresp_trsf.Shape())
             bresp_trsf = BRepBuilderAPI_Transform(wire, trsf_trans)
@@ -255,8 +262,10 @@ def list_wire_combo(num_cell, ang, offset, radius):
     return wlist, combo_name
 
 
-def list_wire_random():
+def list_wire_random(rng=random):
     '''
+    input
+        rng:        random.Random
     output
         wires:      {TopoDS_Wire:string}
         wire_name:  ''
@@ -275,16 +284,16 @@ def list_wire_random():
 
 #        randomly choose the number of cells to combine
         combo_list = range(1, nump // 3 + 1)
-        combo = random.choice(combo_list)
+        combo = rng.choice(combo_list)
 #        angle between two adjacent cells
         ang = 2 * pi / nump
 #        randomly offset the start cell
-        offset = random.gauss(ang / 2, ang / 2)
+        offset = rng.gauss(ang / 2, ang / 2)
         if offset < 0.:
             offset = 0.
         if offset > ang:
             offset = ang
-        wlist, combo_name = list_wire_combo(combo, ang, offset, radius)
+        wlist, combo_name = list_wire_combo(combo, ang, offset, radius, rng)
         wires.update(wlist)
         wire_name += str(combo) + '(' + combo_name + ')'
         nump = nump // combo
@@ -320,6 +329,7 @@ def face_bottom(shape):
     return face
 
 
+@timing.timed('face_map')
 def map_face_before_and_after_feat(base, feature_maker):
     '''
     input
@@ -379,6 +389,7 @@ def same_shape_in_list(the_shape, slist):
     return None
 
     
+@timing.timed('label_map')
 def map_from_shape_and_name(fmap, old_labels, new_shape, new_name, feature_dir=None):
     '''
     input
@@ -423,7 +434,7 @@ def map_from_shape_and_name(fmap, old_labels, new_shape, new_name, feature_dir=N
         for samef in fmap[oldf]:      # samef = [<class 'TopoDS_Face'>]     
             samef = same_shape_in_list(samef, new_faces)            
             if samef is None:
-                print('no same face')
+                logger.debug('no same face')
                 continue
             # update segmantic label
             new_map[samef] = old_seg_name
@@ -454,14 +465,14 @@ def map_from_shape_and_name(fmap, old_labels, new_shape, new_name, feature_dir=N
             for old_face in ins_label[ins_idx]:
     
                 if old_face not in fmap:
-                    print('mssing old face, which may be deleted')
+                    logger.debug('mssing old face, which may be deleted')
                     continue
         
                 for same_face in fmap[old_face]:        
                 
                     same_face = same_shape_in_list(same_face, new_faces_backup)            
                     if same_face is None:
-                        print('no same face')
+                        logger.debug('no same face')
                         continue
                     new_inst.append(same_face)
             ins_label[ins_idx] = new_inst
@@ -471,20 +482,20 @@ def map_from_shape_and_name(fmap, old_labels, new_shape, new_name, feature_dir=N
     return new_map, ins_label, new_bottom_label
 
 
-def shape_multiple_hole_feats(base, wlist):
+def shape_multiple_hole_feats(base, wlist, rng=random):
     '''
         one face and one hole feature for each wire
     input
         base:       TopoDS_Shape
         wlist:      {TopoDS_Wire:string}
+        rng:        random.Random
     output
         base:       TopoDS_Shape
         name_map:   {TopoDS_Face:int}
         ftype:      ''
     '''
     b_face = face_bottom(base)
-    random.shuffle(FEAT_TYPE)
-    ftype = random.choice(FEAT_TYPE)
+    ftype = rng.choice(FEAT_TYPE)
     if ftype == 'hole':
         direction = DRAIN_RCS.Direction()
         fuse = False
@@ -536,8 +547,10 @@ def shape_base_drain():
     return shape
 
 
-def shape_drain():
+def shape_drain(rng=random):
     '''
+    input
+        rng:            random.Random
     output
         shape:          TopoDS_Shape
         face_map:       {TopoDS_Face: int}
@@ -545,15 +558,14 @@ def shape_drain():
         shape_name:     ''
     '''
 #    print('shape_drain')
-    random.seed()
 #    step1, create the base
     base = shape_base_drain()
 
 #    step2, create wires for holes
-    wlist, wire_name = list_wire_random()
+    wlist, wire_name = list_wire_random(rng)
 
 #    step3, add hole feature from wire
-    shape, name_map, feat_name = shape_multiple_hole_feats(base, wlist)
+    shape, name_map, feat_name = shape_multiple_hole_feats(base, wlist, rng)
 
     shape_name = feat_name + '-' + wire_name
 
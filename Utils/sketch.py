@@ -4,61 +4,19 @@ import numpy as np
 
 from OCC.Core.BRepBuilderAPI import BRepBuilderAPI_MakeEdge, BRepBuilderAPI_MakeWire, BRepBuilderAPI_MakeFace
 from OCC.Core.gp import gp_Circ, gp_Ax2, gp_Pnt, gp_Dir
-from OCC.Core.BRep import BRep_Tool
-from OCC.Core.TopLoc import TopLoc_Location
 from OCC.Core.GC import GC_MakeSegment, GC_MakeArcOfCircle
 from OCC.Core.Geom import Geom_Circle
 
 import Utils.occ_utils as occ_utils
+import Utils.mesh_manager as mesh_manager
 
 
 def triangulation_from_face(face):
-    aLoc = TopLoc_Location()
-    aTriangulation = BRep_Tool().Triangulation(face, aLoc).GetObject()
-    aTrsf = aLoc.Transformation()
-
-    aNodes = aTriangulation.Nodes()
-    aTriangles = aTriangulation.Triangles()
-
-    pts = []
-    for i in range(1, aTriangulation.NbNodes() + 1):
-        pt = aNodes.Value(i)
-        pt.Transform(aTrsf)
-        pts.append([pt.X(), pt.Y(), pt.Z()])
-
-    triangles = []
-    vt_map = {}
-    et_map = {}
-    for i in range(1, aTriangulation.NbTriangles() + 1):
-        n1, n2, n3 = aTriangles.Value(i).Get()
-        pids = [n1 - 1, n2 - 1, n3 - 1]
-        pids.sort()
-        triangles.append((pids[0], pids[1], pids[2]))
-
-        for pid in pids:
-            if pid in vt_map:
-                vt_map[pid].append(i -1)
-            else:
-                vt_map[pid] = [i-1]
-
-        edges = [(pids[0], pids[1]), (pids[0], pids[2]), (pids[1], pids[2])]
-        for edge in edges:
-            if edge in et_map:
-                et_map[edge].append(i - 1)
-            else:
-                et_map[edge] = [i - 1]
-
-    return pts, triangles, vt_map, et_map
+    return mesh_manager.read_triangulation(face)
 
 
 def triangles_from_faces(faces):
-    tri_list = []
-    for face in faces:
-        pts, triangles, vt_map, et_map = triangulation_from_face(face)
-        for tri in triangles:
-            tri_list.append((pts[tri[0]], pts[tri[1]], pts[tri[2]]))
-
-    return tri_list
+    return mesh_manager.get_manager().triangles(faces)
 
 
 #==============================================================================
@@ -206,7 +164,7 @@ def face_circular_end_rect(ref_pnts):
     return face_maker.Face()
 
     
-def face_open_circular_end_rect_v(ref_pnts):
+def face_open_circular_end_rect_v(ref_pnts, rng=random):
     dir_w = ref_pnts[2] - ref_pnts[1]
     dir_h = ref_pnts[0] - ref_pnts[1]
     width = np.linalg.norm(dir_w)
@@ -214,7 +172,7 @@ def face_open_circular_end_rect_v(ref_pnts):
     if height - width / 2 > 1.0:
         radius = width / 2
     else:
-        radius = random.uniform(0.5, height / 2)
+        radius = rng.uniform(0.5, height / 2)
     
     offset = width / 2 - radius
     dir_w = dir_w / width
@@ -279,7 +237,7 @@ def face_open_circular_end_rect_h(ref_pnts):
     return face_maker.Face()
 
     
-def face_hexagon(ref_pnts):
+def face_hexagon(ref_pnts, rng=random):
     dir_w = ref_pnts[2] - ref_pnts[1]
     dir_h = ref_pnts[0] - ref_pnts[1]    
     width = np.linalg.norm(dir_w)
@@ -295,7 +253,7 @@ def face_hexagon(ref_pnts):
     
     circ = Geom_Circle(gp_Ax2(gp_Pnt(center[0], center[1], center[2]), normal), radius)
 
-    ang1 = random.uniform(0.0, math.pi / 3)
+    ang1 = rng.uniform(0.0, math.pi / 3)
     pt1 = occ_utils.as_list(circ.Value(ang1))
 
     ang2 = ang1 + math.pi / 3
@@ -316,7 +274,7 @@ def face_hexagon(ref_pnts):
     return occ_utils.face_polygon([pt1, pt2, pt3, pt4, pt5, pt6])
 
     
-def face_oring(ref_pnts):
+def face_oring(ref_pnts, rng=random):
     dir_w = ref_pnts[2] - ref_pnts[1]
     dir_h = ref_pnts[0] - ref_pnts[1]    
     width = np.linalg.norm(dir_w)
@@ -329,7 +287,7 @@ def face_oring(ref_pnts):
     outer_r = min(width / 2, height / 2)    
     center = (ref_pnts[0] + ref_pnts[1] + ref_pnts[2] + ref_pnts[3]) / 4
     
-    inner_r= random.uniform(outer_r / 3, outer_r - 0.2)
+    inner_r= rng.uniform(outer_r / 3, outer_r - 0.2)
 
     circ = gp_Circ(gp_Ax2(gp_Pnt(center[0], center[1], center[2]), normal), outer_r)
     edge = BRepBuilderAPI_MakeEdge(circ, 0., 2*math.pi).Edge()
@@ -346,11 +304,11 @@ def face_oring(ref_pnts):
     return face_maker.Face()
 
     
-def face_pentagon(ref_pnts):
+def face_pentagon(ref_pnts, rng=random):
     dir_l = ref_pnts[0] - ref_pnts[1]
     dir_r = ref_pnts[3] - ref_pnts[2]    
 
-    ratio = random.uniform(0.4, 0.8)
+    ratio = rng.uniform(0.4, 0.8)
     pt4 = (ref_pnts[0] + ref_pnts[3]) / 2    
     pt0 = ref_pnts[1] +  dir_l * ratio
     pt1 = ref_pnts[1]
@@ -360,13 +318,13 @@ def face_pentagon(ref_pnts):
     return occ_utils.face_polygon([pt0, pt1, pt2, pt3, pt4])
     
     
-def face_quad(ref_pnts):
+def face_quad(ref_pnts, rng=random):
     dir_l = ref_pnts[0] - ref_pnts[1]
     dir_r = ref_pnts[3] - ref_pnts[2]    
         
     mark = [0, 1]
-    random.shuffle(mark)
-    ratio = random.uniform(0.3, 0.6)
+    rng.shuffle(mark)
+    ratio = rng.uniform(0.3, 0.6)
     pt0 = ref_pnts[0] - dir_l * mark[0] * ratio
     pt1 = ref_pnts[1]
     pt2 = ref_pnts[2]
@@ -379,7 +337,7 @@ def face_rect(ref_pnts):
     return occ_utils.face_polygon(ref_pnts[:4])
 
     
-def face_triangle(ref_pnts):
+def face_triangle(ref_pnts, rng=random):
     dir_w = ref_pnts[2] - ref_pnts[1]
     dir_h = ref_pnts[0] - ref_pnts[1]    
     width = np.linalg.norm(dir_w)
@@ -395,15 +353,15 @@ def face_triangle(ref_pnts):
 
     circ = Geom_Circle(gp_Ax2(gp_Pnt(center[0], center[1], center[2]), normal), radius)
     
-    ang1 = random.uniform(0.0, 2 * math.pi / 3)
+    ang1 = rng.uniform(0.0, 2 * math.pi / 3)
     pt1 = occ_utils.as_list(circ.Value(ang1))
 
-    ang2 = ang1 + random.uniform(2 * math.pi / 3 - math.pi / 9, 2 * math.pi / 3 + math.pi / 9)
+    ang2 = ang1 + rng.uniform(2 * math.pi / 3 - math.pi / 9, 2 * math.pi / 3 + math.pi / 9)
     if ang2 > 2 * math.pi:
         ang2 = ang2 - 2 * math.pi
     pt2 = occ_utils.as_list(circ.Value(ang2))
 
-    ang3 = ang2 + random.uniform(2 * math.pi / 3 - math.pi / 9, 2 * math.pi / 3 + math.pi / 9)
+    ang3 = ang2 + rng.uniform(2 * math.pi / 3 - math.pi / 9, 2 * math.pi / 3 + math.pi / 9)
     if ang3 > 2 * math.pi:
         ang3 = ang3 - 2 * math.pi
     pt3 = occ_utils.as_list(circ.Value(ang3))
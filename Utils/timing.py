@@ -0,0 +1,221 @@
+"""Stage timers of the generation pipeline.
+
+Time spent in a stage is accounted with
+
+    with timing.stage('prism'):
+        ...
+
+or with the timed decorator, to the current sample and the current feature type
+(set with timing.set_feature). Stages nest, a stage is accounted its exclusive
+time, without the time of the stages run inside of it, so the stage times of a
+sample add up to at most its total. Between begin_sample and end_sample the timings are
+summed per (feature, stage) in memory, end_sample appends one JSON record per
+sample to the timing file of the process, <dataset_dir>/timings/<host>-<pid>.jsonl:
+
+    {"sample": name, "status": status, "seconds": total,
+     "stages": [[feature, stage, seconds, calls], ...]}
+
+Outside of a sample the timers cost two clock reads and are dropped.
+Aggregate the records with timing_summary.py.
+
+With enable_trace, called before the workers fork, every stage, feature and
+sample is also kept as a Chrome trace "X" event, whether in a sample or not,
+and appended to <dataset_dir>/timings/<host>-<pid>.trace.jsonl. Trace events
+keep the inclusive time, the viewer nests them. trace_export.py merges the
+files of all processes into one trace file.
+"""
+import contextlib
+import functools
+import json
+import os
+import socket
+import time
+from multiprocessing.util import Finalize
+
+TIMING_DIR = 'timings'
+TRACE_SUFFIX = '.trace.jsonl'
+# buffered trace events above which they are written out of a sample
+TRACE_BUFFER = 1000
+
+# state of the current process
+_sample = None
+_feature = None
+_start = None
+_stages = {}
+# time of the stages run inside each of the open stages, innermost last
+_open_stages = []
+_fp = None
+_fp_pid = None
+_trace_dir = None
+_trace_fp = None
+_trace_pid = None
+_events = []
+_events_pid = None
+_feature_start = None
+
+
+def _timing_file(dataset_dir):
+    global _fp, _fp_pid
+    if _fp is None or _fp_pid != os.getpid():
+        timing_dir = os.path.join(dataset_dir, TIMING_DIR)
+        os.makedirs(timing_dir, exist_ok=True)
+        filename = '{}-{}.jsonl'.format(socket.gethostname(), os.getpid())
+        _fp = open(os.path.join(timing_dir, filename), 'a', encoding='utf8')
+        _fp_pid = os.getpid()
+
+    return _fp
+
+
+def enable_trace(dataset_dir):
+    """Record trace events in this process and the processes it forks afterwards."""
+    global _trace_dir
+    _trace_dir = os.path.join(dataset_dir, TIMING_DIR)
+
+
+def _trace_event(name, category, seconds, args=None):
+    """Keep a complete event that ends now and lasted seconds."""
+    global _events, _events_pid
+    if _events_pid != os.getpid():
+        # events buffered by the parent before the fork are its own
+        _events = []
+        _events_pid = os.getpid()
+    event = {'name': name, 'cat': category, 'ph': 'X',
+             'ts': round((time.time() - seconds) * 1e6), 'dur': round(seconds * 1e6)}
+    if args:
+        event['args'] = args
+    _events.append(event)
+    if _sample is None and len(_events) >= TRACE_BUFFER:
+        flush_trace()
+
+
+def flush_trace():
+    """Append the buffered trace events to the trace file of the process."""
+    global _trace_fp, _trace_pid, _events
+    if _trace_dir is None or _events_pid != os.getpid():
+        return
+    if _trace_pid != os.getpid():
+        os.makedirs(_trace_dir, exist_ok=True)
+        filename = '{}-{}{}'.format(socket.gethostname(), os.getpid(), TRACE_SUFFIX)
+        _trace_fp = open(os.path.join(_trace_dir, filename), 'a', encoding='utf8')
+        _trace_pid = os.getpid()
+        # workers exit through the multiprocessing finalizers
+        Finalize(None, flush_trace, exitpriority=20)
+    for event in _events:
+        _trace_fp.write(json.dumps(event, ensure_ascii=False) + '\n')
+    _trace_fp.flush()
+    _events = []
+
+
+def begin_sample(sample):
+    global _sample, _feature, _start, _stages, _feature_start
+    _sample = sample
+    _feature = None
+    _feature_start = None
+    _start = time.perf_counter()
+    _stages = {}
+
+
+def end_sample(dataset_dir, status):
+    """Append the record of the current sample to the timing file of the process."""
+    global _sample
+    if _sample is None:
+        return
+    seconds = time.perf_counter() - _start
+    record = {'sample': _sample,
+              'status': status,
+              'seconds': round(seconds, 6),
+              'stages': [[feature, name, round(seconds, 6), calls]
+                         for (feature, name), (seconds, calls) in _stages.items()]}
+    fp = _timing_file(dataset_dir)
+    fp.write(json.dumps(record, ensure_ascii=False) + '\n')
+    fp.flush()
+    if _trace_dir is not None:
+        set_feature(None)
+        _trace_event(str(_sample), 'sample', seconds, {'status': status})
+        flush_trace()
+    _sample = None
+
+
+def add(name, seconds, exclusive=None):
+    """Account a stage that lasted seconds, exclusive of its nested stages when given.
+
+    The seconds are taken out of the exclusive time of the enclosing stage.
+    """
+    if _trace_dir is not None:
+        _trace_event(name, 'stage', seconds, {'feature': _feature} if _feature is not None else None)
+    if _open_stages:
+        _open_stages[-1] += seconds
+    if _sample is None:
+        return
+    key = (_feature, name)
+    total, calls = _stages.get(key, (0.0, 0))
+    _stages[key] = (total + (seconds if exclusive is None else exclusive), calls + 1)
+
+
+@contextlib.contextmanager
+def stage(name):
+    _open_stages.append(0.0)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        nested = _open_stages.pop()
+        add(name, seconds, max(seconds - nested, 0.0))
+
+
+def timed(name):
+    """Decorator accounting every call of the function to stage name."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def set_feature(feat_type):
+    """Account the following stages to feat_type, None for stages outside of a feature."""
+    global _feature, _feature_start
+    if _trace_dir is not None:
+        now = time.perf_counter()
+        if _feature_start is not None:
+            _trace_event(_feature, 'feature', now - _feature_start)
+        _feature_start = None if feat_type is None else now
+    _feature = feat_type
+
+
+def read_trace_events(dataset_dir):
+    """Trace events of all processes as {(host, pid): [event]}."""
+    timing_dir = os.path.join(dataset_dir, TIMING_DIR)
+    events = {}
+    for filename in sorted(os.listdir(timing_dir)):
+        if not filename.endswith(TRACE_SUFFIX):
+            continue
+        host, pid = filename[:-len(TRACE_SUFFIX)].rsplit('-', 1)
+        with open(os.path.join(timing_dir, filename), 'r', encoding='utf8') as fp:
+            for line in fp:
+                try:
+                    events.setdefault((host, int(pid)), []).append(json.loads(line))
+                except ValueError:
+                    continue
+
+    return events
+
+
+def read_records(dataset_dir):
+    """All timing records of a dataset."""
+    timing_dir = os.path.join(dataset_dir, TIMING_DIR)
+    records = []
+    for filename in sorted(os.listdir(timing_dir)):
+        if not filename.endswith('.jsonl') or filename.endswith(TRACE_SUFFIX):
+            continue
+        with open(os.path.join(timing_dir, filename), 'r', encoding='utf8') as fp:
+            for line in fp:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+
+    return records
@@ -0,0 +1,175 @@
+"""Work queue in a shared directory, for generation across several hosts.
+
+Needs nothing but a filesystem shared by the hosts (e.g. NFS). Every task is a
+small JSON file moving between the folders of the queue directory:
+
+    pending/<id>.json              waiting for a worker
+    leased/<id>@<owner>@<time>     taken by the process <owner> at <time>
+    done/<id>.json                 result of a generated sample
+    failed/<id>.json               result of a failed sample
+
+A task is leased by renaming it from pending to leased, rename is atomic on a
+single filesystem so only one process gets it. A lease expires lease_seconds
+after it was taken or last renewed, any process may then rename it back to
+pending, so the work of a crashed host is handed out again. Lease times are
+compared with the local clock, the hosts should be time synchronized.
+"""
+import json
+import os
+import random
+import socket
+import time
+
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def _write_json_atomic(pathname, data):
+    tmp_path = '{}.{}-{}.tmp'.format(pathname, socket.gethostname(), os.getpid())
+    with open(tmp_path, 'w', encoding='utf8') as fp:
+        json.dump(data, fp, ensure_ascii=False)
+    os.replace(tmp_path, pathname)
+
+
+def _read_json(pathname):
+    with open(pathname, 'r', encoding='utf8') as fp:
+        return json.load(fp)
+
+
+class FileWorkQueue:
+    def __init__(self, queue_dir, lease_seconds):
+        """
+        :param queue_dir: queue directory on the shared filesystem
+        :param lease_seconds: time after which a lease that was not renewed expires
+        """
+        self.queue_dir = queue_dir
+        self.lease_seconds = lease_seconds
+        self.owner = '{}-{}'.format(socket.gethostname(), os.getpid())
+        for folder in (PENDING, LEASED, DONE, FAILED):
+            os.makedirs(os.path.join(queue_dir, folder), exist_ok=True)
+
+    def _path(self, folder, filename):
+        return os.path.join(self.queue_dir, folder, filename)
+
+    def _list(self, folder):
+        return [filename for filename in os.listdir(os.path.join(self.queue_dir, folder))
+                if not filename.endswith('.tmp')]
+
+    def put(self, task_id, task):
+        """Add a task to the pending ones, replacing a pending task of the same id."""
+        _write_json_atomic(self._path(PENDING, task_id + '.json'), task)
+
+    def queued_ids(self):
+        """Ids of the pending and leased tasks."""
+        ids = {filename[:-len('.json')] for filename in self._list(PENDING)}
+        ids.update(filename.split('@')[0] for filename in self._list(LEASED))
+
+        return ids
+
+    def lease(self):
+        """Take a pending task.
+
+        :return: (lease, task), None when no task is pending
+        """
+        candidates = self._list(PENDING)
+        # hosts polling at the same time mostly try different tasks
+        random.shuffle(candidates)
+        for filename in candidates:
+            task_id = filename[:-len('.json')]
+            lease = '{}@{}@{}'.format(task_id, self.owner, int(time.time()))
+            try:
+                os.rename(self._path(PENDING, filename), self._path(LEASED, lease))
+            except FileNotFoundError:
+                # leased by another process in the meantime
+                continue
+            try:
+                return lease, _read_json(self._path(LEASED, lease))
+            except (OSError, ValueError):
+                # lease reclaimed already or torn task file
+                continue
+
+        return None
+
+    def renew(self, lease):
+        os.utime(self._path(LEASED, lease))
+
+    def _lease_time(self, lease):
+        taken = int(lease.rsplit('@', 1)[1])
+        try:
+            renewed = os.stat(self._path(LEASED, lease)).st_mtime
+        except FileNotFoundError:
+            return None
+
+        return max(taken, renewed)
+
+    def reclaim(self):
+        """Move the expired leases back to pending.
+
+        :return: number of reclaimed tasks
+        """
+        now = time.time()
+        num_reclaimed = 0
+        for lease in self._list(LEASED):
+            lease_time = self._lease_time(lease)
+            if lease_time is None or now - lease_time < self.lease_seconds:
+                continue
+            try:
+                os.rename(self._path(LEASED, lease), self._path(PENDING, lease.split('@')[0] + '.json'))
+                num_reclaimed += 1
+            except FileNotFoundError:
+                continue
+
+        return num_reclaimed
+
+    def finish(self, lease, result, failed=False):
+        """Store the result of a leased task and release the lease.
+
+        The result is kept even when the lease expired and the task was handed
+        out again, the last result written wins.
+        """
+        task_id = lease.split('@')[0]
+        _write_json_atomic(self._path(FAILED if failed else DONE, task_id + '.json'), result)
+        try:
+            os.remove(self._path(LEASED, lease))
+        except FileNotFoundError:
+            pass
+
+    def results(self):
+        """Stored results of done and failed tasks as {id: result}."""
+        results = {}
+        for folder in (DONE, FAILED):
+            for filename in self._list(folder):
+                try:
+                    results[filename[:-len('.json')]] = _read_json(self._path(folder, filename))
+                except (OSError, ValueError):
+                    continue
+
+        return results
+
+    def forget(self, task_id):
+        """Remove the stored results of a task."""
+        for folder in (DONE, FAILED):
+            try:
+                os.remove(self._path(folder, task_id + '.json'))
+            except FileNotFoundError:
+                pass
+
+    def tasks(self):
+        """Lease tasks one at a time for as long as some are pending.
+
+        Expired leases are reclaimed when nothing is pending. Leases of live
+        processes are not waited for, the iteration ends instead.
+        :return: iterator of (lease, task)
+        """
+        while True:
+            leased = self.lease()
+            if leased is None and self.reclaim() > 0:
+                leased = self.lease()
+            if leased is None:
+                return
+            yield leased
+
+    def counts(self):
+        return {folder: len(self._list(folder)) for folder in (PENDING, LEASED, DONE, FAILED)}
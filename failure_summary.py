@@ -0,0 +1,59 @@
+"""Summarize the failed generation attempts of a run by failure code and feature type.
+
+    python failure_summary.py <dataset_dir>
+
+Reads every record of <dataset_dir>/manifest.jsonl, so attempts of samples that
+were retried later are counted too, and prints for every (code, feature) the
+number of failed attempts, the CPU time they wasted and its share of all wasted
+CPU time. Feature types at the top of the list are the first to optimize.
+"""
+import json
+import os
+import sys
+
+
+def read_attempts(dataset_dir):
+    """Failed attempts of all manifest records, the same result recorded twice counts once."""
+    attempts = []
+    seen = set()
+    with open(os.path.join(dataset_dir, 'manifest.jsonl'), 'r', encoding='utf8') as fp:
+        for line in fp:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if 'attempts' not in record:
+                continue
+            # keyed by sample, attempt number and seed, a sample is recorded again when resynced from a queue
+            key = (record['id'], record.get('attempt'), record.get('seed'), json.dumps(record['attempts']))
+            if key in seen:
+                continue
+            seen.add(key)
+            attempts.extend(record['attempts'])
+
+    return attempts
+
+
+def print_failure_table(attempts):
+    table = {}
+    for attempt in attempts:
+        row = table.setdefault((attempt['code'], attempt['feature'] or '-'), [0, 0.0])
+        row[0] += 1
+        row[1] += attempt['cpu_seconds'] or 0.0
+    total = sum(row[1] for row in table.values())
+
+    print('{} failed attempts, {:.1f} CPU s wasted'.format(len(attempts), total))
+    print('{:<20} {:<28} {:>9} {:>10} {:>7} {:>10}'.format('code', 'feature', 'attempts', 'cpu s', 'share',
+                                                          'mean s'))
+    for (code, feature), (count, seconds) in sorted(table.items(), key=lambda item: -item[1][1]):
+        print('{:<20} {:<28} {:>9} {:>10.2f} {:>6.1f}% {:>10.4f}'.format(
+            code, feature, count, seconds, 100 * seconds / max(total, 1e-9), seconds / count))
+    print()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print(__doc__)
+        sys.exit(1)
+
+    print_failure_table(read_attempts(sys.argv[1]))
@@ -18,6 +18,10 @@ from OCC.Core.BRepAlgoAPI import BRepAlgoAPI_Cut
 import Utils.shape_factory as shape_factory
 import Utils.parameters as param
 import Utils.occ_utils as occ_utils
+import Utils.fastener_library as fastener_library
+import Utils.timing as timing
+import Utils.mesh_manager as mesh_manager
+import Utils.logs as logs
 
 from Features.o_ring import ORing
 from Features.through_hole import ThroughHole
@@ -44,6 +48,7 @@ from Features.triangular_blind_step import TriangularBlindStep
 from Features.circular_blind_step import CircularBlindStep
 from Features.rectangular_blind_step import RectangularBlindStep
 
+logger = logs.get_logger(__name__)
 
 
 feat_names = ['chamfer', 'through_hole', 'triangular_passage', 'rectangular_passage', '6sides_passage',
@@ -101,14 +106,11 @@ def write_step_wth_prediction(filename, shape, prediction):
 
 
 def triangulate_shape(shape):
-    linear_deflection = 0.1
-    angular_deflection = 0.5
-    mesh = BRepMesh_IncrementalMesh(shape, linear_deflection, False, angular_deflection, True)
-    mesh.Perform()
-    assert mesh.IsDone()
+    # faces left alone by the previous features keep their mesh, see Utils/mesh_manager.py
+    mesh_manager.get_manager().mesh(shape)
 
 
-def generate_stock_dims(larger_stock):
+def generate_stock_dims(larger_stock, rng=random):
     if larger_stock: # too much features need larger stock for avoiding wrong topology
         stock_min_x = param.stock_min_x * 2
         stock_min_y = param.stock_min_y * 2
@@ -117,21 +119,21 @@ def generate_stock_dims(larger_stock):
         stock_min_x = param.stock_min_x
         stock_min_y = param.stock_min_y
         stock_min_z = param.stock_min_z
-    param.stock_dim_x = random.uniform(stock_min_x, param.stock_max_x)
-    param.stock_dim_y = random.uniform(stock_min_y, param.stock_max_y)
-    param.stock_dim_z = random.uniform(stock_min_z, param.stock_max_z)
+    param.stock_dim_x = rng.uniform(stock_min_x, param.stock_max_x)
+    param.stock_dim_y = rng.uniform(stock_min_y, param.stock_max_y)
+    param.stock_dim_z = rng.uniform(stock_min_z, param.stock_max_z)
 
 # 生成第二个块体
-def generate_stock_2_dims(n,x,y,z):
+def generate_stock_2_dims(n,x,y,z, rng=random):
     if n == [2,1]:
-        dim = random.uniform(10, 15)
+        dim = rng.uniform(10, 15)
         pos = gp_Pnt(0, 0, dim)
 
         dx = x
         dy = y
         dz = 0.000001
     elif n == [2,-1]:
-        dim = random.uniform(z-15, z-10)
+        dim = rng.uniform(z-15, z-10)
         pos = gp_Pnt(0, 0, dim)
         dx = x
         dy = y
@@ -139,13 +141,13 @@ def generate_stock_2_dims(n,x,y,z):
         dim = z - dim
     
     elif n == [0,1]:
-        dim = random.uniform(10, 15)
+        dim = rng.uniform(10, 15)
         pos = gp_Pnt(dim, 0, 0)
         dx = 0.000001
         dy = y
         dz = z
     elif n == [0,-1]:
-        dim = random.uniform(x-15, x-10)
+        dim = rng.uniform(x-15, x-10)
         pos = gp_Pnt(dim, 0, 0)
         dx = 0.000001
         dy = y
@@ -153,13 +155,13 @@ def generate_stock_2_dims(n,x,y,z):
         dim = x - dim
 
     elif n == [1,1]:
-        dim = random.uniform(10, 15)
+        dim = rng.uniform(10, 15)
         pos = gp_Pnt(0, dim, 0)
         dy = 0.000001
         dx = x
         dz = z
     elif n == [1,-1]:
-        dim = random.uniform(y-15, y-10)
+        dim = rng.uniform(y-15, y-10)
         pos = gp_Pnt(0, dim, 0)
         dy = 0.000001
         dx = x
@@ -262,34 +264,45 @@ def rearrange_combo_planar(combination):
 
 
 
-def shape_from_directive(combo):
+def shape_from_directive(combo, rng=random):
+    """Apply the machining features of combo to a random stock.
+
+    :param combo: list of feature ids
+    :param rng: random.Random driving every random choice of the sample, the
+                global random module by default
+    """
     try_cnt = 0
     find_edges = True
     # combo = rearrange_combo(combo) # rearrange machining feature combinations
     combo.sort(reverse=True)
     count = 0
     bounds = []
-    N_Choice = random.choice([[0,1],[0,-1],[1,-1],[1,1],[2,1],[2,-1]])
+    N_Choice = rng.choice([[0,1],[0,-1],[1,-1],[1,1],[2,1],[2,-1]])
     # if combo.count(1) >= 2:
     Fa_list = {}
+    # no face of an earlier sample comes back
+    mesh_manager.get_manager().clear()
 
     while True:
 
         # random stock size
         if len(combo) >= 10:
             # too much features need larger stock for avoiding wrong topology
-            generate_stock_dims(larger_stock=True)
+            generate_stock_dims(larger_stock=True, rng=rng)
         else:
-            generate_stock_dims(larger_stock=False)
+            generate_stock_dims(larger_stock=False, rng=rng)
         # create stock
-        shape_gen1 = BRepPrimAPI_MakeBox(param.stock_dim_x, param.stock_dim_y, param.stock_dim_z).Shape()
+        timing.set_feature('stock')
+        with timing.stage('stock'):
+            shape_gen1 = BRepPrimAPI_MakeBox(param.stock_dim_x, param.stock_dim_y, param.stock_dim_z).Shape()
 
-        #生成第二个块
-        pos,dx,dy,dz,dim = generate_stock_2_dims(N_Choice, param.stock_dim_x, param.stock_dim_y, param.stock_dim_z)
-        shape_gen2 = BRepPrimAPI_MakeBox(pos, dx, dy, dz).Shape()
+            #生成第二个块
+            pos,dx,dy,dz,dim = generate_stock_2_dims(N_Choice, param.stock_dim_x, param.stock_dim_y,
+                                                     param.stock_dim_z, rng)
+            shape_gen2 = BRepPrimAPI_MakeBox(pos, dx, dy, dz).Shape()
 
-        cut = BRepAlgoAPI_Cut(shape_gen1, shape_gen2)  
-        shape = cut.Shape()  
+            cut = BRepAlgoAPI_Cut(shape_gen1, shape_gen2)
+            shape = cut.Shape()
 
         # shape = TopoDS_Compound()
         # builder = BRep_Builder()
@@ -303,11 +316,13 @@ def shape_from_directive(combo):
 
         for fid in combo:
             feat_name = param.feat_names[fid]
+            # stages below are accounted to this feature, see Utils/timing.py
+            timing.set_feature(feat_name)
             if feat_name == "chamfer":
                 edges = occ_utils.list_edge(shape)
                 # create new feature object
                 new_feat = feat_classes[feat_name](shape, label_map, param.min_len,
-                                                   param.clearance, param.feat_names, edges)
+                                                   param.clearance, param.feat_names, edges, rng=rng)
                 shape, label_map, edges = new_feat.add_feature()
 
                 if len(edges) == 0:
@@ -319,7 +334,7 @@ def shape_from_directive(combo):
                     find_edges = False
 
                 new_feat = feat_classes[feat_name](shape, label_map, param.min_len,
-                                                   param.clearance, param.feat_names, edges)
+                                                   param.clearance, param.feat_names, edges, rng=rng)
                 shape, label_map, edges = new_feat.add_feature()
 
                 if len(edges) == 0:
@@ -327,119 +342,22 @@ def shape_from_directive(combo):
 
             elif feat_name == "through_hole":
                 triangulate_shape(shape) # mesh curved surface ???
-        
-                new_feat = feat_classes[feat_name](shape, label_map, param.min_len, param.clearance, param.feat_names)
-        
-                if count == 0:
-           
-                    shape, label_map, bounds,info,sn= new_feat.add_feature(bounds,dim, N_Choice=N_Choice, find_bounds=True)
-
-                    reader = STEPControl_Reader()
-                    reader.ReadFile(f'{sn}.stp')
-                    reader.TransferRoots()
-                    shape1 = reader.OneShape()
-
-                    ax = info[6]
-                    if ax[0] != 0 :
-                        rad = 90
-                        ax_xyz = [0,-ax[0],0]
-
-                    elif ax[1] != 0:
-                        rad = 90
-                        ax_xyz = [ax[1],0,0]
-
-                    elif ax[2] == 1:
-                        rad = 180
-                        ax_xyz = [0,1,0]
-                    elif ax[2] == -1:
-                        rad = 0
-                        ax_xyz = [0,0,1]
-
-                    # 螺栓原点坐标
-                    ro_id = info[5]
-                    axis = gp_Ax1(gp_Pnt(ro_id[0], ro_id[1], ro_id[2] ), gp_Dir(ax_xyz[0], ax_xyz[1], ax_xyz[2]))  
-                    trsf_rotation = gp_Trsf()  
-                    trsf_rotation.SetRotation(axis,  math.radians(rad))  
-                    flipped_builder = BRepBuilderAPI_Transform(shape1, trsf_rotation, True)  
-                    if flipped_builder.IsDone():  
-                        flipped_builder.Build()
-                        flipped_shape = flipped_builder.Shape()  
-                    else:  
-                        print("Failed to rotate shape")  
-
-                    tx = info[0] - ro_id[0]
-                    ty = info[1] - ro_id[1]
-                    tz = info[2] - ro_id[2]
-                    translation_vector = gp_Vec(tx, ty, tz)  
-  
-                    # 创建一个平移变换  
-                    trsf = gp_Trsf()  
-                    trsf.SetTranslation(translation_vector) 
-                    transformed_builder = BRepBuilderAPI_Transform(flipped_shape, trsf, True)  
-                    if transformed_builder.IsDone():  
-                        transformed_shape = transformed_builder.Shape()   
-                    else:  
-                        print("Failed to transform shape") 
-
-
-                    if feat_name in through_blind_features:                            
-                        count += 1
 
-                else: # I think it should find bounds after each feature created besides from inner bounds
-                    # may slow generation speed
-                    shape,label_map, bounds,info,sn= new_feat.add_feature(bounds,dim, N_Choice=N_Choice, find_bounds=True) # orignial: False
-
-                    reader = STEPControl_Reader()
-                    reader.ReadFile(f'{sn}.stp')
-                    reader.TransferRoots()
-                    shape1 = reader.OneShape()
-
-                    ax = info[6]
-                    if ax[0] != 0 :
-                        rad = 90
-                        ax_xyz = [0,-ax[0],0]
-
-                    elif ax[1] != 0:
-                        rad = 90
-                        ax_xyz = [ax[1],0,0]
-
-                    elif ax[2] == 1:
-                        rad = 180
-                        ax_xyz = [0,1,0]
-                    elif ax[2] == -1:
-                        rad = 0
-                        ax_xyz = [0,0,1]
-
-                    # 螺栓原点坐标
-                    ro_id = info[5]
-                    axis = gp_Ax1(gp_Pnt(ro_id[0], ro_id[1], ro_id[2] ), gp_Dir(ax_xyz[0], ax_xyz[1], ax_xyz[2]))  
-                    trsf_rotation = gp_Trsf()  
-##################################################################################################
-                    #### 偏置生成调整
-                    trsf_rotation.SetRotation(axis,  math.radians(rad))  #random.randint(-15, 15)
-                    flipped_builder = BRepBuilderAPI_Transform(shape1, trsf_rotation, True)  
-                    if flipped_builder.IsDone():  
-                        flipped_builder.Build()
-                        flipped_shape = flipped_builder.Shape()  
-                    else:  
-                        print("Failed to rotate shape")  
-
-                    tx = info[0] - ro_id[0] 
-                    ty = info[1] - ro_id[1] 
-                    tz = info[2] - ro_id[2] 
-                    translation_vector = gp_Vec(tx, ty, tz)  
-  
-                    # 创建一个平移变换  
-                    trsf = gp_Trsf()  
-                    trsf.SetTranslation(translation_vector) 
-                    transformed_builder = BRepBuilderAPI_Transform(flipped_shape, trsf, True)  
-                    if transformed_builder.IsDone():  
-                        transformed_shape = transformed_builder.Shape()   
-                    else:  
-                        print("Failed to transform shape") 
+                new_feat = feat_classes[feat_name](shape, label_map, param.min_len, param.clearance, param.feat_names,
+                                                   rng=rng)
+
+                # I think it should find bounds after each feature created besides from inner bounds
+                # may slow generation speed
+                shape, label_map, bounds, info, sn = new_feat.add_feature(bounds, dim, N_Choice=N_Choice, find_bounds=True)
+                if sn is None:
+                    # no hole cut, the cause is noted for the attempt
+                    continue
+
+                # bolt shapes are read once per worker and instanced, see Utils/fastener_library.py
+                with timing.stage('fastener'):
+                    transformed_shape = fastener_library.place_fastener(sn, info)
+                count += 1
 
-                    count += 1
-            
                 Fa_list[tuple(info)] = transformed_shape
                 
 
@@ -462,7 +380,8 @@ def shape_from_directive(combo):
 
             else:
                 triangulate_shape(shape) # mesh curved surface ???
-                new_feat = feat_classes[feat_name](shape, label_map, param.min_len, param.clearance, param.feat_names)
+                new_feat = feat_classes[feat_name](shape, label_map, param.min_len, param.clearance, param.feat_names,
+                                                   rng=rng)
                 if count == 0:
                
                     shape, label_map, bounds= new_feat.add_feature(bounds,dim,N_Choice=None ,find_bounds=True)
@@ -477,6 +396,7 @@ def shape_from_directive(combo):
                     count += 1
             
 
+        timing.set_feature(None)
         if shape is not None:
             break
 
@@ -510,6 +430,7 @@ def display_bounds(bounds, display, color):
     return display
 
 
+@timing.timed('segmentation_label')
 def get_segmentaion_label(faces_list, seg_map):
     ''' 
     Create map between face id and segmentaion label
@@ -531,13 +452,13 @@ def get_instance_label(faces_list, num_faces, inst_map):
     for inst in inst_map:
         for row_inst_face in inst:
             if row_inst_face not in faces_list:
-                print('WARNING! mssing face', row_inst_face.__hash__()) 
+                logger.warning('mssing face %s', row_inst_face.__hash__())
                 continue
             row_face_idx = faces_list.index(row_inst_face) 
             # In the face_idx row，all instance faces are labeled as 1
             for col_inst_face in inst:
                 if col_inst_face not in faces_list:
-                    print('WARNING! mssing face', col_inst_face.__hash__()) 
+                    logger.warning('mssing face %s', col_inst_face.__hash__())
                     continue
                 col_face_idx = faces_list.index(col_inst_face)
                 # pythonocc index starts from 1
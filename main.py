@@ -12,16 +12,19 @@ import Utils.shape as shape
 import random
 import os
 import gc
+import collections
+import hashlib
+import heapq
 import pickle
 import time
 from tqdm import tqdm
-from multiprocessing.pool import Pool
 
 from OCC.Extend.TopologyUtils import TopologyExplorer
 from OCC.Core.STEPControl import STEPControl_Writer, STEPControl_AsIs
 from OCC.Core.TopLoc import TopLoc_Location
 from OCC.Core.STEPConstruct import stepconstruct_FindEntity
 from OCC.Core.TCollection import TCollection_HAsciiString
+from OCC.Core.Interface import Interface_Static_SetCVal
 from OCC.Core.TopoDS import (
     TopoDS_Solid,
     TopoDS_Compound,
@@ -29,12 +32,28 @@ from OCC.Core.TopoDS import (
 )
 from OCC.Extend.DataExchange import STEPControl_Writer
 from OCC.Core.BRep import BRep_Builder
+from OCC.Core.BinTools import bintools_Read, bintools_Write
+from OCC.Core.TopoDS import TopoDS_Shape, TopoDS_Iterator
 from OCC.Core.TopoDS import TopoDS_Compound
 
 import Utils.occ_utils as occ_utils
+import Utils.parameters as param
+import Utils.manifest as manifest
+import Utils.scheduler as scheduler
+import Utils.sample_writer as sample_writer
+import Utils.work_queue as work_queue
+import Utils.combo_sampler as combo_sampler
+import Utils.cost_model as cost_model
+import Utils.timing as timing
+import Utils.failures as failures
+import Utils.logs as logs
+import Utils.run_metrics as run_metrics
+import Utils.fastener_catalog as fastener_catalog
 import feature_creation
 import math
 
+logger = logs.get_logger(__name__)
+
 
 def distance_3d(point1, point2):
 
@@ -46,15 +65,20 @@ def distance_3d(point1, point2):
 
 
 
-def shape_with_fid_to_step(filename, SHAPE,faces_list,id_map, save_face_label=True):
+def shape_with_fid_to_step(filename, SHAPE,faces_list,id_map, save_face_label=True, instances=(), instanced=False):
     """Save shape to a STEP file format.
 
     :param filename: Name to save shape as.
     :param shape: Shape to be saved.
     :param id_map: Variable mapping labels to faces in shape.
+    :param instances: located fastener shapes contained in shape.
+    :param instanced: write located shapes sharing geometry as instances of one
+                      product (mapped items) instead of repeating their B-Rep.
     :return: None
     """
     writer = STEPControl_Writer()
+    # the static only exists once the writer initialised the STEP controller
+    Interface_Static_SetCVal("write.step.assembly", "1" if instanced else "0")
     # for shape in SHAPE:
         # writer = STEPControl_Writer()
         # writer.Transfer(shape, STEPControl_AsIs)
@@ -65,15 +89,33 @@ def shape_with_fid_to_step(filename, SHAPE,faces_list,id_map, save_face_label=Tr
         finderp = writer.WS().TransferWriter().FinderProcess()
         faces = faces_list
         loc = TopLoc_Location()
+        # instanced faces are mapped in the frame of their product, without the instance location
+        product_faces = instance_product_faces(instances) if instanced else {}
         for face in faces:
             item = stepconstruct_FindEntity(finderp, face, loc)
+            if item is None and face in product_faces:
+                item = stepconstruct_FindEntity(finderp, product_faces[face], loc)
             if item is None:
-                print(face)
+                logger.debug('no STEP entity of face %s', face)
                 continue
             item.SetName(TCollection_HAsciiString(str(id_map[face])))
 
     writer.Write(filename)
 
+
+def instance_product_faces(instances):
+    """Map faces of located instances to the same faces without the instance location.
+
+    :param instances: located shapes
+    :return: {TopoDS_Face: TopoDS_Face}
+    """
+    product_faces = {}
+    for inst in instances:
+        product = inst.Located(TopLoc_Location())
+        product_faces.update(zip(TopologyExplorer(inst).faces(), TopologyExplorer(product).faces()))
+
+    return product_faces
+
 def shape_with_fid_to_step2(filename, shape, shape1, shape2, faces_list,id_map, save_face_label=True):
     """Save shape to a STEP file format.
 
@@ -94,7 +136,7 @@ def shape_with_fid_to_step2(filename, shape, shape1, shape2, faces_list,id_map,
         for face in faces:
             item = stepconstruct_FindEntity(finderp, face, loc)
             if item is None:
-                print(face)
+                logger.debug('no STEP entity of face %s', face)
                 continue
             item.SetName(TCollection_HAsciiString(str(id_map[face])))
 
@@ -114,65 +156,146 @@ def directive(combo, count):
     return shapes, shape_name, (seg_label, relation_matrix)
 
 
-def save_shape(SHAPE,faces_list, step_path, label_map):
-    print(f"Saving: {step_path}")
-    shape_with_fid_to_step(step_path, SHAPE,faces_list,label_map)
+def save_shape(SHAPE,faces_list, step_path, label_map, instances=()):
+    logger.debug('saving %s', step_path)
+    shape_with_fid_to_step(step_path, SHAPE,faces_list,label_map,
+                           instances=instances, instanced=param.instanced_fasteners)
 
 # def save_shape2(shape,shape1,shape2,faces_list, step_path, label_map):
 #     print(f"Saving: {step_path}")
 #     shape_with_fid_to_step2(step_path, shape, shape1,shape2,faces_list,label_map)
 
-def save_label(shape_name, pathname, seg_label):
+def label_json(shape_name, seg_label):
     import json
     """
-    Export a data to a json file
+    Export a data to json bytes
     """
 
     values_list = list(seg_label.values())
 
-    with open(pathname, 'w', encoding='utf8') as fp:
-        json.dump(values_list, fp, indent=4, ensure_ascii=False, sort_keys=False)
+    return json.dumps(values_list, indent=4, ensure_ascii=False, sort_keys=False).encode('utf8')
 
-def save_label1(shape_name, pathname, seg_label):
+def label1_json(shape_name, seg_label):
     import json
     """
-    Export a data to a json file
+    Export a data to json bytes
     """
 
     data = [
         [shape_name, {'seg': seg_label}]
     ]
-    with open(pathname, 'w', encoding='utf8') as fp:
-        json.dump(data, fp, indent=4, ensure_ascii=False, sort_keys=False)
+    return json.dumps(data, indent=4, ensure_ascii=False, sort_keys=False).encode('utf8')
+
+def save_label(shape_name, pathname, seg_label):
+    """
+    Export a data to a json file
+    """
+    with open(pathname, 'wb') as fp:
+        fp.write(label_json(shape_name, seg_label))
+
+def save_label1(shape_name, pathname, seg_label):
+    """
+    Export a data to a json file
+    """
+    with open(pathname, 'wb') as fp:
+        fp.write(label1_json(shape_name, seg_label))
+
+
+def write_sample(dataset_dir, shape_name, compound, faces_list, seg_map, seg_label, instances=()):
+    """Write the STEP file and the labels of a sample through the output backend, see Utils/sample_writer.py"""
+    writer = sample_writer.get_writer(dataset_dir)
+    # OCC only writes STEP to a file, the backend moves it in place or into its shard
+    step_path = writer.scratch_path(shape_name + '.step')
+    with timing.stage('step_write'):
+        save_shape(compound, faces_list, step_path, seg_map, instances)
+    with timing.stage('output'):
+        writer.add_sample(shape_name, {
+            'steps/' + shape_name + '.step': step_path,
+            'labels/' + shape_name + '.json': label_json(shape_name, seg_label),
+            'label1s/' + shape_name + '.json': label1_json(shape_name, seg_label)})
+
+
+def spool_sample(dataset_dir, shape_name, compound, seg_label):
+    """Hand a sample over to the writer stage.
+
+    The compound is written as binary BRep, which keeps the located fastener
+    instances, faces come back in the same list_face order as seg_label.
+    :return: (BRep pathname, face labels)
+    """
+    brep_path = sample_writer.get_writer(dataset_dir).scratch_path(shape_name + '.brep')
+    with timing.stage('spool'):
+        if not bintools_Write(compound, brep_path):
+            raise IOError('cannot write {}'.format(brep_path))
+
+    return brep_path, list(seg_label.values())
+
+
+def write_spooled_sample(args):
+    """Writer stage: STEP translation and output of a sample spooled by spool_sample."""
+    dataset_dir, shape_name, brep_path, labels = args
+    # writer stage records are told apart from the geometry ones by their status
+    timing.begin_sample(shape_name)
+    compound = TopoDS_Shape()
+    with timing.stage('unspool'):
+        if not bintools_Read(compound, brep_path) or compound.IsNull():
+            raise IOError('cannot read {}'.format(brep_path))
+    os.remove(brep_path)
+
+    faces_list = occ_utils.list_face(compound)
+    if len(faces_list) != len(labels):
+        raise ValueError('spooled shape has {} faces for {} labels'.format(len(faces_list), len(labels)))
+    seg_map = dict(zip(faces_list, labels))
+    seg_label = feature_creation.get_segmentaion_label(faces_list, seg_map)
+
+    # children of the compound are the part followed by the fasteners
+    children = TopoDS_Iterator(compound)
+    instances = []
+    while children.More():
+        instances.append(children.Value())
+        children.Next()
+
+    write_sample(dataset_dir, shape_name, compound, faces_list, seg_map, seg_label, instances[1:])
+    timing.end_sample(dataset_dir, 'written')
 
 
 def generate_shape(args):
     """
     Generate num_shapes random shapes in dataset_dir
-    :param arg: List of [shape directory path, shape name, machining feature combo]
-    :return: None
+    :param arg: List of [shape directory path, (shape name, machining feature combo, seed)]
+    :return: dict with the sample id, its status, the reason of the last failure and
+             the failed attempts, see Utils/failures.py
     """
     dataset_dir, combo = args
-    f_name, combination = combo
-
+    f_name, combination, seed = combo
+    # every sample draws from its own generator, so it can be regenerated alone
+    # whatever worker runs it
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    timing.begin_sample(f_name)
+
+    status = manifest.STATUS_FAILED
+    # failed attempts with their failure code, see Utils/failures.py
+    attempts = []
     num_try = 0 # first try
     while True:
         num_try += 1
-        print('try count', num_try)
+        logger.debug('%s: try %d', f_name, num_try)
         if num_try > 3:
             # fails too much, pass
-            print('number of fails > 3, pass')
+            logger.info('%s: number of fails > 3, pass', f_name)
             break
 
+        failures.begin_attempt()
         try:
-            shape, labels,Fa_list = feature_creation.shape_from_directive(combination)
+            shape, labels,Fa_list = feature_creation.shape_from_directive(combination, rng)
         except Exception as e:
-            print('Fail to generate:')
-            print(e)
+            logger.warning('%s: fail to generate: %s', f_name, e)
+            attempts.append(failures.end_attempt(failures.ERROR, e))
             continue
 
         if shape is None:
-            print('generated shape is None')
+            logger.info('%s: generated shape is None', f_name)
+            attempts.append(failures.end_attempt(failures.INVALID_SHAPE, 'shape is None'))
             continue
 
         
@@ -186,16 +309,20 @@ def generate_shape(args):
     
         # check generated shape has supported type (TopoDS_Solid, TopoDS_Compound, TopoDS_CompSolid)
         if not isinstance(shape, (TopoDS_Solid, TopoDS_Compound, TopoDS_CompSolid)):
-            print('generated shape is {}, not supported'.format(type(shape)))
+            logger.info('%s: generated shape is %s, not supported', f_name, type(shape))
+            attempts.append(failures.end_attempt(
+                failures.INVALID_SHAPE, 'unsupported shape type {}'.format(type(shape).__name__)))
             continue
         
         seg_map, inst_label, bottom_map = labels
+        catalog = fastener_catalog.load_catalog()
 
         if len(combination) != len(inst_label):
-            print('generated shape has wrong number of seg labels {} with step faces {}. '.format(
-                len(combination), len(inst_label)))
+            logger.info('%s: generated shape has wrong number of features %d with instance labels %d',
+                        f_name, len(combination), len(inst_label))
+            attempts.append(failures.end_attempt(failures.LABEL_MISMATCH, 'wrong number of features'))
             continue
-        print(Fa_list)
+        logger.debug('%s: fasteners %s', f_name, list(Fa_list.keys()))
     
         # len_1 = combination.count(1)
         # len_c = len(combination)
@@ -229,16 +356,16 @@ def generate_shape(args):
 
 
             faces_list = list(TopologyExplorer(shape1).faces())
-            dic_faces = {key: keys[lc-1][7] for key in faces_list}
+            dic_faces = catalog.face_label_map(keys[lc-1][7], faces_list)
 
             faces_list = occ_utils.list_face(compound)
             if len(faces_list) == 0:
-                print('empty shape')
+                logger.info('%s: empty shape', f_name)
+                attempts.append(failures.end_attempt(failures.INVALID_SHAPE, 'empty shape'))
                 continue
     
             count = len(combination)
-            print(count)
-            print(inst_label)
+            logger.debug('%s: %d features, instance labels %s', f_name, count, inst_label)
             for i in range(len(inst_label[count-1])):
                 top_face = inst_label[count-1][i]
                 seg_map[top_face] = 25
@@ -272,12 +399,11 @@ def generate_shape(args):
             builder.Add(compound, shape)
             builder.Add(compound, shape1)
             faces_list1 = list(TopologyExplorer(shape1).faces())
-            dic_faces1 = {key: keys[len(Fa_list)-1][7] for key in faces_list1}
+            dic_faces1 = catalog.face_label_map(keys[len(Fa_list)-1][7], faces_list1)
             SHAPE = [shape,shape1]
 
             count = len(combination)
-            print(count)
-            print(inst_label)
+            logger.debug('%s: %d features, instance labels %s', f_name, count, inst_label)
             for i in range(len(inst_label[count-1])):
                 top_face = inst_label[count-1][i]
                 seg_map[top_face] = 25
@@ -286,7 +412,7 @@ def generate_shape(args):
                 shape2 = S2
                 builder.Add(compound, shape2)
                 faces_list2 = list(TopologyExplorer(shape2).faces())
-                dic_faces2 = {key: keys[lx][7] for key in faces_list2}
+                dic_faces2 = catalog.face_label_map(keys[lx][7], faces_list2)
                 for j in range(len(inst_label[count-lc+lx])):
                     top_face = inst_label[count-lc+lx][j]
                     seg_map[top_face] = 25
@@ -296,7 +422,8 @@ def generate_shape(args):
 
             faces_list = occ_utils.list_face(compound)
             if len(faces_list) == 0:
-                print('empty shape')
+                logger.info('%s: empty shape', f_name)
+                attempts.append(failures.end_attempt(failures.INVALID_SHAPE, 'empty shape'))
                 continue
     
             # seg_map = {k: 0 if v != 2 else v for k, v in seg_map.items()}
@@ -339,12 +466,11 @@ def generate_shape(args):
             builder.Add(compound, shape)
             builder.Add(compound, shape1)
             faces_list1 = list(TopologyExplorer(shape1).faces())
-            dic_faces1 = {key: keys[len(Fa_list)-1][7] for key in faces_list1}
+            dic_faces1 = catalog.face_label_map(keys[len(Fa_list)-1][7], faces_list1)
             SHAPE = [shape,shape1]
 
             count = len(combination)
-            print(count)
-            print(inst_label)
+            logger.debug('%s: %d features, instance labels %s', f_name, count, inst_label)
             for i in range(len(inst_label[count-1])):
                 top_face = inst_label[count-1][i]
                 seg_map[top_face] = 25
@@ -353,7 +479,7 @@ def generate_shape(args):
                 shape2 = S2
                 builder.Add(compound, shape2)
                 faces_list2 = list(TopologyExplorer(shape2).faces())
-                dic_faces2 = {key: keys[le][7] for key in faces_list2}
+                dic_faces2 = catalog.face_label_map(keys[le][7], faces_list2)
                 for j in range(len(inst_label[count-lc+le])):
                     top_face = inst_label[count-lc+le][j]
                     seg_map[top_face] = 25
@@ -362,7 +488,7 @@ def generate_shape(args):
                     shape3 = S3
                     builder.Add(compound, shape3)
                     faces_list3 = list(TopologyExplorer(shape3).faces())
-                    dic_faces3 = {key: keys[lg][7] for key in faces_list3}
+                    dic_faces3 = catalog.face_label_map(keys[lg][7], faces_list3)
                     for k in range(len(inst_label[count-lc+lg])):
                         top_face = inst_label[count-lc+lg][k]
                         seg_map[top_face] = 25
@@ -370,7 +496,8 @@ def generate_shape(args):
 
             faces_list = occ_utils.list_face(compound)
             if len(faces_list) == 0:
-                print('empty shape')
+                logger.info('%s: empty shape', f_name)
+                attempts.append(failures.end_attempt(failures.INVALID_SHAPE, 'empty shape'))
                 continue
     
             # seg_map = {k: 0 if v != 2 else v for k, v in seg_map.items()}
@@ -424,8 +551,9 @@ def generate_shape(args):
         # Create map between face id and segmentaion label
         # seg_label = feature_creation.get_segmentaion_label(faces_list, seg_map)
         if len(seg_label) != len(faces_list):
-            print('generated shape has wrong number of seg labels {} with step faces {}. '.format(
-                len(seg_label), len(faces_list)))
+            logger.info('%s: generated shape has wrong number of seg labels %d with step faces %d',
+                        f_name, len(seg_label), len(faces_list))
+            attempts.append(failures.end_attempt(failures.LABEL_MISMATCH, 'wrong number of seg labels'))
             continue
 
 
@@ -446,27 +574,392 @@ def generate_shape(args):
 
         # save step and its labels
         shape_name = str(f_name)
-        step_path = os.path.join(dataset_dir, 'steps')
-        label_path = os.path.join(dataset_dir, 'labels')
-        label_path1 = os.path.join(dataset_dir, 'label1s')
-        step_path = os.path.join(step_path, shape_name + '.step')
-        label_path = os.path.join(label_path, shape_name + '.json')
-        label_path1 = os.path.join(label_path1, shape_name + '.json')
+        spool = None
         try:
             # if len(Fa_list) <= 2:
             #     save_shape(shape,shape1,faces_list, step_path, seg_map)
             # if 5>=len(Fa_list)>2:
             #     save_shape2(shape,shape1,shape2,faces_list, step_path, seg_map)
-            save_shape(COMpound,faces_list, step_path, seg_map)
-            save_label(shape_name, label_path, seg_label)
-            save_label1(shape_name, label_path1, seg_label)
+            if param.async_writer:
+                # STEP translation is left to the writer pool, this worker goes on with geometry
+                spool = spool_sample(dataset_dir, shape_name, COMpound, seg_label)
+            else:
+                write_sample(dataset_dir, shape_name, COMpound, faces_list, seg_map, seg_label, SHAPE[1:])
         except Exception as e:
-            print('Fail to save:')
-            print(e)
+            logger.warning('%s: fail to save: %s', f_name, e)
+            attempts.append(failures.end_attempt(failures.SAVE_FAILED, e))
             continue
-        print('SUCCESS')
+        logger.info('%s: success', f_name)
+        status = manifest.STATUS_DONE
         break # success
-    return
+    timing.end_sample(dataset_dir, status)
+    reason = None
+    if status == manifest.STATUS_FAILED and attempts:
+        reason = failure_reason(attempts[-1])
+    result = {'id': f_name, 'status': status, 'tries': min(num_try, 3), 'reason': reason,
+              'seconds': round(time.perf_counter() - start, 3), 'attempts': attempts}
+    if status == manifest.STATUS_DONE and spool is not None:
+        result['spool'] = spool
+
+    return result
+
+
+def sample_seed(run_seed, index, attempt=0):
+    """Seed of a sample, derived from the run seed, the sample index and the attempt number.
+
+    Independent of the order in which workers pick up samples.
+    """
+    digest = hashlib.sha256('{}:{}:{}'.format(run_seed, index, attempt).encode('utf8')).digest()
+
+    return int.from_bytes(digest[:4], 'little')
+
+
+def draw_combo(dataset_scale, num_features, cand_feats, cand_feat_weights, combo_range, rng=random):
+    num_inter_feat = rng.randint(combo_range[0], combo_range[1])
+    if dataset_scale == 'large':
+        combo = [rng.randint(0, num_features-1) for _ in range(num_inter_feat)] # no stock face
+    elif dataset_scale == 'tiny':
+        combo = rng.choices(cand_feats, weights=cand_feat_weights, k=num_inter_feat)
+        combo.append(1)
+
+    return combo
+
+
+def plan_samples(sample_manifest, num_samples, run_seed, dataset_scale, num_features, cand_feats,
+                 cand_feat_weights, combo_range):
+    """Plan samples in the manifest until it holds num_samples of them.
+
+    Samples planned by an earlier run keep their names and combos. The combo of
+    sample idx is drawn from its own seed, the same run seed plans the same samples.
+    """
+    for idx in range(len(sample_manifest), num_samples):
+        seed = sample_seed(run_seed, idx)
+        with timing.stage('combo_sampling'):
+            combo = draw_combo(dataset_scale, num_features, cand_feats, cand_feat_weights, combo_range,
+                               random.Random(seed))
+        plan_sample(sample_manifest, idx, combo, seed)
+
+
+def plan_sample(sample_manifest, idx, combo, seed):
+    """Plan sample idx in the manifest, returns its task (name, combo, seed)."""
+    now =  time.localtime()
+    now_time = time.strftime("%Y%m%d_%H%M%S", now)
+    file_name = now_time + '_' + str(idx)
+    sample_manifest.plan(file_name, combo, seed, index=idx, attempt=0)
+
+    return sample_task(sample_manifest[file_name])
+
+
+def combo_sampler_for(dataset_scale, num_features, cand_feats, cand_feat_weights, combo_range):
+    """Adaptive sampler drawing the same kind of combos as draw_combo."""
+    if dataset_scale == 'large':
+        return combo_sampler.AdaptiveComboSampler(range(num_features), [1.0] * num_features, combo_range)
+    elif dataset_scale == 'tiny':
+        return combo_sampler.AdaptiveComboSampler(cand_feats, cand_feat_weights, combo_range, extra_feats=[1])
+
+
+def adaptive_tasks(sample_manifest, sampler, num_samples, run_seed):
+    """Unfinished samples of the manifest, then new samples planned one at a time.
+
+    A new sample is planned only when a worker is free, so its combo is drawn with
+    the failure rates and costs observed up to then.
+    """
+    for combo in schedule_unfinished(sample_manifest, run_seed):
+        yield combo
+
+    for idx in range(len(sample_manifest), num_samples):
+        seed = sample_seed(run_seed, idx)
+        with timing.stage('combo_sampling'):
+            combo = sampler.draw(random.Random(seed))
+        yield plan_sample(sample_manifest, idx, combo, seed)
+
+
+def exact_count_tasks(sample_manifest, num_samples, run_seed, draw):
+    """Samples to run until the manifest holds num_samples done samples.
+
+    Unfinished samples of the manifest come first, then new samples are planned
+    one at a time. Samples are over-scheduled by the observed success rate p:
+    up to remaining / p samples are in flight, None is yielded when that many
+    already are.
+
+    :param draw: function of a random.Random drawing a combo
+    """
+    successes = sample_manifest.num_done()
+    num_failed = sample_manifest.count(manifest.STATUS_FAILED)
+    unfinished = collections.deque(schedule_unfinished(sample_manifest, run_seed))
+    in_flight = set()
+    while True:
+        for sample_id in list(in_flight):
+            status = sample_manifest[sample_id]['status']
+            if status != manifest.STATUS_PENDING:
+                in_flight.discard(sample_id)
+                successes += status == manifest.STATUS_DONE
+                num_failed += status == manifest.STATUS_FAILED
+
+        remaining = num_samples - sample_manifest.num_done()
+        if remaining <= 0:
+            return
+        success_rate = (successes + 1) / (successes + num_failed + 2)
+        if len(in_flight) >= math.ceil(remaining / max(success_rate, combo_sampler.MIN_SUCCESS_RATE)):
+            yield None
+            continue
+
+        if unfinished:
+            task = unfinished.popleft()
+        else:
+            idx = len(sample_manifest)
+            seed = sample_seed(run_seed, idx)
+            with timing.stage('combo_sampling'):
+                combo = draw(random.Random(seed))
+            task = plan_sample(sample_manifest, idx, combo, seed)
+        in_flight.add(task[0])
+        yield task
+
+
+def record_observed(sample_manifest, sampler, result):
+    record_result(sample_manifest, result)
+    sampler.observe(sample_manifest[result['id']]['combo'], result['status'] == manifest.STATUS_DONE,
+                    result.get('seconds'))
+
+
+def sample_task(sample):
+    return sample['id'], list(sample['combo']), sample['seed']
+
+
+def schedule_unfinished(sample_manifest, run_seed):
+    """Pending and failed samples of the manifest as (name, combo, seed).
+
+    A failed sample is retried with the seed of its next attempt, retrying the old
+    one would fail the same way.
+    """
+    combos = []
+    for sample in sample_manifest.unfinished():
+        if sample['status'] == manifest.STATUS_FAILED:
+            attempt = sample.get('attempt', 0) + 1
+            seed = sample_seed(run_seed, sample.get('index', sample['id']), attempt)
+            sample_manifest.update(sample['id'], manifest.STATUS_PENDING, seed=seed, attempt=attempt)
+        combos.append(sample_task(sample))
+
+    return combos
+
+
+def failure_reason(attempt):
+    """Reason of a failed sample, its failure code first."""
+    if attempt['feature'] is None:
+        return '{}: {}'.format(attempt['code'], attempt['message'])
+
+    return '{}: {} {}'.format(attempt['code'], attempt['feature'], attempt['message'])
+
+
+def failed_result(task, error):
+    """Result of a sample whose worker did not return, timed out or crashed."""
+    dataset_dir, combo = task
+    attempt = failures.driver_failure(error)
+
+    return {'id': combo[0], 'status': manifest.STATUS_FAILED, 'reason': failure_reason(attempt),
+            'attempts': [attempt]}
+
+
+def record_written(record, result, error):
+    """Record a sample once the writer stage wrote it."""
+    if error is not None:
+        logger.warning('sample %s failed to save: %s', result['id'], error)
+        attempt = failures.driver_failure(error, failures.SAVE_FAILED)
+        result.update(status=manifest.STATUS_FAILED, reason=failure_reason(attempt),
+                      attempts=result.get('attempts', []) + [attempt])
+    record(result)
+
+
+def record_result(sample_manifest, result):
+    fields = {key: value for key, value in result.items() if key not in ('id', 'status')}
+    sample_manifest.update(result['id'], result['status'], **fields)
+
+
+def sync_queue(sample_manifest, queue, run_seed):
+    """Bring the manifest and a shared work queue up to date with each other.
+
+    Results stored in the queue are recorded in the manifest, then the unfinished
+    samples of the manifest that are neither pending nor leased are queued.
+    """
+    # taken before the results, a task finishing in between is not queued again
+    queued = queue.queued_ids()
+    for sample_id, result in queue.results().items():
+        if sample_id in sample_manifest:
+            record_result(sample_manifest, result)
+        queue.forget(sample_id)
+
+    for sample_id, combo, seed in schedule_unfinished(sample_manifest, run_seed):
+        if sample_id not in queued:
+            queue.put(sample_id, {'id': sample_id, 'combo': combo, 'seed': seed})
+
+
+def queue_tasks(queue, leases):
+    """Samples leased from a shared work queue, their leases are kept in leases by sample id.
+
+    A task is leased only when a worker is free to start it, see run_samples.
+    """
+    for lease, task in queue.tasks():
+        leases[task['id']] = lease
+        yield sample_task(task)
+
+
+def renew_leases(queue, leases):
+    """Renew the leases of the samples in flight, so no other host takes them over."""
+    for lease in list(leases.values()):
+        try:
+            queue.renew(lease)
+        except FileNotFoundError:
+            # expired and reclaimed already, the sample may run twice, the last result wins
+            pass
+
+
+def longest_first(combos, cost, lookahead=None):
+    """Reorder combos so the most expensive of the next lookahead ones starts first.
+
+    Long samples dispatched last leave the other workers idle at the end of a run,
+    started first they overlap with the short ones.
+
+    :param combos: iterable of (name, combo, seed) or None, see run_samples
+    :param cost: cost_model.CostModel
+    :param lookahead: number of combos taken in advance, None for all. Combos are
+                      not taken beyond a None, that is passed on when nothing is buffered.
+    """
+    combos = iter(combos)
+    buffered = []
+    exhausted = False
+    count = 0
+    while True:
+        while not exhausted and (lookahead is None or len(buffered) < lookahead):
+            try:
+                combo = next(combos)
+            except StopIteration:
+                exhausted = True
+                break
+            if combo is None:
+                break
+            # the count keeps equal costs in order without comparing the combos
+            heapq.heappush(buffered, (-cost.estimate(combo[1]), count, combo))
+            count += 1
+        if buffered:
+            yield heapq.heappop(buffered)[2]
+        elif exhausted:
+            return
+        else:
+            yield None
+
+
+def run_samples(dataset_dir, combos, record, num_workers, num_writers=0, sample_timeout=None,
+                max_tasks_per_worker=None, max_worker_rss_mb=None, total=None, remaining=None,
+                cost=None, lookahead=None, on_tick=None):
+    """Generate samples and pass their results to record.
+
+    :param combos: iterable of (name, combo, seed), consumed as workers become free,
+                   None when no sample is to be started until a running one completes
+    :param record: called with the result of every sample once it is written
+    :param remaining: callable giving the number of samples still to be generated,
+                      the samples in flight are cancelled once it reaches 0
+    :param cost: cost_model.CostModel, samples expected to take longest are started
+                 first and the model learns from the time of every sample
+    :param lookahead: number of combos the longest is picked from, None for all
+    :param on_tick: called every few seconds while samples are generated
+    :return: False when interrupted with CTRL+C
+    """
+    if cost is not None and num_workers > 1:
+        combos = longest_first(combos, cost, lookahead)
+    metrics = run_metrics.RunMetrics(dataset_dir, total=total, remaining=remaining)
+    record_sample = record
+
+    def record(result):
+        record_sample(result)
+        metrics.record(result)
+
+    def tick():
+        metrics.maybe_write(pool, len(spooled))
+        if on_tick is not None:
+            on_tick()
+
+    def collect_written(wait_one=False):
+        written = writers.collect(wait_one=wait_one)
+        for sample_id, write_error in written:
+            record_written(record, spooled.pop(sample_id), write_error)
+
+        return len(written) > 0
+
+    if num_workers == 1:
+        for combo in combos:
+            if combo is None:
+                break
+            if on_tick is not None:
+                on_tick()
+            record(generate_shape((dataset_dir, combo)))
+            metrics.maybe_write()
+        sample_writer.close_writer()
+        metrics.write()
+        timing.flush_trace()
+    elif num_workers > 1: # multiprocessing
+        if remaining is not None:
+            # only samples the driver accepts are written, two finishing together cannot overshoot
+            num_writers = max(num_writers, 1)
+        # set before the workers fork, they spool samples instead of writing them
+        param.async_writer = num_writers > 0
+        writers = None
+        if param.async_writer:
+            writers = sample_writer.WriterPool(write_spooled_sample, num_writers, initializer=initializer)
+        spooled = {}
+        pool = scheduler.SampleScheduler(generate_shape, num_workers, timeout=sample_timeout,
+                                         max_tasks_per_worker=max_tasks_per_worker,
+                                         max_rss_mb=max_worker_rss_mb, initializer=initializer,
+                                         finalizer=sample_writer.close_writer,
+                                         on_tick=tick,
+                                         # samples being written may still fail, wait for them
+                                         # rather than end the run while tasks holds back
+                                         on_idle=None if writers is None else lambda: collect_written(True))
+        try:
+            tasks = (None if combo is None else (dataset_dir, combo) for combo in combos)
+            for task, result, error in tqdm(pool.run(tasks), total=total):
+                if error == scheduler.CANCELLED:
+                    # extra sample, left pending
+                    continue
+                if cost is not None:
+                    # a timed out sample took at least its budget
+                    cost.observe(task[1][1], sample_timeout if error == scheduler.TIMEOUT else
+                                 None if result is None else result.get('seconds'))
+                if error is not None:
+                    logger.warning('sample %s failed: %s', task[1][0], error)
+                    result = failed_result(task, error)
+                if 'spool' in result:
+                    brep_path, labels = result.pop('spool')
+                    if remaining is not None and remaining() - len(spooled) <= 0:
+                        # enough samples are done or being written, this extra one is left pending
+                        os.remove(brep_path)
+                        continue
+                    # recorded as done once written
+                    spooled[result['id']] = result
+                    writers.submit(result['id'], (dataset_dir, result['id'], brep_path, labels))
+                else:
+                    record(result)
+                if writers is not None:
+                    collect_written()
+                if remaining is not None and remaining() - len(spooled) <= 0:
+                    pool.cancel()
+            pool.close()
+            if writers is not None:
+                for sample_id, write_error in writers.collect(wait_all=True):
+                    record_written(record, spooled.pop(sample_id), write_error)
+                writers.close()
+        except KeyboardInterrupt:
+            pool.terminate()
+            if writers is not None:
+                writers.terminate()
+            return False
+        finally:
+            metrics.write(pool, len(spooled))
+            timing.flush_trace()
+            logger.info('%d samples timed out, %d workers recycled', pool.num_timeouts, pool.num_recycled)
+    else:
+        AssertionError('error number of workers')
+
+    return True
 
 
 def initializer():
@@ -489,19 +982,56 @@ if __name__ == '__main__':
     dataset_dir = 'data4/5'
     combo_range = [3, 5]
     num_samples = 600
+    # True to draw combos as the run goes, steering away from features and sizes that fail or cost much
+    adaptive_sampling = False
+    # True to generate until num_samples samples are done instead of trying num_samples samples
+    exact_count = False
+    # seeds of all samples derive from it, the same run seed regenerates the same dataset
+    run_seed = 0
+    # id of a sample of the manifest to regenerate alone in this process, e.g. for profiling
+    regenerate = None
     num_workers = 12
+    # wall-clock budget of one sample in seconds, e.g. 600, its worker is killed and replaced on overrun
+    # None for no limit
+    sample_timeout = None
+    # workers are replaced after this many samples, e.g. 50, or when their resident memory passes
+    # max_worker_rss_mb, e.g. 4096, None for no limit
+    max_tasks_per_worker = None
+    max_worker_rss_mb = None
+    # samples expected to take longest start first, picked among this many samples planned in advance
+    # (all planned samples when not sampling adaptively)
+    lookahead = 2 * num_workers
+    # processes writing STEP files while the workers go on with geometry, e.g. 2, 0 to write in the workers
+    num_writers = 0
+    # write fasteners as instances of one product per bolt instead of repeating their geometry
+    param.instanced_fasteners = False
+    # fastener level of detail, 0 full geometry, 1 merged faces, 2 no threads and small blends
+    param.fastener_lod = 0
+    # 'directory' writes three files per sample, 'shards' appends samples to per-worker tar shards
+    param.output_backend = 'directory'
+    param.shard_size_mb = 1024
+    # shared work queue directory for generation on several hosts, None to generate locally
+    # 'init' syncs the manifest of this host with the queue and fills it, 'worker' generates from it
+    queue_dir = None
+    queue_role = 'worker'
+    # a leased sample not finished within this time is handed out again, the leases of the samples
+    # in flight are renewed every few seconds
+    lease_seconds = 600
+    # record begin/end events of samples, features and stages, merge them with trace_export.py
+    trace_timeline = False
+    # level of the per-process log files in <dataset_dir>/logs, AAG_LOG_LEVEL=DEBUG to trace every try
+    log_level = os.environ.get('AAG_LOG_LEVEL', 'INFO').upper()
+    # level from which log records are also printed by the driver, AAG_CONSOLE_LOG_LEVEL=NONE to print none
+    console_log_level = os.environ.get('AAG_CONSOLE_LOG_LEVEL', 'WARNING').upper()
+    if console_log_level == 'NONE':
+        console_log_level = None
 
     if not os.path.exists(dataset_dir):
         os.mkdir(dataset_dir)
-    step_path = os.path.join(dataset_dir, 'steps')
-    label_path = os.path.join(dataset_dir, 'labels')
-    label_path1 = os.path.join(dataset_dir, 'label1s')
-    if not os.path.exists(step_path):
-        os.mkdir(step_path)
-    if not os.path.exists(label_path):
-        os.mkdir(label_path)
-    if not os.path.exists(label_path1):
-        os.mkdir(label_path1)
+    # before the workers fork, they inherit the handlers and open a log file of their own
+    logs.setup(os.path.join(dataset_dir, 'logs'), log_level, console_log_level)
+    if trace_timeline:
+        timing.enable_trace(dataset_dir)
 
     # old feature combination generation
     # combos = []
@@ -513,34 +1043,83 @@ if __name__ == '__main__':
     # test_combos = combos[:num_samples]
     # del combos
 
-    combos = []
-    for idx in range(num_samples):
-        num_inter_feat = random.randint(combo_range[0], combo_range[1])
-        if dataset_scale == 'large':
-            combo = [random.randint(0, num_features-1) for _ in range(num_inter_feat)] # no stock face
-        elif dataset_scale == 'tiny':
-            combo = random.choices(tiny_dataset_cand_feats, weights=cand_feat_weights, k=num_inter_feat)
-            combo.append(1)
-
-        now =  time.localtime()
-        now_time = time.strftime("%Y%m%d_%H%M%S", now)
-        file_name = now_time + '_' + str(idx)
-        combos.append((file_name, combo))
-
-    if num_workers == 1:
-        for combo in combos:
-            generate_shape((dataset_dir, combo))
-    elif num_workers > 1: # multiprocessing
-        pool = Pool(processes=num_workers, initializer=initializer)
-        try:
-            result = list(tqdm(pool.imap(generate_shape, zip(repeat(dataset_dir), combos)), 
-                            total=len(combos)))
-        except KeyboardInterrupt:
-            pool.terminate()
-            pool.join()
+    if queue_dir is not None and queue_role == 'worker':
+        # workers of all hosts share the queue, only the init host writes the manifest
+        queue = work_queue.FileWorkQueue(queue_dir, lease_seconds)
+        logger.info('work queue %s: %s', queue_dir, queue.counts())
+        leases = {}
+        # no cost ordering, samples leased in advance would sit in the buffer while their lease runs out
+        run_samples(dataset_dir, queue_tasks(queue, leases),
+                    lambda result: queue.finish(leases.pop(result['id']), result,
+                                                failed=result['status'] != manifest.STATUS_DONE),
+                    num_workers, num_writers, sample_timeout, max_tasks_per_worker, max_worker_rss_mb,
+                    on_tick=lambda: renew_leases(queue, leases))
     else:
-        AssertionError('error number of workers')
-    
+        # planned samples and their status survive restarts, completed ones are skipped
+        sample_manifest = manifest.SampleManifest(os.path.join(dataset_dir, 'manifest.jsonl'))
+        if queue_dir is not None or not (adaptive_sampling or exact_count):
+            # adaptive sampling and exact count plan the samples as the run goes
+            plan_samples(sample_manifest, num_samples, run_seed, dataset_scale, num_features,
+                         tiny_dataset_cand_feats, cand_feat_weights, combo_range)
+
+        # prior from the timing records of earlier runs, refined as samples finish
+        cost = cost_model.from_dataset(dataset_dir, param.feat_names, sample_manifest)
+        if queue_dir is not None:
+            queue = work_queue.FileWorkQueue(queue_dir, lease_seconds)
+            sync_queue(sample_manifest, queue, run_seed)
+            logger.info('%d samples done, work queue %s: %s', sample_manifest.num_done(), queue_dir, queue.counts())
+        else:
+            if regenerate is not None:
+                # same seed as its last attempt, in this process
+                run_samples(dataset_dir, [sample_task(sample_manifest[regenerate])],
+                            lambda result: record_result(sample_manifest, result), 1)
+            elif exact_count:
+                sampler = None
+                record = lambda result: record_result(sample_manifest, result)
+                draw = lambda rng: draw_combo(dataset_scale, num_features, tiny_dataset_cand_feats,
+                                              cand_feat_weights, combo_range, rng)
+                if adaptive_sampling:
+                    sampler = combo_sampler_for(dataset_scale, num_features, tiny_dataset_cand_feats,
+                                                cand_feat_weights, combo_range)
+                    sampler.observe_manifest(sample_manifest)
+                    record = lambda result: record_observed(sample_manifest, sampler, result)
+                    draw = sampler.draw
+                remaining = lambda: num_samples - sample_manifest.num_done()
+
+                # a round ends short when samples fail to be written, the next one tops up
+                while remaining() > 0:
+                    num_done = sample_manifest.num_done()
+                    logger.info('%d samples done, %d to generate', num_done, remaining())
+                    if not run_samples(dataset_dir, exact_count_tasks(sample_manifest, num_samples, run_seed, draw),
+                                       record, num_workers, num_writers, sample_timeout, max_tasks_per_worker,
+                                       max_worker_rss_mb, total=remaining(), remaining=remaining, cost=cost,
+                                       lookahead=lookahead):
+                        break
+                    if sample_manifest.num_done() == num_done:
+                        logger.warning('no sample generated in a round, stopping')
+                        break
+                if sampler is not None:
+                    logger.info('combo sampler %s', sampler.summary())
+            elif adaptive_sampling:
+                sampler = combo_sampler_for(dataset_scale, num_features, tiny_dataset_cand_feats,
+                                            cand_feat_weights, combo_range)
+                sampler.observe_manifest(sample_manifest)
+                total = len(sample_manifest.unfinished()) + max(0, num_samples - len(sample_manifest))
+                logger.info('%d samples done, %d to generate', sample_manifest.num_done(), total)
+                run_samples(dataset_dir, adaptive_tasks(sample_manifest, sampler, num_samples, run_seed),
+                            lambda result: record_observed(sample_manifest, sampler, result),
+                            num_workers, num_writers, sample_timeout, max_tasks_per_worker, max_worker_rss_mb,
+                            total=total, cost=cost, lookahead=lookahead)
+                logger.info('combo sampler %s', sampler.summary())
+            else:
+                combos = schedule_unfinished(sample_manifest, run_seed)
+                logger.info('%d samples done, %d to generate', sample_manifest.num_done(), len(combos))
+
+                run_samples(dataset_dir, combos, lambda result: record_result(sample_manifest, result),
+                            num_workers, num_writers, sample_timeout, max_tasks_per_worker, max_worker_rss_mb,
+                            total=len(combos), cost=cost)
+
+        sample_manifest.close()
     gc.collect()
 
 
@@ -0,0 +1,98 @@
+import os
+import random
+
+import numpy as np
+import pytest
+
+import Utils.combo_sampler as combo_sampler
+import Utils.manifest as manifest
+
+FASTENER = 24
+
+
+def sampler():
+    return combo_sampler.AdaptiveComboSampler([0, 1, 2], [1, 1, 2], [1, 3], extra_feats=[FASTENER])
+
+
+def test_unseen_features_and_sizes_start_at_one_half():
+    s = sampler()
+
+    assert s.features.success_rate() == pytest.approx([0.5, 0.5, 0.5])
+    assert s.feature_weights() == pytest.approx([0.25, 0.25, 0.5])
+    assert s.max_seconds() == 1.0
+
+
+def test_failing_feature_is_drawn_more_often():
+    s = sampler()
+    for _ in range(8):
+        s.observe([0, 1, FASTENER], True, 1.0)
+        s.observe([0, FASTENER], False, 1.0)
+
+    # success rates 9/18 and 9/10
+    rate = s.features.success_rate()
+    assert rate[:2] == pytest.approx([0.5, 0.9])
+    weights = s.feature_weights()
+    assert weights[0] / weights[1] == pytest.approx(0.9 / 0.5)
+
+
+def test_generated_samples_keep_the_class_mix():
+    s = sampler()
+    rate = np.array([0.2, 0.8, 0.5])
+    rng = random.Random(0)
+    generated = np.zeros(3)
+    for _ in range(20000):
+        feat = rng.choices(s.cand_feats, weights=s.feature_weights().tolist())[0]
+        success = rng.random() < rate[feat]
+        s.observe([feat, FASTENER], success, 1.0)
+        generated[feat] += success
+
+    assert generated / generated.sum() == pytest.approx(s.target, abs=0.02)
+
+
+def test_sizes_with_more_features_per_second_are_preferred():
+    s = sampler()
+    for _ in range(10):
+        s.observe([0], True, 1.0)
+        s.observe([0, 1], True, 1.0)
+        s.observe([0, 1, 2], True, 6.0)
+
+    weights = s.size_weights()
+    assert weights[1] > weights[0] > weights[2] > 0
+
+
+def test_timed_out_sample_costs_the_slowest_size():
+    s = sampler()
+    s.observe([0], True, 2.0)
+    s.observe([0, 1], True, 5.0)
+    s.observe([0, 1, 2], False, None)
+
+    assert s.size_stats.mean_seconds(0.0)[2] == 5.0
+
+
+def test_draw_appends_the_extra_features():
+    s = sampler()
+    combos = [s.draw(random.Random(7)) for _ in range(2)]
+
+    assert combos[0] == combos[1]
+    assert combos[0][-1] == FASTENER
+    assert 1 <= len(combos[0]) - 1 <= 3
+    assert set(combos[0][:-1]) <= {0, 1, 2}
+
+
+def test_observe_manifest_charges_untimed_samples_the_slowest_size(tmp_path):
+    sample_manifest = manifest.SampleManifest(os.path.join(str(tmp_path), 'manifest.jsonl'))
+    sample_manifest.plan('0', [0, FASTENER], 1)
+    sample_manifest.update('0', manifest.STATUS_DONE, seconds=1.0)
+    sample_manifest.plan('1', [1, 2, FASTENER], 2)
+    sample_manifest.update('1', manifest.STATUS_FAILED, seconds=3.0)
+    sample_manifest.plan('2', [2, FASTENER], 3)
+    sample_manifest.update('2', manifest.STATUS_FAILED)
+    sample_manifest.plan('3', [2], 4)
+    s = sampler()
+    s.observe_manifest(sample_manifest)
+    sample_manifest.close()
+
+    assert s.features.tries.tolist() == [1, 1, 2]
+    assert s.features.successes.tolist() == [1, 0, 0]
+    # the untimed sample of one feature costs the mean of two features
+    assert s.size_stats.seconds.tolist() == [4.0, 3.0, 0.0]
@@ -0,0 +1,61 @@
+import logging
+
+import numpy as np
+import pytest
+
+import Utils.cost_model as cost_model
+
+FEAT_NAMES = ['blind_hole', 'pocket', 'chamfer']
+
+
+def record(sample, seconds, stages, status='ok'):
+    return {'sample': sample, 'status': status, 'seconds': seconds, 'stages': stages}
+
+
+def test_prior_from_exclusive_stage_times():
+    records = [
+        # two blind holes of 2 s each over their stages, 1 s outside of the features
+        record('0', 5.0, [['blind_hole', 'bounds', 1.0, 2], ['blind_hole', 'depth', 3.0, 2],
+                          [None, 'stock', 0.5, 1]]),
+        record('1', 8.0, [['blind_hole', 'depth', 2.0, 1], ['pocket', 'prism', 4.0, 1]]),
+        # writer records and samples of other runs are left out
+        record('1', 100.0, [['pocket', 'prism', 100.0, 1]], status='written'),
+        record('9', 100.0, [['pocket', 'prism', 100.0, 1]]),
+    ]
+    model = cost_model.CostModel(FEAT_NAMES)
+    model.fit_timing(records, {'0': [0, 0], '1': [0, 1]})
+
+    # chamfer, never timed, starts at the mean of the others
+    assert model.prior == pytest.approx([2.0, 4.0, 3.0, 1.5])
+
+
+def test_negative_base_is_kept_and_reported(caplog):
+    records = [record('0', 1.0, [['pocket', 'triangles', 1.0, 1], ['pocket', 'bvh', 1.0, 1]])]
+    model = cost_model.CostModel(FEAT_NAMES)
+    with caplog.at_level(logging.WARNING):
+        model.fit_timing(records, {'0': [1]})
+
+    assert model.prior[-1] == pytest.approx(-1.0)
+    assert 'negative base time' in caplog.text
+    assert model.estimate([]) == 0.0
+
+
+def test_observed_samples_outweigh_the_prior():
+    model = cost_model.CostModel(FEAT_NAMES)
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        combo = list(rng.integers(0, len(FEAT_NAMES), rng.integers(1, 5)))
+        model.observe(combo, 0.5 + sum([1.0, 6.0, 0.2][feat] for feat in combo))
+    model.observe([0], None)
+
+    assert model.num_observed == 200
+    # the ridge still pulls a little towards the prior of 1 s
+    assert model.weights() == pytest.approx([1.0, 6.0, 0.2, 0.5], abs=0.15)
+    assert model.estimate([1, 1]) > model.estimate([0, 2, 2])
+
+
+def test_without_records_every_cost_is_the_default():
+    model = cost_model.CostModel(FEAT_NAMES)
+    model.fit_timing([], {})
+
+    assert model.estimate([0, 1]) == pytest.approx(3 * cost_model.DEFAULT_SECONDS)
@@ -0,0 +1,51 @@
+import Utils.failures as failures
+
+
+def test_noted_cause_replaces_its_consequence():
+    failures.begin_attempt()
+    failures.note(failures.NO_BOUNDS, 'blind_hole', 'no face large enough')
+    failures.note(failures.SKETCH_FAILED, 'pocket')
+    attempt = failures.end_attempt(failures.LABEL_MISMATCH, 'wrong number of features')
+
+    assert attempt['code'] == failures.NO_BOUNDS
+    assert attempt['feature'] == 'blind_hole'
+    assert attempt['message'] == 'no face large enough (wrong number of features)'
+    assert attempt['cpu_seconds'] >= 0
+
+
+def test_check_that_is_no_consequence_keeps_its_code():
+    failures.begin_attempt()
+    failures.note(failures.NO_BOUNDS, 'blind_hole')
+    attempt = failures.end_attempt(failures.SAVE_FAILED, OSError('disk full'))
+
+    assert attempt['code'] == failures.SAVE_FAILED
+    assert attempt['feature'] is None
+    assert attempt['message'] == 'disk full'
+
+
+def test_generation_failure_takes_precedence():
+    failures.begin_attempt()
+    failures.note(failures.NO_BOUNDS, 'blind_hole')
+    attempt = failures.end_attempt(failures.ERROR,
+                                   failures.GenerationFailure(failures.PRISM_FAILED, 'pocket', 'cut failed'))
+
+    assert (attempt['code'], attempt['feature'], attempt['message']) == (failures.PRISM_FAILED, 'pocket',
+                                                                         'cut failed')
+
+
+def test_new_attempt_forgets_the_noted_cause():
+    failures.begin_attempt()
+    failures.note(failures.NO_BOUNDS, 'blind_hole')
+    failures.begin_attempt()
+    attempt = failures.end_attempt(failures.INVALID_SHAPE, 'empty shape')
+
+    assert (attempt['code'], attempt['feature']) == (failures.INVALID_SHAPE, None)
+
+
+def test_driver_failures():
+    assert failures.driver_failure('timeout') == {'code': failures.TIMEOUT, 'feature': None,
+                                                  'cpu_seconds': None, 'message': ''}
+    assert failures.driver_failure('worker died with exit code -9')['code'] == failures.WORKER_DIED
+    assert failures.driver_failure('KeyError: 3')['code'] == failures.ERROR
+    saved = failures.driver_failure(OSError('disk full'), failures.SAVE_FAILED)
+    assert saved == {'code': failures.SAVE_FAILED, 'feature': None, 'cpu_seconds': None, 'message': 'disk full'}
@@ -0,0 +1,42 @@
+import os
+
+import pytest
+
+pytest.importorskip('OCC.Core')
+
+import Utils.fastener_library as fastener_library
+import Utils.occ_utils as occ_utils
+import Utils.parameters as param
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SN = 26
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    cache_dir = os.path.join(str(tmp_path), 'fastener_cache')
+    monkeypatch.setattr(param, 'fastener_dir', REPO_DIR)
+    monkeypatch.setattr(param, 'fastener_cache_dir', cache_dir)
+    # shapes loaded by other tests are kept in memory
+    monkeypatch.setattr(fastener_library, '_shapes', {})
+
+    return cache_dir
+
+
+def test_lod_with_the_cache_disabled_writes_nothing(cache_dir, monkeypatch):
+    monkeypatch.setattr(param, 'use_fastener_cache', False)
+    full = fastener_library.load_fastener(SN, lod=0)
+    reduced = fastener_library.build_fastener_lod(SN, 1)
+
+    assert not os.path.exists(cache_dir)
+    assert 0 < len(occ_utils.list_face(reduced)) <= len(occ_utils.list_face(full))
+
+
+def test_lod_is_cached_when_the_cache_is_enabled(cache_dir, monkeypatch):
+    monkeypatch.setattr(param, 'use_fastener_cache', True)
+    built = fastener_library.build_fastener_lod(SN, 1)
+    brep_path, manifest_path = fastener_library.fastener_lod_paths(SN, 1)
+
+    assert os.path.isfile(brep_path) and os.path.isfile(manifest_path)
+    loaded = fastener_library.load_fastener(SN, lod=1)
+    assert len(occ_utils.list_face(loaded)) == len(occ_utils.list_face(built))
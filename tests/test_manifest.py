@@ -0,0 +1,43 @@
+import os
+
+import Utils.manifest as manifest
+
+
+def test_latest_status_wins_and_survives_a_restart(tmp_path):
+    pathname = os.path.join(str(tmp_path), 'manifest.jsonl')
+    sample_manifest = manifest.SampleManifest(pathname)
+    for i in range(4):
+        sample_manifest.plan(str(i), [i, 1], i)
+    sample_manifest.update('1', manifest.STATUS_DONE, seconds=2.0)
+    sample_manifest.update('2', manifest.STATUS_FAILED, reason='no_bounds')
+    sample_manifest.update('2', manifest.STATUS_PENDING, attempt=1)
+    sample_manifest.update('3', manifest.STATUS_FAILED)
+    sample_manifest.close()
+
+    with open(pathname, 'a', encoding='utf8') as fp:
+        # torn last line of an interrupted run
+        fp.write('{"id": "0", "sta')
+    resumed = manifest.SampleManifest(pathname)
+
+    assert len(resumed) == 4
+    assert resumed['1'] == {'id': '1', 'combo': [1, 1], 'seed': 1, 'status': manifest.STATUS_DONE, 'seconds': 2.0}
+    assert resumed['2']['attempt'] == 1 and resumed['2']['reason'] == 'no_bounds'
+    assert resumed.num_done() == 1
+    assert resumed.count(manifest.STATUS_FAILED) == 1
+    resumed.close()
+
+
+def test_status_index_keeps_planning_order(tmp_path):
+    sample_manifest = manifest.SampleManifest(os.path.join(str(tmp_path), 'manifest.jsonl'))
+    for i in range(5):
+        sample_manifest.plan(str(i), [i], i)
+    sample_manifest.update('0', manifest.STATUS_FAILED)
+    sample_manifest.update('3', manifest.STATUS_DONE)
+    sample_manifest.update('4', manifest.STATUS_FAILED)
+    sample_manifest.update('0', manifest.STATUS_PENDING)
+
+    assert [sample['id'] for sample in sample_manifest.unfinished()] == ['0', '1', '2', '4']
+    assert [sample['id'] for sample in sample_manifest.with_status(manifest.STATUS_DONE)] == ['3']
+    assert sample_manifest.count(manifest.STATUS_PENDING, manifest.STATUS_FAILED) == 4
+    assert sample_manifest.count(manifest.STATUS_DONE) == sample_manifest.num_done() == 1
+    sample_manifest.close()
@@ -0,0 +1,36 @@
+import Utils.run_metrics as run_metrics
+
+
+class _Pool:
+    num_timeouts = 1
+    num_recycled = 2
+
+    def utilization(self):
+        return 0.75
+
+    def worker_stats(self):
+        return [{'pid': 11, 'utilization': 0.5, 'busy': True, 'rss_mb': 1.0},
+                {'pid': 12, 'utilization': 1.0, 'busy': False, 'rss_mb': None}]
+
+
+def test_failures_are_counted_by_reason_code(tmp_path):
+    metrics = run_metrics.RunMetrics(str(tmp_path), total=4)
+    metrics.record({'status': 'done'})
+    metrics.record({'status': 'failed', 'reason': 'save_failed: cannot write'})
+    metrics.record({'status': 'failed', 'reason': None})
+    snapshot = metrics.snapshot()
+
+    assert snapshot['failures_by_reason'] == {'save_failed': 1, 'unknown': 1}
+    assert snapshot['remaining'] == 1
+
+
+def test_pool_and_per_worker_utilization_are_separate_gauges(tmp_path):
+    metrics = run_metrics.RunMetrics(str(tmp_path))
+    lines = metrics.prometheus(metrics.snapshot(_Pool())).splitlines()
+
+    assert 'aag_pool_utilization 0.75' in lines
+    assert [line for line in lines if line.startswith('aag_worker_utilization')] == \
+        ['aag_worker_utilization{pid="11"} 0.5', 'aag_worker_utilization{pid="12"} 1.0']
+    # unknown values are left out
+    assert [line for line in lines if line.startswith('aag_worker_rss_bytes')] == \
+        ['aag_worker_rss_bytes{pid="11"} 1048576.0']
@@ -0,0 +1,109 @@
+import os
+import time
+
+from Utils.scheduler import CANCELLED, TIMEOUT, SampleScheduler
+
+
+def _square(task):
+    return task * task
+
+
+def _sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def _fail(task):
+    raise ValueError('bad task {}'.format(task))
+
+
+def _crash(task):
+    os._exit(3)
+
+
+def test_results_of_all_tasks():
+    with SampleScheduler(_square, 2) as scheduler:
+        results = {task: (result, error) for task, result, error in scheduler.run(range(10))}
+
+    assert results == {task: (task * task, None) for task in range(10)}
+    assert scheduler.workers == []
+
+
+def test_exception_is_reported_as_error():
+    with SampleScheduler(_fail, 1) as scheduler:
+        (task, result, error), = scheduler.run([7])
+
+    assert result is None
+    assert error == 'ValueError: bad task 7'
+
+
+def test_crashed_worker_is_replaced():
+    with SampleScheduler(_crash, 1) as scheduler:
+        errors = [error for task, result, error in scheduler.run([1, 2])]
+        assert len(scheduler.workers) == 1
+
+    assert errors == ['worker died with exit code 3'] * 2
+    assert scheduler.num_recycled == 2
+
+
+def test_overrunning_task_times_out():
+    with SampleScheduler(_sleep, 1, timeout=0.5) as scheduler:
+        results = {task: error for task, result, error in scheduler.run([30, 0.01])}
+
+    assert results == {30: TIMEOUT, 0.01: None}
+    assert scheduler.num_timeouts == 1
+
+
+def test_worker_retires_after_max_tasks():
+    with SampleScheduler(_square, 1, max_tasks_per_worker=2) as scheduler:
+        pids = set()
+        for task, result, error in scheduler.run(range(6)):
+            pids.update(worker.process.pid for worker in scheduler.workers)
+
+    assert scheduler.num_recycled == 3
+    assert len(pids) >= 3
+
+
+def test_none_task_waits_for_a_completion():
+    tasks = iter([1, None, 2])
+    with SampleScheduler(_square, 2) as scheduler:
+        results = [task for task, result, error in scheduler.run(tasks)]
+
+    assert sorted(results) == [1, 2]
+
+
+def test_on_idle_resumes_a_run_with_no_task_running():
+    # tasks holds back until work done outside of the workers, e.g. a sample write, lands
+    landed = []
+    def tasks():
+        yield 1
+        while not landed:
+            yield None
+        yield 2
+
+    def on_idle():
+        landed.append(True)
+        return len(landed) == 1
+
+    with SampleScheduler(_square, 2, on_idle=on_idle) as scheduler:
+        results = [task for task, result, error in scheduler.run(tasks())]
+
+    assert results == [1, 2]
+    assert len(landed) == 1
+
+
+def test_cancel_keeps_finished_results_and_starts_no_worker():
+    with SampleScheduler(_sleep, 3) as scheduler:
+        results = {}
+        for task, result, error in scheduler.run([0.01, 0.3, 30, 30]):
+            results[task] = error
+            if task == 0.01:
+                # the 0.3 task finishes while its result is not read yet
+                time.sleep(1.0)
+                pids = {worker.process.pid for worker in scheduler.workers}
+                scheduler.cancel()
+        # the worker of the result that was waiting is left, the killed one is not replaced
+        assert len(scheduler.workers) == 2
+        assert {worker.process.pid for worker in scheduler.workers} < pids
+
+    assert results == {0.01: None, 0.3: None, 30: CANCELLED}
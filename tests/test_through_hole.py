@@ -0,0 +1,63 @@
+import os
+import random
+
+import numpy as np
+import pytest
+
+pytest.importorskip('OCC.Core')
+
+import Utils.failures as failures
+import Utils.fastener_catalog as fastener_catalog
+import Utils.parameters as param
+from Features.through_hole import ThroughHole
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(autouse=True)
+def catalog(monkeypatch):
+    monkeypatch.setattr(param, 'fastener_dir', REPO_DIR)
+    monkeypatch.setattr(fastener_catalog, '_catalog', None)
+
+    return fastener_catalog.load_catalog()
+
+
+def square_bound(half_size):
+    """Bound in the z=0 plane as _add_sketch gets it, corners 0 to 3 and the normal."""
+    return np.array([[-half_size, half_size, 0.0], [-half_size, -half_size, 0.0],
+                     [half_size, -half_size, 0.0], [half_size, half_size, 0.0], [0.0, 0.0, -1.0]])
+
+
+def through_hole():
+    return ThroughHole(None, {}, param.min_len, param.clearance, param.feat_names, rng=random.Random(0))
+
+
+def test_bound_shrunk_below_every_fastener_notes_no_bounds(catalog):
+    failures.begin_attempt()
+    feat_face, shape, info = through_hole()._add_sketch(square_bound(0.5 * catalog.min_shank_radius()))
+
+    assert feat_face is None and shape is None
+    assert failures.end_attempt(failures.LABEL_MISMATCH)['code'] == failures.NO_BOUNDS
+
+
+def test_fastener_head_fits_in_the_bound(catalog):
+    half_size = 7.0
+    feat_face, shape, info = through_hole()._add_sketch(square_bound(half_size))
+
+    assert feat_face is not None
+    shank_radius, head_radius = info[3], info[4]
+    assert head_radius <= half_size
+    assert shank_radius in catalog.shank_radius
+
+
+def test_hole_not_cut_returns_no_fastener():
+    from OCC.Core.BRepPrimAPI import BRepPrimAPI_MakeBox
+
+    shape = BRepPrimAPI_MakeBox(50.0, 50.0, 50.0).Shape()
+    feat = ThroughHole(shape, {}, param.min_len, param.clearance, param.feat_names, rng=random.Random(0))
+    failures.begin_attempt()
+    result_shape, labels, bounds, info, sn = feat.add_feature([], None, N_Choice=None, find_bounds=False)
+
+    assert result_shape is shape
+    assert info is None and sn is None
+    assert failures.end_attempt(failures.LABEL_MISMATCH)['code'] == failures.NO_BOUNDS
@@ -0,0 +1,103 @@
+import pytest
+
+import Utils.timing as timing
+import timing_summary
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(timing.time, 'perf_counter', clock)
+    # every test writes its own timing file
+    monkeypatch.setattr(timing, '_fp', None)
+    monkeypatch.setattr(timing, '_sample', None)
+    monkeypatch.setattr(timing, '_feature', None)
+
+    return clock
+
+
+def stages_of(record):
+    return {(feature, name): (seconds, calls) for feature, name, seconds, calls in record['stages']}
+
+
+def test_nested_stages_are_exclusive(clock, tmp_path):
+    timing.begin_sample('0')
+    with timing.stage('triangles'):
+        clock.now += 1.0
+        with timing.stage('bvh'):
+            clock.now += 2.0
+            with timing.stage('triangulate'):
+                clock.now += 3.0
+        with timing.stage('bvh'):
+            clock.now += 4.0
+    clock.now += 0.5
+    timing.end_sample(str(tmp_path), 'ok')
+
+    record, = timing.read_records(str(tmp_path))
+    assert record['seconds'] == 10.5
+    assert stages_of(record) == {(None, 'triangles'): (1.0, 1),
+                                 (None, 'bvh'): (6.0, 2),
+                                 (None, 'triangulate'): (3.0, 1)}
+
+
+def test_timed_stages_go_to_the_current_feature(clock, tmp_path):
+    @timing.timed('depth')
+    def depth():
+        clock.now += 2.0
+
+    timing.begin_sample('0')
+    timing.set_feature('blind_hole')
+    with timing.stage('sketch'):
+        clock.now += 1.0
+        depth()
+    timing.set_feature(None)
+    depth()
+    timing.end_sample(str(tmp_path), 'ok')
+
+    record, = timing.read_records(str(tmp_path))
+    assert stages_of(record) == {('blind_hole', 'sketch'): (1.0, 1),
+                                 ('blind_hole', 'depth'): (2.0, 1),
+                                 (None, 'depth'): (2.0, 1)}
+
+
+def test_stages_outside_of_a_sample_are_dropped(clock, tmp_path):
+    with timing.stage('stock'):
+        clock.now += 1.0
+    timing.begin_sample('0')
+    with timing.stage('prism'):
+        clock.now += 1.0
+    timing.end_sample(str(tmp_path), 'ok')
+
+    record, = timing.read_records(str(tmp_path))
+    assert stages_of(record) == {(None, 'prism'): (1.0, 1)}
+
+
+def test_stage_shares_add_up_to_100_percent(clock, tmp_path, capsys):
+    for sample in range(3):
+        timing.begin_sample(str(sample))
+        timing.set_feature('pocket')
+        with timing.stage('triangles'):
+            clock.now += 1.0
+            with timing.stage('bvh'):
+                clock.now += 1.0
+                with timing.stage('triangulate'):
+                    clock.now += 2.0
+        with timing.stage('bounds'):
+            with timing.stage('bvh'):
+                clock.now += 1.0
+        timing.end_sample(str(tmp_path), 'ok')
+
+    timing_summary.print_stage_table('geometry workers', timing.read_records(str(tmp_path)))
+    lines = capsys.readouterr().out.splitlines()
+    shares = [float(line.split()[5].rstrip('%')) for line in lines[2:] if line]
+    assert lines[0] == 'geometry workers: 3 samples, 15.0 s in stages of 15.0 s'
+    assert len(shares) == 4
+    assert sum(shares) == pytest.approx(100.0, abs=0.2)
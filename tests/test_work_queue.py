@@ -0,0 +1,90 @@
+import os
+import time
+
+import pytest
+
+import Utils.work_queue as work_queue
+
+LEASE_SECONDS = 60
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = work_queue.FileWorkQueue(str(tmp_path), LEASE_SECONDS)
+    for i in range(3):
+        queue.put(str(i), {'id': str(i)})
+
+    return queue
+
+
+def later(monkeypatch, seconds):
+    now = time.time() + seconds
+    monkeypatch.setattr(work_queue.time, 'time', lambda: now)
+
+
+def test_tasks_are_leased_one_at_a_time(queue):
+    tasks = queue.tasks()
+    lease, task = next(tasks)
+
+    assert lease.split('@')[0] == task['id']
+    assert queue.counts() == {'pending': 2, 'leased': 1, 'done': 0, 'failed': 0}
+    ids = {task['id']} | {task['id'] for lease, task in tasks}
+    assert ids == {'0', '1', '2'}
+
+
+def test_finished_tasks_keep_their_result(queue):
+    for lease, task in queue.tasks():
+        queue.finish(lease, {'id': task['id'], 'ok': task['id'] != '1'}, failed=task['id'] == '1')
+
+    assert queue.counts() == {'pending': 0, 'leased': 0, 'done': 2, 'failed': 1}
+    assert queue.results()['1'] == {'id': '1', 'ok': False}
+    queue.forget('1')
+    assert set(queue.results()) == {'0', '2'}
+    assert queue.queued_ids() == set()
+
+
+def test_two_hosts_never_lease_the_same_task(queue, tmp_path):
+    other = work_queue.FileWorkQueue(str(tmp_path), LEASE_SECONDS)
+    first = [task['id'] for lease, task in [queue.lease(), other.lease(), queue.lease()]]
+
+    assert sorted(first) == ['0', '1', '2']
+    assert other.lease() is None
+
+
+def test_expired_lease_is_handed_out_again(queue, tmp_path, monkeypatch):
+    lease, task = queue.lease()
+    other = work_queue.FileWorkQueue(str(tmp_path), LEASE_SECONDS)
+    assert other.reclaim() == 0
+
+    later(monkeypatch, LEASE_SECONDS + 1)
+    assert other.reclaim() == 1
+    assert task['id'] in {task['id'] for lease, task in other.tasks()}
+    # the late result of the first host is still kept
+    queue.finish(lease, {'id': task['id']})
+    assert task['id'] in queue.results()
+
+
+def test_renewed_lease_of_a_long_sample_does_not_expire(queue, tmp_path, monkeypatch):
+    # a sample that runs longer than the lease, with the lease renewed on the driver ticks
+    leases = {task['id']: lease for lease, task in [queue.lease()]}
+    task_id, lease = next(iter(leases.items()))
+    taken = int(lease.rsplit('@', 1)[1])
+    renewed = taken + LEASE_SECONDS
+    os.utime(os.path.join(queue.queue_dir, work_queue.LEASED, lease), (renewed, renewed))
+
+    later(monkeypatch, LEASE_SECONDS + 1)
+    other = work_queue.FileWorkQueue(str(tmp_path), LEASE_SECONDS)
+    assert other.reclaim() == 0
+    assert task_id not in {task['id'] for lease, task in other.tasks()}
+
+
+def test_renew_updates_the_lease_time(queue):
+    lease, task = queue.lease()
+    path = os.path.join(queue.queue_dir, work_queue.LEASED, lease)
+    os.utime(path, (0, 0))
+    queue.renew(lease)
+
+    assert os.stat(path).st_mtime >= time.time() - 5
+    queue.finish(lease, task)
+    with pytest.raises(FileNotFoundError):
+        queue.renew(lease)
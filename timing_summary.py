@@ -0,0 +1,95 @@
+"""Summarize the stage timings of a generation run into per-feature cost tables.
+
+    python timing_summary.py <dataset_dir>
+
+Reads <dataset_dir>/timings/*.jsonl written by Utils/timing.py and prints, for
+every (feature type, stage), the number of samples it ran in, the number of
+calls, the total time, its share of the total, and the mean and 95th percentile
+of its time per sample. Stage times are exclusive of the stages nested in them,
+the shares add up to 100%. Geometry samples and writer stage records are reported
+separately.
+"""
+import sys
+
+import Utils.timing as timing
+
+
+def percentile(values, q):
+    values = sorted(values)
+    if len(values) == 0:
+        return 0.0
+    idx = min(len(values) - 1, int(round(q * (len(values) - 1))))
+
+    return values[idx]
+
+
+def stage_table(records):
+    """{(feature, stage): [calls, [seconds of every sample]]}"""
+    table = {}
+    for record in records:
+        for feature, name, seconds, calls in record['stages']:
+            row = table.setdefault((feature or '-', name), [0, []])
+            row[0] += calls
+            row[1].append(seconds)
+
+    return table
+
+
+def print_stage_table(title, records):
+    table = stage_table(records)
+    total = sum(sum(row[1]) for row in table.values())
+    print('{}: {} samples, {:.1f} s in stages of {:.1f} s'.format(
+        title, len(records), total, sum(record['seconds'] for record in records)))
+    print('{:<28} {:<20} {:>8} {:>9} {:>10} {:>7} {:>10} {:>10}'.format(
+        'feature', 'stage', 'samples', 'calls', 'total s', 'share', 'mean s', 'p95 s'))
+    for (feature, name), (calls, seconds) in sorted(table.items(), key=lambda item: -sum(item[1][1])):
+        stage_total = sum(seconds)
+        print('{:<28} {:<20} {:>8} {:>9} {:>10.2f} {:>6.1f}% {:>10.4f} {:>10.4f}'.format(
+            feature, name, len(seconds), calls, stage_total, 100 * stage_total / max(total, 1e-9),
+            stage_total / len(seconds), percentile(seconds, 0.95)))
+    print()
+
+
+def print_feature_costs(records):
+    """Time of the feature stages per sample containing the feature type."""
+    costs = {}
+    for record in records:
+        per_feature = {}
+        for feature, name, seconds, calls in record['stages']:
+            per_feature[feature or '-'] = per_feature.get(feature or '-', 0.0) + seconds
+        for feature, seconds in per_feature.items():
+            costs.setdefault(feature, []).append(seconds)
+
+    print('{:<28} {:>8} {:>10} {:>10} {:>10}'.format('feature', 'samples', 'mean s', 'p50 s', 'p95 s'))
+    for feature, seconds in sorted(costs.items(), key=lambda item: -sum(item[1]) / len(item[1])):
+        print('{:<28} {:>8} {:>10.4f} {:>10.4f} {:>10.4f}'.format(
+            feature, len(seconds), sum(seconds) / len(seconds), percentile(seconds, 0.5), percentile(seconds, 0.95)))
+    print()
+
+
+def print_sample_totals(records):
+    by_status = {}
+    for record in records:
+        by_status.setdefault(record['status'], []).append(record['seconds'])
+
+    print('{:<12} {:>8} {:>10} {:>10} {:>10} {:>10}'.format('status', 'samples', 'total s', 'mean s', 'p95 s', 'max s'))
+    for status, seconds in sorted(by_status.items()):
+        print('{:<12} {:>8} {:>10.1f} {:>10.3f} {:>10.3f} {:>10.3f}'.format(
+            status, len(seconds), sum(seconds), sum(seconds) / len(seconds), percentile(seconds, 0.95), max(seconds)))
+    print()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print(__doc__)
+        sys.exit(1)
+
+    records = timing.read_records(sys.argv[1])
+    geometry = [record for record in records if record['status'] != 'written']
+    writer = [record for record in records if record['status'] == 'written']
+
+    print_sample_totals(records)
+    print_stage_table('geometry workers', geometry)
+    print_feature_costs(geometry)
+    if writer:
+        print_stage_table('writer stage', writer)
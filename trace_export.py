@@ -0,0 +1,47 @@
+"""Merge the trace events of a generation run into one Chrome trace file.
+
+    python trace_export.py <dataset_dir> [trace.json]
+
+Reads <dataset_dir>/timings/*.trace.jsonl, written when the run was started
+with trace_timeline set, see Utils/timing.py, and writes the events of all
+processes to <dataset_dir>/trace.json by default. The file loads in
+chrome://tracing or https://ui.perfetto.dev: every process is a row named after
+its host and pid, samples, features and stages nest inside it, so idle workers
+and long-tail samples show as gaps and long bars.
+"""
+import json
+import os
+import sys
+
+import Utils.timing as timing
+
+
+def merge_events(events_by_process):
+    """Trace events of all processes, each process with a pid of its own even across hosts."""
+    trace_events = []
+    for trace_pid, ((host, pid), events) in enumerate(sorted(events_by_process.items()), start=1):
+        # the process that sampled combos is the driver, the others generated or wrote samples
+        is_driver = any(event['cat'] == 'stage' and event['name'] == 'combo_sampling' for event in events)
+        role = 'driver' if is_driver else 'worker'
+        trace_events.append({'name': 'process_name', 'ph': 'M', 'pid': trace_pid, 'tid': 0,
+                             'args': {'name': '{} {}-{}'.format(role, host, pid)}})
+        trace_events.append({'name': 'process_sort_index', 'ph': 'M', 'pid': trace_pid, 'tid': 0,
+                             'args': {'sort_index': 0 if is_driver else trace_pid}})
+        for event in events:
+            event = dict(event, pid=trace_pid, tid=0)
+            trace_events.append(event)
+
+    return trace_events
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (2, 3):
+        print(__doc__)
+        sys.exit(1)
+
+    dataset_dir = sys.argv[1]
+    trace_path = sys.argv[2] if len(sys.argv) == 3 else os.path.join(dataset_dir, 'trace.json')
+    trace_events = merge_events(timing.read_trace_events(dataset_dir))
+    with open(trace_path, 'w', encoding='utf8') as fp:
+        json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, fp)
+    print('{}: {} events'.format(trace_path, len(trace_events)))